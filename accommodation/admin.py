@@ -1,5 +1,13 @@
 from django.contrib import admin
-from .models import Room, Booking
+from .models import (
+    Booking,
+    LocationDayRollup,
+    OutboxEvent,
+    Room,
+    RoomNight,
+    RoomRate,
+    SupportTicket,
+)
 
 
 @admin.register(Room)
@@ -13,4 +21,51 @@ class RoomAdmin(admin.ModelAdmin):
 class BookingAdmin(admin.ModelAdmin):
     list_display = ("id", "room", "user_email", "check_in", "check_out", "total_price", "status", "created_at")
     list_filter = ("status", "room")
-    search_fields = ("user_email", "room__name")
\ No newline at end of file
+    search_fields = ("user_email", "room__name")
+
+
+@admin.register(RoomNight)
+class RoomNightAdmin(admin.ModelAdmin):
+    list_display = ("night", "room", "booking", "revenue")
+    list_filter = ("room",)
+    date_hierarchy = "night"
+
+
+@admin.register(RoomRate)
+class RoomRateAdmin(admin.ModelAdmin):
+    list_display = ("label", "room", "room_type", "start_date", "end_date", "weekdays", "nightly_rate", "priority")
+    list_filter = ("room_type",)
+    search_fields = ("label", "room__name")
+
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(admin.ModelAdmin):
+    list_display = ("id", "event_type", "status", "attempts", "available_at", "created_at", "dispatched_at")
+    list_filter = ("status", "event_type")
+
+
+@admin.register(SupportTicket)
+class SupportTicketAdmin(admin.ModelAdmin):
+    list_display = ("id", "subject", "email", "room", "created_at", "received_at")
+    search_fields = ("subject", "email", "room")
+    readonly_fields = ("fingerprint", "received_at")
+
+
+@admin.register(LocationDayRollup)
+class LocationDayRollupAdmin(admin.ModelAdmin):
+    """Read-only: the booking views and rebuild_rollups maintain these rows."""
+
+    list_display = ("day", "location", "room_type", "room_nights", "revenue")
+    list_filter = ("room_type", "location")
+    date_hierarchy = "day"
+    # the changelist only counts and pages over the rollup rows
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
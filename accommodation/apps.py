@@ -8,3 +8,8 @@ class AccommodationConfig(AppConfig):
     def ready(self):
         # import signals so post_save hooks are registered
         import accommodation.signals  # noqa
+        from django.core import checks
+
+        from .catalogue import check_shared_cache
+
+        checks.register(check_shared_cache, checks.Tags.caches)
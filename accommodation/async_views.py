@@ -0,0 +1,224 @@
+"""
+Async versions of the views that wait on AWS, for the ASGI deployment.
+
+yugo_site/urls.py routes to these instead of the sync views when
+``settings.ASYNC_VIEWS`` is on, which ``yugo_site/asgi.py`` does. ORM work
+runs through ``sync_to_async`` and AWS calls through
+``aws_clients.run_async``, so the event loop keeps serving other requests
+while SQS, Lambda or S3 answer, and independent I/O inside one request is
+overlapped (``asyncio.gather``, or a task that finishes after the
+response). The sync views stay in views.py for the WSGI deployment.
+"""
+import asyncio
+import json
+from datetime import datetime
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.core.files.uploadedfile import UploadedFile
+from django.db import OperationalError
+from django.shortcuts import get_object_or_404, redirect, render
+from django.urls import reverse
+
+from aws_clients import run_async
+from consumer import Consumer
+from producer import get_buffered_producer
+
+from . import outbox, tickets
+from .availability import ROOM_TAKEN, RoomUnavailable, availability_for, parse_stay
+from .forms import RoomImageForm, SupportTicketForm
+from .image_urls import attach_image_urls
+from .models import Room
+from .rates import quote_stay
+from .views import BOOKING_BUSY, _create_booking, _is_media_admin, _save_room_image
+
+SUPPORT_QUEUE = "yugo-support-queue"
+
+# render runs context processors that touch request.user (a DB lookup)
+arender = sync_to_async(render)
+
+_background_tasks = set()
+
+
+def _in_background(coro):
+    """Run coro after the response is sent; keep a reference until done."""
+    task = asyncio.get_running_loop().create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+def async_user_passes_test(test_func):
+    """user_passes_test for async views (Django 4.2's only wraps sync ones)."""
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if await sync_to_async(lambda: test_func(request.user))():
+                return await view(request, *args, **kwargs)
+            return redirect_to_login(request.get_full_path())
+        return wrapper
+    return decorator
+
+
+async_login_required = async_user_passes_test(lambda user: user.is_authenticated)
+async_staff_required = async_user_passes_test(
+    lambda user: user.is_authenticated and _is_media_admin(user)
+)
+
+
+def _room_for_booking(room_id):
+    room = get_object_or_404(Room, id=room_id)
+    attach_image_urls([room])
+    return room
+
+
+@async_login_required
+async def book_room(request, room_id):
+    room = await sync_to_async(_room_for_booking)(room_id)
+
+    async def error(message, status=200):
+        return await arender(
+            request,
+            "accommodation/book_room.html",
+            {"room": room, "error": message},
+            status=status,
+        )
+
+    if request.method == "POST":
+        email = request.POST.get("email")
+        try:
+            check_in, check_out = parse_stay(
+                request.POST.get("check_in"),
+                request.POST.get("check_out"),
+            )
+        except ValueError as e:
+            return await error(str(e))
+
+        if not room.available:
+            return await error("This room is not taking bookings.")
+
+        free = await sync_to_async(availability_for)([room.id], check_in, check_out)
+        if not free[room.id]:
+            return await error(ROOM_TAKEN, status=409)
+
+        total_price = await sync_to_async(quote_stay)(
+            room,
+            check_in,
+            check_out,
+            tax_rate=0.08,
+            fixed_fee=50.0,
+        )
+
+        try:
+            booking, event = await sync_to_async(_create_booking)(
+                room, email, check_in, check_out, total_price, deliver_now=True
+            )
+        except RoomUnavailable as e:
+            return await error(str(e), status=409)
+        except OperationalError:
+            return await error(BOOKING_BUSY, status=503)
+
+        # The Lambda event goes out while the guest is already being
+        # redirected; if it fails the outbox dispatcher retries it.
+        _in_background(outbox.adeliver(event))
+        return redirect(reverse("booking_success", args=[booking.id]))
+
+    return await arender(request, "accommodation/book_room.html", {"room": room})
+
+
+async def support_ticket(request):
+    if request.method == "POST":
+        form = SupportTicketForm(request.POST)
+        if form.is_valid():
+            data = form.cleaned_data
+            data["created_at"] = datetime.utcnow().isoformat()
+            message = json.dumps(data)
+
+            # hands the message to the buffered producer's sender thread
+            # (or its disk spool), so nothing here waits for SQS
+            get_buffered_producer(
+                SUPPORT_QUEUE,
+                spool_dir=settings.SQS_SPOOL_DIR,
+            ).send_message(message)
+
+            return await arender(
+                request,
+                "accommodation/support_ticket_success.html",
+                {"ticket": data},
+            )
+    else:
+        form = SupportTicketForm()
+
+    return await arender(
+        request,
+        "accommodation/support_ticket_form.html",
+        {"form": form},
+    )
+
+
+@async_staff_required
+async def manager_next_ticket(request):
+    result_message = None
+    stored = []
+
+    if request.method == "POST":
+        async def store(body):
+            stored.append(await sync_to_async(tickets.store_ticket)(body))
+
+        await Consumer().aconsume_message(SUPPORT_QUEUE, handler=store)
+        if stored:
+            result_message = (
+                "Next support ticket has been consumed, saved and removed from the SQS queue."
+            )
+        else:
+            result_message = "No support ticket was waiting in the SQS queue."
+
+    return await arender(
+        request,
+        "accommodation/manager_next_ticket.html",
+        {"result_message": result_message, "ticket": stored[0] if stored else None},
+    )
+
+
+@async_staff_required
+async def manage_room_image(request, room_id):
+    room = await sync_to_async(get_object_or_404)(Room, id=room_id)
+
+    if request.method == "POST":
+        if "delete_image" in request.POST:
+            if room.image:
+                # the S3 delete and the database update are independent
+                image, room.image = room.image, None
+                await asyncio.gather(
+                    run_async(image.delete, save=False),
+                    sync_to_async(_save_room_image)(room),
+                )
+            return redirect("manager_room_list")
+
+        form = RoomImageForm(request.POST, request.FILES, instance=room)
+        if await sync_to_async(form.is_valid)():
+            # the form applies a new file, a cleared one (False) or the
+            # unchanged one; only a new file is uploaded, off the event
+            # loop, before the short DB update
+            room = await sync_to_async(form.save)(commit=False)
+            upload = form.cleaned_data["image"]
+            if isinstance(upload, UploadedFile):
+                await run_async(room.image.save, upload.name, upload, save=False)
+            await sync_to_async(_save_room_image)(room)
+            return redirect("manager_room_list")
+    else:
+        form = RoomImageForm(instance=room)
+
+    return await arender(
+        request,
+        "accommodation/manager_room_image.html",
+        {"room": room, "form": form},
+    )
+
+
+# the sync views are csrf_exempt; Django 4.2's decorator cannot wrap a
+# coroutine function, so set the flag it would set
+for _view in (book_room, support_ticket, manager_next_ticket):
+    _view.csrf_exempt = True
@@ -0,0 +1,156 @@
+"""
+Date-range availability for rooms.
+
+Occupancy is stored per night in ``RoomNight``. A stay from check-in up to
+(but not including) check-out holds one row per night, so "is this room
+free for these dates" is an indexed range lookup instead of parsing every
+booking in Python.
+"""
+from datetime import datetime, timedelta
+
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.db.models import Exists, F, OuterRef
+from django.utils import timezone
+
+from . import rollups
+from .models import Room, RoomNight
+
+DATE_FORMAT = "%Y-%m-%d"
+
+
+ROOM_TAKEN = "Sorry, this room was just taken for some of those dates."
+
+
+class RoomUnavailable(Exception):
+    """Raised when a stay overlaps nights that are already booked."""
+
+
+def parse_stay(check_in, check_out, fmt=DATE_FORMAT):
+    """
+    Turn check-in/check-out values into dates.
+    Raises ValueError for bad dates or a stay of zero nights.
+    """
+    try:
+        if isinstance(check_in, str):
+            check_in = datetime.strptime(check_in, fmt).date()
+        if isinstance(check_out, str):
+            check_out = datetime.strptime(check_out, fmt).date()
+    except (TypeError, ValueError):
+        raise ValueError("Please enter valid check-in and check-out dates.")
+
+    if check_in is None or check_out is None:
+        raise ValueError("Please enter valid check-in and check-out dates.")
+    if check_out <= check_in:
+        raise ValueError("Check-out must be after check-in.")
+    return check_in, check_out
+
+
+def default_stay():
+    """Tonight, used when a page does not ask for specific dates."""
+    today = timezone.localdate()
+    return today, today + timedelta(days=1)
+
+
+def stay_nights(check_in, check_out):
+    return [
+        check_in + timedelta(days=offset)
+        for offset in range((check_out - check_in).days)
+    ]
+
+
+def _occupied(check_in, check_out):
+    return RoomNight.objects.filter(night__gte=check_in, night__lt=check_out)
+
+
+def with_availability(rooms, check_in, check_out):
+    """
+    Annotate a Room queryset with ``is_free`` for the given stay.
+    Runs as a single query with a correlated EXISTS on the night index.
+    """
+    taken = _occupied(check_in, check_out).filter(room=OuterRef("pk"))
+    return rooms.annotate(is_free=~Exists(taken))
+
+
+def available_rooms(check_in, check_out, rooms=None):
+    """Rooms open for booking with every night of the stay free."""
+    if rooms is None:
+        rooms = Room.objects.all()
+    return with_availability(
+        rooms.filter(available=True), check_in, check_out
+    ).filter(is_free=True)
+
+
+def availability_for(room_ids, check_in, check_out):
+    """Map each room id to True when the whole stay is free."""
+    room_ids = list(room_ids)
+    taken = set(
+        _occupied(check_in, check_out)
+        .filter(room_id__in=room_ids)
+        .values_list("room_id", flat=True)
+        .distinct()
+    )
+    return {room_id: room_id not in taken for room_id in room_ids}
+
+
+def claim_room(room_id):
+    """
+    Lock the room for the rest of the current transaction; call it first
+    thing inside ``transaction.atomic()``.
+
+    Concurrent bookings of one room queue up on this lock instead of
+    racing on the night index. With row locks (PostgreSQL, MySQL) NOWAIT
+    makes the losers fail at once with RoomUnavailable rather than block
+    behind the winner, and the lock is held only for the few inserts
+    that follow.
+
+    SQLite has no row locks. There a no-op UPDATE takes the database
+    write lock up front: a transaction that reads first and writes later
+    cannot wait for that lock (SQLite reports a deadlock straight away),
+    so under load most bookings would fail as busy.
+    """
+    if connection.vendor == "sqlite":
+        Room.objects.filter(pk=room_id).update(available=F("available"))
+        return
+    try:
+        list(
+            Room.objects.select_for_update(nowait=True)
+            .filter(pk=room_id)
+            .values_list("pk", flat=True)
+        )
+    except DatabaseError:
+        raise RoomUnavailable(ROOM_TAKEN)
+
+
+def reserve_nights(booking):
+    """
+    Claim every night of ``booking`` for its room and count them in the
+    reporting rollups. Raises RoomUnavailable if any night is already taken.
+    """
+    nights = [
+        RoomNight(room_id=booking.room_id, booking=booking, night=night, revenue=revenue)
+        for night, revenue in rollups.night_revenue(
+            booking.total_price,
+            stay_nights(booking.check_in, booking.check_out),
+        )
+    ]
+    try:
+        with transaction.atomic():
+            RoomNight.objects.bulk_create(nights)
+            rollups.add_nights(booking.room, nights)
+    except IntegrityError:
+        raise RoomUnavailable(ROOM_TAKEN)
+
+
+def release_nights(booking):
+    nights = RoomNight.objects.filter(booking=booking)
+    with transaction.atomic():
+        rollups.remove_nights(booking.room, nights)
+        nights.delete()
+
+
+def move_nights(booking):
+    """Re-reserve nights after ``booking`` changed its dates."""
+    with transaction.atomic():
+        claim_room(booking.room_id)
+        release_nights(booking)
+        reserve_nights(booking)
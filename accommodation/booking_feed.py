@@ -0,0 +1,67 @@
+"""
+Per-user booking feed for ``my_bookings``.
+
+Pages are read newest first with keyset pagination on (created_at, id),
+served by the booking_user_feed_idx index. Page cost stays flat no matter
+how long a user's history is. Only the columns the template shows are
+loaded, with the room joined in the same query.
+"""
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import Booking
+
+PAGE_SIZE = getattr(settings, "BOOKING_FEED_PAGE_SIZE", 20)
+
+FEED_FIELDS = (
+    "id",
+    "check_in",
+    "check_out",
+    "total_price",
+    "status",
+    "created_at",
+    "room__name",
+    "room__location",
+)
+
+
+def encode_cursor(booking):
+    return f"{booking.created_at.isoformat()}_{booking.id}"
+
+
+def decode_cursor(cursor):
+    """Return (created_at, id) or None for a missing/garbled cursor."""
+    if not cursor:
+        return None
+    try:
+        created_at, booking_id = cursor.rsplit("_", 1)
+        return datetime.fromisoformat(created_at), int(booking_id)
+    except ValueError:
+        return None
+
+
+def get_page(user_email, cursor=None, size=PAGE_SIZE):
+    """
+    One page of a user's bookings, newest first.
+    Returns (bookings, next_cursor); next_cursor is None on the last page.
+    """
+    qs = (
+        Booking.objects.filter(user_email=user_email)
+        .select_related("room")
+        .only(*FEED_FIELDS)
+        .order_by("-created_at", "-id")
+    )
+
+    position = decode_cursor(cursor)
+    if position is not None:
+        created_at, booking_id = position
+        qs = qs.filter(
+            Q(created_at__lt=created_at)
+            | Q(created_at=created_at, id__lt=booking_id)
+        )
+
+    bookings = list(qs[:size + 1])
+    next_cursor = encode_cursor(bookings[size - 1]) if len(bookings) > size else None
+    return bookings[:size], next_cursor
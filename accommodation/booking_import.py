@@ -0,0 +1,222 @@
+"""
+Bulk booking import from JSON lines, one booking per line:
+
+    {"room_id": 12, "email": "guest@example.com",
+     "check_in": "2026-01-08", "check_out": "2026-01-11"}
+
+``BookingImporter.import_chunk`` takes a chunk of lines and validates,
+prices and writes them together. Rooms and their rate calendars are read
+once per chunk (and kept for the next one), and each stay is priced from
+its room's calendar in O(1), exactly as book_room quotes it. The chunk's
+bookings, nights and rollups go in with ``bulk_create`` in one
+transaction, retried when a parallel chunk holds the database.
+
+A row is rejected instead of imported when it is malformed, names an
+unknown room or one that is not taking bookings, or overlaps nights that
+are already booked, in the database or earlier in the file. Importing a
+file twice therefore rejects every row the second time.
+
+Imported bookings are "confirmed" and, like bookings changed in the
+admin, send no booking.created events.
+"""
+import json
+import random
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, OperationalError, transaction
+
+from yugo_booking_lib.booking_price import BookingPrice
+
+from . import rollups
+from .availability import parse_stay, stay_nights
+from .models import Booking, Room, RoomNight
+from .rates import get_calendars, price_stay
+
+EMAIL_MAX_LENGTH = Booking._meta.get_field("user_email").max_length
+NIGHTS_TAKEN = "overlaps nights that are already booked"
+# a chunk whose nights another worker keeps taking first, or that keeps
+# finding the database locked, is tried this many times before its
+# remaining rows are rejected
+WRITE_ATTEMPTS = 5
+BUSY_BACKOFF = 0.5  # seconds, doubled per attempt
+
+
+def parse_row(text, max_nights=365):
+    """(room_id, email, check_in, check_out) for one line; ValueError says why not."""
+    try:
+        row = json.loads(text)
+    except ValueError:
+        raise ValueError("not valid JSON")
+    if not isinstance(row, dict):
+        raise ValueError("expected a JSON object")
+
+    room_id = row.get("room_id")
+    if isinstance(room_id, bool) or not isinstance(room_id, (int, str)):
+        raise ValueError("room_id must be a room's id")
+    try:
+        room_id = int(room_id)
+    except ValueError:
+        raise ValueError("room_id must be a room's id")
+
+    email = row.get("email")
+    try:
+        if not isinstance(email, str) or len(email) > EMAIL_MAX_LENGTH:
+            raise ValidationError("invalid")
+        validate_email(email)
+    except ValidationError:
+        raise ValueError("email is not a valid address")
+
+    check_in, check_out = parse_stay(
+        *(row.get(key) if isinstance(row.get(key), str) else None
+          for key in ("check_in", "check_out"))
+    )
+    if (check_out - check_in).days > max_nights:
+        raise ValueError(f"stays are limited to {max_nights} nights")
+    return room_id, email, check_in, check_out
+
+
+class BookingImporter:
+    def __init__(self, tax_rate=0.0, fixed_fee=0.0, max_nights=365):
+        self.tax_rate = tax_rate
+        self.fixed_fee = fixed_fee
+        self.max_nights = max_nights
+        self.pricer = BookingPrice()
+        self.rooms = {}
+        self.calendars = {}
+
+    def load_rooms(self, room_ids):
+        missing = set(room_ids) - self.rooms.keys()
+        if not missing:
+            return
+        rooms = list(
+            Room.objects.filter(pk__in=missing)
+            .only("id", "location", "room_type", "price_per_night", "available")
+        )
+        self.calendars.update(get_calendars(rooms))
+        self.rooms.update((room.pk, room) for room in rooms)
+        # remember unknown ids too, so they are not looked up again
+        self.rooms.update((room_id, None) for room_id in missing - self.rooms.keys())
+
+    def import_chunk(self, lines):
+        """
+        Import [(line_number, text)]. Returns (imported, rejects) with
+        rejects as [(line_number, text, reason)].
+        """
+        rejects = []
+        parsed = []
+        for line_number, text in lines:
+            try:
+                parsed.append((line_number, text, *parse_row(text, self.max_nights)))
+            except ValueError as e:
+                rejects.append((line_number, text, str(e)))
+
+        self.load_rooms(row[2] for row in parsed)
+        stays = []
+        for line_number, text, room_id, email, check_in, check_out in parsed:
+            room = self.rooms[room_id]
+            if room is None:
+                rejects.append((line_number, text, f"there is no room {room_id}"))
+            elif not room.available:
+                rejects.append((line_number, text, "the room is not taking bookings"))
+            else:
+                stays.append((line_number, text, room, email, check_in, check_out))
+
+        priced = [
+            (line_number, text, Booking(
+                room=room,
+                user_email=email,
+                check_in=check_in,
+                check_out=check_out,
+                total_price=total_price,
+                status="confirmed",
+            ))
+            for (line_number, text, room, email, check_in, check_out), total_price
+            in zip(stays, self.price(stays))
+        ]
+
+        reason = None
+        for attempt in range(WRITE_ATTEMPTS):
+            try:
+                accepted, taken = self._split_taken(priced)
+                with transaction.atomic():
+                    self._write([booking for _, _, booking in accepted])
+            except IntegrityError:
+                # a parallel chunk booked some of these nights after the
+                # check; check again against what it committed
+                reason = "nights kept being taken by a parallel import"
+            except OperationalError:
+                # SQLite gave up waiting for a parallel chunk's write lock
+                reason = "the database stayed busy"
+                time.sleep(BUSY_BACKOFF * (2 ** attempt) * random.uniform(0.5, 1.5))
+            else:
+                rejects.extend(
+                    (line_number, text, NIGHTS_TAKEN) for line_number, text, _ in taken
+                )
+                return len(accepted), rejects
+            for _, _, booking in priced:
+                booking.pk = None
+
+        rejects.extend((line_number, text, reason) for line_number, text, _ in priced)
+        return 0, rejects
+
+    def price(self, stays):
+        """
+        Total prices of [(line_number, text, room, email, check_in,
+        check_out)]. Each stay is priced from the room's calendar in exact
+        cents with price_stay, an O(1) prefix-sum lookup, so the totals are
+        the ones book_room quotes, to the cent.
+        """
+        return [
+            price_stay(
+                self.calendars[room.pk],
+                check_in,
+                check_out,
+                tax_rate=self.tax_rate,
+                fixed_fee=self.fixed_fee,
+                pricer=self.pricer,
+            )
+            for _, _, room, _, check_in, check_out in stays
+        ]
+
+    def _split_taken(self, priced):
+        """Split rows into (free, taken), earlier rows winning inside the chunk."""
+        if not priced:
+            return [], []
+        bookings = [booking for _, _, booking in priced]
+        taken = set(
+            RoomNight.objects.filter(
+                room_id__in={booking.room_id for booking in bookings},
+                night__gte=min(booking.check_in for booking in bookings),
+                night__lt=max(booking.check_out for booking in bookings),
+            ).values_list("room_id", "night")
+        )
+        free, clashing = [], []
+        for row in priced:
+            booking = row[2]
+            nights = {
+                (booking.room_id, night)
+                for night in stay_nights(booking.check_in, booking.check_out)
+            }
+            if nights & taken:
+                clashing.append(row)
+            else:
+                taken |= nights
+                free.append(row)
+        return free, clashing
+
+    def _write(self, bookings):
+        # the first statement writes, so on SQLite the transaction takes
+        # the write lock up front (see availability.claim_room)
+        Booking.objects.bulk_create(bookings)
+        nights = [
+            RoomNight(room_id=booking.room_id, booking=booking, night=night, revenue=revenue)
+            for booking in bookings
+            for night, revenue in rollups.night_revenue(
+                booking.total_price,
+                stay_nights(booking.check_in, booking.check_out),
+            )
+        ]
+        RoomNight.objects.bulk_create(nights)
+        rollups.add_many(self.rooms, nights)
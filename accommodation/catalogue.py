@@ -0,0 +1,136 @@
+"""
+Cached room catalogue for the home page.
+
+Rooms change a few times a day, so ``home`` serves compact snapshots of the
+room list from the cache instead of loading every Room on each hit.
+Snapshots are keyed by a catalogue version that the Room post_save /
+post_delete signals bump, which makes every cached page stale at once.
+Pages use keyset pagination on the room id.
+"""
+import time
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+from .models import Room
+
+PAGE_SIZE = getattr(settings, "CATALOGUE_PAGE_SIZE", 24)
+SNAPSHOT_TIMEOUT = getattr(settings, "CATALOGUE_TIMEOUT", 60 * 60 * 24)
+REBUILD_LOCK_TIMEOUT = 30
+REBUILD_WAIT = 2.0
+
+VERSION_KEY = "room-catalogue:version"
+
+FIELDS = (
+    "id", "name", "location", "room_type", "price_per_night", "available",
+    "image", "image_variants",
+)
+ROOM_TYPE_LABELS = dict(Room.ROOM_TYPES)
+
+
+# backends whose entries live inside one process
+PROCESS_LOCAL_CACHES = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+
+def check_shared_cache(app_configs, **kwargs):
+    """
+    System check: the version is bumped by whichever process saved the
+    room (a web worker, or dispatch_outbox after processing an image), so
+    every process must read it from the same cache.
+    """
+    backend = settings.CACHES.get("default", {}).get("BACKEND", "")
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [checks.Warning(
+        f"The default cache ({backend}) is not shared between processes; "
+        "other workers keep serving the old room catalogue after a change.",
+        hint="Use the database, Redis or Memcached cache (YUGO_CACHE_URL).",
+        id="accommodation.W001",
+    )]
+
+
+def current_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # never reuse a number an older snapshot may still be stored under
+        cache.add(VERSION_KEY, time.time_ns(), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def invalidate():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), None)
+
+
+def _build_page(after, size):
+    # from the primary: a lagging replica would store the rooms from before
+    # the change under the new version, for everyone
+    rows = list(
+        Room.objects.using(DEFAULT_DB_ALIAS)
+        .filter(id__gt=after)
+        .order_by("id")
+        .values_list(*FIELDS)[:size + 1]
+    )
+    has_next = len(rows) > size
+    rows = rows[:size]
+    return {
+        "rows": rows,
+        "next_after": rows[-1][0] if has_next else None,
+    }
+
+
+def _snapshot(after, size):
+    version = current_version()
+    key = f"room-catalogue:{version}:{after}:{size}"
+    last_good_key = f"room-catalogue:last:{after}:{size}"
+
+    page = cache.get(key)
+    if page is not None:
+        return page
+
+    # Only one process rebuilds a given page; the rest serve the previous
+    # snapshot (or wait briefly for the new one) instead of piling onto
+    # the database.
+    lock_key = f"{key}:lock"
+    if cache.add(lock_key, 1, REBUILD_LOCK_TIMEOUT):
+        try:
+            page = _build_page(after, size)
+            cache.set_many({key: page, last_good_key: page}, SNAPSHOT_TIMEOUT)
+        finally:
+            cache.delete(lock_key)
+        return page
+
+    page = cache.get(last_good_key)
+    if page is not None:
+        return page
+
+    deadline = time.monotonic() + REBUILD_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        page = cache.get(key)
+        if page is not None:
+            return page
+    return _build_page(after, size)
+
+
+def get_page(after=0, size=PAGE_SIZE):
+    """
+    Rooms with id > after, in id order. Returns (rooms, next_after) where
+    rooms are light read-only objects with the fields the home page uses.
+    """
+    page = _snapshot(after, size)
+    rooms = []
+    for row in page["rows"]:
+        room = SimpleNamespace(**dict(zip(FIELDS, row)))
+        room.room_type_display = ROOM_TYPE_LABELS.get(room.room_type, room.room_type)
+        rooms.append(room)
+    return rooms, page["next_after"]
@@ -1,21 +1,93 @@
 import logging
-import boto3
+import random
+import threading
+import time
+from collections import OrderedDict
+from boto3.dynamodb.conditions import Key
 from botocore.exceptions import ClientError
 from decimal import Decimal
 
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+import aws_metrics
+from aws_clients import get_resource, get_table
+
+logger = logging.getLogger(__name__)
+
+ROOMS_REGION = 'us-east-1'
+ROOMS_TABLE = 'YugoRooms'
+
+BATCH_GET_LIMIT = 100  # BatchGetItem maximum keys per call
+
+# Global secondary indexes, so rooms can be found with a Query instead of
+# a full-table Scan.
+LOCATION_TYPE_INDEX = 'location-room_type-index'
+LISTING_PRICE_INDEX = 'listing_status-price_per_night-index'
+# listing_status has only two values, so each one is a single (hot)
+# partition key of this index. That is acceptable here: index writes only
+# happen when a room is edited, far below the ~1,000 writes/s one key
+# takes (a full dynamodb_backfill is the one burst, and is only slowed
+# down), and the reads are the price-ordered listing queries below, which
+# a sharded key ("listed#0".."listed#N") would turn into a merge over
+# every shard. Shard it if rooms ever change in bulk as part of normal
+# traffic.
+
+ROOMS_KEY_SCHEMA = [
+    {"AttributeName": "room_id", "KeyType": "HASH"},
+]
+ROOMS_ATTRIBUTE_DEFINITIONS = [
+    {"AttributeName": "room_id", "AttributeType": "S"},
+    {"AttributeName": "location", "AttributeType": "S"},
+    {"AttributeName": "room_type", "AttributeType": "S"},
+    {"AttributeName": "listing_status", "AttributeType": "S"},
+    {"AttributeName": "price_per_night", "AttributeType": "N"},
+]
+ROOMS_INDEXES = [
+    {
+        "IndexName": LOCATION_TYPE_INDEX,
+        "KeySchema": [
+            {"AttributeName": "location", "KeyType": "HASH"},
+            {"AttributeName": "room_type", "KeyType": "RANGE"},
+        ],
+        "Projection": {"ProjectionType": "ALL"},
+    },
+    {
+        "IndexName": LISTING_PRICE_INDEX,
+        "KeySchema": [
+            {"AttributeName": "listing_status", "KeyType": "HASH"},
+            {"AttributeName": "price_per_night", "KeyType": "RANGE"},
+        ],
+        "Projection": {"ProjectionType": "ALL"},
+    },
+]
+
 
 class DynamoDBDemo:
     def create_table(self, table_name, key_schema, attribute_definitions,
-                     provisioned_throughput, region):
+                     provisioned_throughput, region,
+                     global_secondary_indexes=None):
+        """provisioned_throughput=None creates an on-demand table."""
         try:
-            dynamodb_resource = boto3.resource("dynamodb", region_name=region)
+            dynamodb_resource = get_resource("dynamodb", region)
             print("\ncreating the table {} ...".format(table_name))
-            self.table = dynamodb_resource.create_table(
-                TableName=table_name,
-                KeySchema=key_schema,
-                AttributeDefinitions=attribute_definitions,
-                ProvisionedThroughput=provisioned_throughput
-            )
+            params = {
+                "TableName": table_name,
+                "KeySchema": key_schema,
+                "AttributeDefinitions": attribute_definitions,
+            }
+            if provisioned_throughput is None:
+                params["BillingMode"] = "PAY_PER_REQUEST"
+            else:
+                params["BillingMode"] = "PROVISIONED"
+                params["ProvisionedThroughput"] = provisioned_throughput
+            if global_secondary_indexes:
+                params["GlobalSecondaryIndexes"] = [
+                    dict(index, ProvisionedThroughput=provisioned_throughput)
+                    if provisioned_throughput is not None else index
+                    for index in global_secondary_indexes
+                ]
+            self.table = dynamodb_resource.create_table(**params)
             self.table.meta.client.get_waiter('table_exists').wait(
                 TableName=table_name
             )
@@ -28,8 +100,7 @@ class DynamoDBDemo:
         try:
             print("\nstoring the item {} in the table {} ..."
                   .format(item, table_name))
-            dynamodb_resource = boto3.resource("dynamodb", region_name=region)
-            table = dynamodb_resource.Table(table_name)
+            table = get_table(table_name, region)
             table.put_item(Item=item)
         except ClientError as e:
             logging.error(e)
@@ -40,8 +111,7 @@ class DynamoDBDemo:
         try:
             print("\nretrieving the item with the key {} from the table {} ..."
                   .format(key, table_name))
-            dynamodb_resource = boto3.resource("dynamodb", region_name=region)
-            table = dynamodb_resource.Table(table_name)
+            table = get_table(table_name, region)
             response = table.get_item(Key=key)
             item = response['Item']
             print(item)
@@ -51,12 +121,7 @@ class DynamoDBDemo:
         return True
 
 
-def save_room_to_dynamodb(room):
-    region = 'us-east-1'
-    table_name = 'YugoRooms'
-
-    d = DynamoDBDemo()
-
+def room_to_item(room):
     item = {
         "room_id": str(room.id),
         "name": room.name,
@@ -66,37 +131,285 @@ def save_room_to_dynamodb(room):
         "description": room.description or "",
         "image_url": room.s3_url or "",
         "available": room.available,
-        "booking_status": "available" if room.available else "booked",
+        # whether the room takes bookings at all; which nights are free is
+        # only known from RoomNight (accommodation.availability)
+        "listing_status": "listed" if room.available else "unlisted",
         "created_at": room.created_at.isoformat() if room.created_at else "",
     }
+    # index keys cannot be empty strings; without them the room is simply
+    # left out of that index
+    for name in ("location", "room_type"):
+        if not item[name]:
+            del item[name]
+    return item
 
-    d.store_an_item(region, table_name, item)
 
+CACHE_REQUESTS = aws_metrics.REGISTRY.counter(
+    "yugo_room_cache_requests_total",
+    "DynamoDB room reads by cache result.",
+    ("result",),
+)
 
-def main():
-    region = 'us-east-1'
-    table_name = 'YugoRooms'
 
-    d = DynamoDBDemo()
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries also expire after ttl seconds.
+
+    Invalidation is per process: other workers see a change once their
+    copy expires, so ttl bounds how stale a read can be. A lookup that
+    started before an invalidation does not store its (possibly older)
+    result; see ``generation``.
+    """
+
+    def __init__(self, maxsize=1024, ttl=30.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            expires, value = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def generation(self):
+        """Pass to set(); the value is dropped if anything was invalidated since."""
+        with self._lock:
+            return self._generation
+
+    def set(self, key, value, generation=None):
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, keys):
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _setting(name, default):
+    # main() below also runs without Django settings
+    try:
+        return getattr(settings, name, default)
+    except ImproperlyConfigured:
+        return default
+
+
+# rooms that do not exist are cached too, as None
+room_cache = TTLCache(
+    maxsize=_setting("DYNAMODB_ROOM_CACHE_SIZE", 1024),
+    ttl=_setting("DYNAMODB_ROOM_CACHE_TTL", 30.0),
+)
+_MISSING = object()
 
-    key_schema = [
-        {
-            "AttributeName": "room_id",
-            "KeyType": "HASH"
-        }
-    ]
 
-    attribute_definitions = [
-        {
-            "AttributeName": "room_id",
-            "AttributeType": "S"
+def get_room(room_id, consistent_read=False):
+    """The YugoRooms item of one room as a dict, or None if there is none."""
+    key = str(room_id)
+    item = room_cache.get(key, _MISSING)
+    if item is not _MISSING:
+        CACHE_REQUESTS.inc(("hit",))
+        return item
+    CACHE_REQUESTS.inc(("miss",))
+
+    generation = room_cache.generation()
+    response = get_table(ROOMS_TABLE, ROOMS_REGION).get_item(
+        Key={"room_id": key},
+        ConsistentRead=consistent_read,
+    )
+    item = response.get("Item")
+    room_cache.set(key, item, generation)
+    return item
+
+
+def batch_get_rooms(room_ids, consistent_read=False, max_attempts=5):
+    """
+    YugoRooms items for many rooms: {room_id: item} for the rooms that
+    exist, keyed by the ids as given. Cache misses are read with
+    BatchGetItem, 100 keys per call, retrying UnprocessedKeys with
+    backoff; keys still unprocessed after max_attempts are logged and
+    left out rather than reported as missing.
+    """
+    keys = {str(room_id): room_id for room_id in room_ids}
+    found = {}
+    misses = []
+    for key in keys:
+        item = room_cache.get(key, _MISSING)
+        if item is _MISSING:
+            misses.append(key)
+        elif item is not None:
+            found[key] = item
+    CACHE_REQUESTS.inc(("hit",), len(keys) - len(misses))
+    if misses:
+        CACHE_REQUESTS.inc(("miss",), len(misses))
+
+    generation = room_cache.generation()
+    resource = get_resource("dynamodb", ROOMS_REGION)
+    for start in range(0, len(misses), BATCH_GET_LIMIT):
+        chunk = misses[start:start + BATCH_GET_LIMIT]
+        request = {
+            ROOMS_TABLE: {
+                "Keys": [{"room_id": key} for key in chunk],
+                "ConsistentRead": consistent_read,
+            }
         }
-    ]
+        for attempt in range(max_attempts):
+            response = resource.batch_get_item(RequestItems=request)
+            for item in response.get("Responses", {}).get(ROOMS_TABLE, []):
+                found[item["room_id"]] = item
+            request = response.get("UnprocessedKeys") or {}
+            if not request:
+                break
+            time.sleep(min(0.05 * (2 ** attempt), 2.0) * random.uniform(0.5, 1.5))
+
+        unprocessed = {k["room_id"] for k in request.get(ROOMS_TABLE, {}).get("Keys", [])}
+        if unprocessed:
+            logger.warning(
+                "batch_get_rooms gave up on %d unprocessed keys", len(unprocessed)
+            )
+        for key in chunk:
+            if key not in unprocessed:
+                room_cache.set(key, found.get(key), generation)
+
+    return {keys[key]: item for key, item in found.items()}
+
+
+def create_rooms_table(table_name=ROOMS_TABLE, region=ROOMS_REGION,
+                       provisioned_throughput=None):
+    """
+    Create the rooms table with its indexes, on-demand unless
+    provisioned_throughput is given. If the table already exists, add the
+    indexes it is missing, one at a time as DynamoDB requires, waiting for
+    each to finish backfilling. Items written before an index existed only
+    appear in it once rewritten (``manage.py dynamodb_backfill``).
+    """
+    client = get_resource("dynamodb", region).meta.client
+    try:
+        description = client.describe_table(TableName=table_name)["Table"]
+    except client.exceptions.ResourceNotFoundException:
+        return DynamoDBDemo().create_table(
+            table_name,
+            ROOMS_KEY_SCHEMA,
+            ROOMS_ATTRIBUTE_DEFINITIONS,
+            provisioned_throughput,
+            region,
+            global_secondary_indexes=ROOMS_INDEXES,
+        )
+
+    existing = {index["IndexName"] for index in description.get("GlobalSecondaryIndexes", [])}
+    on_demand = description.get("BillingModeSummary", {}).get("BillingMode") == "PAY_PER_REQUEST"
+    for index in ROOMS_INDEXES:
+        if index["IndexName"] in existing:
+            continue
+        if not on_demand:
+            index = dict(index, ProvisionedThroughput=provisioned_throughput or {
+                "ReadCapacityUnits": 1,
+                "WriteCapacityUnits": 1,
+            })
+        logger.info("adding index %s to %s", index["IndexName"], table_name)
+        client.update_table(
+            TableName=table_name,
+            AttributeDefinitions=ROOMS_ATTRIBUTE_DEFINITIONS,
+            GlobalSecondaryIndexUpdates=[{"Create": index}],
+        )
+        _wait_for_index(client, table_name, index["IndexName"])
+    return True
+
+
+def _wait_for_index(client, table_name, index_name, delay=5.0, timeout=3600):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        indexes = client.describe_table(TableName=table_name)["Table"].get(
+            "GlobalSecondaryIndexes", []
+        )
+        status = next(
+            (i.get("IndexStatus") for i in indexes if i["IndexName"] == index_name),
+            None,
+        )
+        if status == "ACTIVE":
+            return
+        time.sleep(delay)
+    raise TimeoutError(f"index {index_name} on {table_name} is not active yet")
 
-    provisioned_throughput = {
-        "ReadCapacityUnits": 1,
-        "WriteCapacityUnits": 1
-    }
+
+def _query(index_name, key_condition, page_size=None, descending=False, **kwargs):
+    """
+    Run a Query on the rooms table and yield items one by one, fetching
+    the next page (LastEvaluatedKey) only when the caller gets there.
+    """
+    table = get_table(ROOMS_TABLE, ROOMS_REGION)
+    params = dict(
+        IndexName=index_name,
+        KeyConditionExpression=key_condition,
+        ScanIndexForward=not descending,
+        **kwargs,
+    )
+    if page_size:
+        params["Limit"] = page_size
+    while True:
+        response = table.query(**params)
+        yield from response.get("Items", [])
+        last_key = response.get("LastEvaluatedKey")
+        if not last_key:
+            return
+        params["ExclusiveStartKey"] = last_key
+
+
+def query_rooms_by_location(location, room_type=None, page_size=None):
+    """Rooms in one location, optionally of one type, ordered by type."""
+    condition = Key("location").eq(location)
+    if room_type:
+        condition &= Key("room_type").eq(room_type)
+    return _query(LOCATION_TYPE_INDEX, condition, page_size=page_size)
+
+
+def query_rooms_by_listing_status(listing_status="listed", min_price=None,
+                                  max_price=None, descending=False, page_size=None):
+    """
+    Rooms that are (or are not) taking bookings, ordered by price,
+    optionally in a price range. Says nothing about free nights.
+    """
+    condition = Key("listing_status").eq(listing_status)
+    price = Key("price_per_night")
+    if min_price is not None and max_price is not None:
+        condition &= price.between(Decimal(str(min_price)), Decimal(str(max_price)))
+    elif min_price is not None:
+        condition &= price.gte(Decimal(str(min_price)))
+    elif max_price is not None:
+        condition &= price.lte(Decimal(str(max_price)))
+    return _query(LISTING_PRICE_INDEX, condition, page_size=page_size, descending=descending)
+
+
+def main():
+    region = ROOMS_REGION
+    table_name = ROOMS_TABLE
+
+    d = DynamoDBDemo()
+
+    # on-demand, with the location/type and listing status/price indexes
+    create_rooms_table(table_name, region)
 
     test_item = {
         "room_id": "test-1",
@@ -107,7 +420,7 @@ def main():
         "description": "Test description",
         "image_url": "",
         "available": True,
-        "booking_status": "available",
+        "listing_status": "listed",
         "created_at": "",
     }
 
@@ -118,6 +431,8 @@ def main():
     }
     d.get_an_item(region, table_name, key_info)
 
+    print(list(query_rooms_by_location("Dublin", "classic")))
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,229 @@
+"""
+Write-behind sync of Room rows to the YugoRooms DynamoDB table.
+
+Saving a Room only drops its latest item into an in-process buffer keyed
+by room_id, so repeated saves of one room coalesce into a single write. A
+background thread flushes the buffer with BatchWriteItem (25 items per
+call), retries unprocessed items with backoff and drains what is left at
+interpreter shutdown, for at most DYNAMODB_SYNC_SHUTDOWN_TIMEOUT seconds:
+with DynamoDB unreachable the items still pending are logged and dropped
+(``manage.py dynamodb_backfill`` repairs them) rather than hold up exit.
+
+Once a batch is written its rooms are dropped from the read cache in
+dynamodb_client, so get_room sees the new items.
+"""
+import atexit
+import logging
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
+from django.conf import settings
+
+from aws_clients import get_resource
+
+from .dynamodb_client import ROOMS_REGION, ROOMS_TABLE, room_cache
+
+logger = logging.getLogger(__name__)
+
+BATCH_LIMIT = 25  # BatchWriteItem maximum
+# _write retries itself, so botocore makes a single, short attempt per call
+SYNC_CONFIG = Config(
+    connect_timeout=2,
+    read_timeout=5,
+    retries={"max_attempts": 1, "mode": "standard"},
+)
+
+
+class WriteBehindQueue:
+    def __init__(self, table_name=ROOMS_TABLE, region=ROOMS_REGION,
+                 key_name="room_id", max_pending=5000, flush_interval=1.0,
+                 put_timeout=2.0, max_attempts=5, on_written=None):
+        self.table_name = table_name
+        self.region = region
+        self.key_name = key_name
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.max_attempts = max_attempts
+        # called with the keys of every batch after it was written
+        self.on_written = on_written
+
+        self._pending = OrderedDict()
+        self._attempts = {}
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pid = None
+        self._stopping = False
+
+    def put(self, item):
+        """Queue the latest version of an item; never waits on DynamoDB
+        unless the buffer stays full for put_timeout seconds."""
+        key = item[self.key_name]
+        with self._cond:
+            self._ensure_thread()
+            if key not in self._pending and len(self._pending) >= self.max_pending:
+                self._cond.notify_all()
+                has_room = self._cond.wait_for(
+                    lambda: len(self._pending) < self.max_pending,
+                    timeout=self.put_timeout,
+                )
+            else:
+                has_room = True
+
+            if has_room:
+                self._pending[key] = item
+                self._pending.move_to_end(key)
+                self._attempts.pop(key, None)
+                if len(self._pending) >= BATCH_LIMIT:
+                    self._cond.notify_all()
+                return
+
+        # Back-pressure: write this one inline rather than grow without
+        # bound or drop it.
+        logger.warning("dynamodb sync buffer full, writing %s inline", key)
+        self._write([item])
+
+    def pending(self):
+        with self._cond:
+            return len(self._pending)
+
+    def _ensure_thread(self):
+        # also restarts the flusher in a forked worker, where threads
+        # from the parent do not exist
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._stopping = False
+        self._thread = threading.Thread(
+            target=self._run,
+            name="dynamodb-write-behind",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def _take(self, limit=BATCH_LIMIT):
+        batch = []
+        while self._pending and len(batch) < limit:
+            _, item = self._pending.popitem(last=False)
+            batch.append(item)
+        self._cond.notify_all()
+        return batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._stopping or len(self._pending) >= BATCH_LIMIT,
+                    timeout=self.flush_interval,
+                )
+                if self._stopping:
+                    return
+                batch = self._take()
+            if batch:
+                self._write(batch)
+
+    def _write(self, items, deadline=None):
+        """
+        BatchWriteItem with retries of UnprocessedItems, stopping early at
+        deadline (a time.monotonic() value). Items that still fail go back
+        in the buffer unless a newer version arrived meanwhile.
+        """
+        request = [{"PutRequest": {"Item": item}} for item in items]
+        resource = get_resource("dynamodb", self.region, config=SYNC_CONFIG)
+        for attempt in range(self.max_attempts):
+            if attempt and deadline is not None and time.monotonic() >= deadline:
+                break
+            try:
+                response = resource.batch_write_item(
+                    RequestItems={self.table_name: request}
+                )
+            except (ClientError, BotoCoreError) as e:
+                logger.error("dynamodb batch write failed: %s", e)
+            else:
+                request = response.get("UnprocessedItems", {}).get(self.table_name, [])
+                if not request:
+                    break
+            time.sleep(min(0.05 * (2 ** attempt), 2.0) * random.uniform(0.5, 1.5))
+
+        failed = [r["PutRequest"]["Item"] for r in request]
+        if self.on_written is not None and len(failed) < len(items):
+            # a partly failed batch may still have changed some items
+            self.on_written([item[self.key_name] for item in items])
+        if failed:
+            self._requeue(failed)
+
+    def _requeue(self, items):
+        with self._cond:
+            for item in items:
+                key = item[self.key_name]
+                if key in self._pending:
+                    continue
+                attempts = self._attempts.get(key, 0) + 1
+                if attempts >= self.max_attempts:
+                    logger.error("giving up syncing %s to %s", key, self.table_name)
+                    self._attempts.pop(key, None)
+                    continue
+                self._attempts[key] = attempts
+                self._pending[key] = item
+
+    def flush(self, timeout=None):
+        """
+        Write everything buffered now, in the calling thread. With a
+        timeout, whatever is still pending after that many seconds is
+        logged and dropped; returns the dropped keys.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while deadline is None or time.monotonic() < deadline:
+            with self._cond:
+                batch = self._take()
+            if not batch:
+                return []
+            self._write(batch, deadline)
+
+        with self._cond:
+            dropped = list(self._pending)
+            self._pending.clear()
+            self._attempts.clear()
+            self._cond.notify_all()
+        if dropped:
+            logger.error(
+                "dropping %s items not synced to %s within %.1fs: %s",
+                len(dropped), self.table_name, timeout, dropped,
+            )
+        return dropped
+
+    def stop(self, timeout=10.0):
+        """Stop the flusher and drain the buffer, within timeout seconds."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout=max(deadline - time.monotonic(), 0))
+        return self.flush(timeout=max(deadline - time.monotonic(), 0))
+
+
+_room_queue = None
+_room_queue_lock = threading.Lock()
+
+
+def get_room_queue():
+    global _room_queue
+    if _room_queue is None:
+        with _room_queue_lock:
+            if _room_queue is None:
+                _room_queue = WriteBehindQueue(
+                    max_pending=getattr(settings, "DYNAMODB_SYNC_MAX_PENDING", 5000),
+                    flush_interval=getattr(settings, "DYNAMODB_SYNC_FLUSH_INTERVAL", 1.0),
+                    on_written=room_cache.invalidate,
+                )
+                atexit.register(
+                    _room_queue.stop,
+                    timeout=getattr(settings, "DYNAMODB_SYNC_SHUTDOWN_TIMEOUT", 10.0),
+                )
+    return _room_queue
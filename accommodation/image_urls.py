@@ -0,0 +1,118 @@
+"""
+Presigned S3 URLs for room images.
+
+Signed URLs are cached by object key and handed back until they are close
+to expiry. Besides saving the signing work, this keeps the URL stable
+between page loads so browsers and the CDN can cache the image. With a
+shared cache backend (Redis/Memcached) every worker hands out the same URL.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+
+from aws_clients import get_client
+
+URL_EXPIRES_IN = getattr(settings, "IMAGE_URL_EXPIRES_IN", 3600)
+# stop handing out a URL this many seconds before it expires
+URL_REFRESH_MARGIN = getattr(settings, "IMAGE_URL_REFRESH_MARGIN", 300)
+
+
+def _cache_key(bucket, key):
+    digest = hashlib.md5(f"{bucket}/{key}".encode("utf-8")).hexdigest()
+    return f"s3url:{digest}"
+
+
+def _sign(s3_client, bucket, key):
+    return s3_client.generate_presigned_url(
+        "get_object",
+        Params={"Bucket": bucket, "Key": key},
+        ExpiresIn=URL_EXPIRES_IN,
+    )
+
+
+def sign_keys(keys):
+    """
+    Map object keys to presigned GET URLs in one pass: one cache read for
+    all keys, and one cache write for the ones that had to be signed.
+    """
+    keys = {key for key in keys if key}
+    if not keys:
+        return {}
+
+    bucket = settings.AWS_STORAGE_BUCKET_NAME
+    region = getattr(settings, "AWS_S3_REGION_NAME", "us-east-1")
+
+    cache_keys = {_cache_key(bucket, key): key for key in keys}
+    cached = cache.get_many(cache_keys)
+    urls = {cache_keys[ck]: url for ck, url in cached.items()}
+
+    missing = keys.difference(urls)
+    if missing:
+        s3_client = get_client("s3", region)
+        fresh = {key: _sign(s3_client, bucket, key) for key in missing}
+        cache.set_many(
+            {_cache_key(bucket, key): url for key, url in fresh.items()},
+            timeout=max(URL_EXPIRES_IN - URL_REFRESH_MARGIN, 1),
+        )
+        urls.update(fresh)
+    return urls
+
+
+def signed_url(key):
+    return sign_keys([key]).get(key, "")
+
+
+def _variant_keys(variants):
+    """{format: key} for every variant in a ``Room.image_variants`` value."""
+    for info in (variants or {}).get("variants", {}).values():
+        yield {fmt: key for fmt, key in info.items() if fmt not in ("width", "height")}
+
+
+def srcsets(variants, urls):
+    """
+    Build {format: "url 480w, url 960w"} from a ``Room.image_variants``
+    value and a key -> URL map.
+    """
+    stored = sorted(
+        (variants or {}).get("variants", {}).values(),
+        key=lambda info: info["width"],
+    )
+    result = {}
+    for info in stored:
+        for fmt, key in info.items():
+            if fmt in ("width", "height") or not urls.get(key):
+                continue
+            entries = result.setdefault(fmt, {})
+            # small originals give several variants of the same width
+            entries.setdefault(info["width"], urls[key])
+    return {
+        fmt: ", ".join(f"{url} {width}w" for width, url in entries.items())
+        for fmt, entries in result.items()
+    }
+
+
+def attach_image_urls(rooms):
+    """
+    Set ``room.image_src`` (the original) and ``room.image_srcset`` (a
+    {format: srcset} dict built from the resized variants) on every room
+    in one signing pass, and return the rooms as a list. Rooms without
+    an image get an empty string and an empty dict.
+
+    Works on Room instances and on catalogue rows, where ``image`` is the
+    plain object key.
+    """
+    rooms = list(rooms)
+    keys = []
+    for room in rooms:
+        room_image = getattr(room.image, "name", room.image)
+        keys.append(room_image)
+        for formats in _variant_keys(getattr(room, "image_variants", None)):
+            keys.extend(formats.values())
+
+    urls = sign_keys(keys)
+    for room in rooms:
+        room_image = getattr(room.image, "name", room.image)
+        room.image_src = urls.get(room_image, "") if room_image else ""
+        room.image_srcset = srcsets(getattr(room, "image_variants", None), urls)
+    return rooms
@@ -0,0 +1,161 @@
+"""
+Resized WebP and JPEG variants of room images.
+
+Uploading a room image queues a ``room_image.process`` outbox event. The
+dispatcher renders every variant with Pillow in a process pool, stores the
+files next to the original (``rooms/loft.jpg`` -> ``rooms/loft.card.webp``)
+and records them on ``Room.image_variants``, which the templates turn into
+``srcset`` lists. ``manage.py process_room_images`` reprocesses existing
+images in bulk.
+"""
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Q
+from PIL import Image, ImageOps
+
+from . import catalogue
+from .models import Room
+
+logger = logging.getLogger(__name__)
+
+# name -> target width in pixels; images are never upscaled
+VARIANTS = getattr(settings, "IMAGE_VARIANTS", {
+    "card": 480,
+    "retina": 960,
+    "hero": 1600,
+})
+FORMATS = {
+    "webp": ("WEBP", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+}
+WORKERS = getattr(settings, "IMAGE_WORKERS", os.cpu_count() or 1)
+
+
+def variant_name(name, variant, fmt):
+    stem, _ = os.path.splitext(name)
+    return f"{stem}.{variant}.{'jpg' if fmt == 'jpeg' else fmt}"
+
+
+def render_variants(data, variants=None):
+    """
+    Resize one encoded image into every variant and format.
+    Returns {variant: {"width": w, "height": h, fmt: bytes, ...}}.
+
+    Pure function of its arguments, so it can run in a worker process.
+    """
+    variants = variants or VARIANTS
+    with Image.open(io.BytesIO(data)) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+
+        rendered = {}
+        # largest first, so each step shrinks an already smaller image
+        for variant, width in sorted(variants.items(), key=lambda v: -v[1]):
+            if image.width > width:
+                height = max(round(image.height * width / image.width), 1)
+                image = image.resize((width, height), Image.LANCZOS)
+            out = {"width": image.width, "height": image.height}
+            for fmt, (pil_format, options) in FORMATS.items():
+                buffer = io.BytesIO()
+                image.save(buffer, pil_format, **options)
+                out[fmt] = buffer.getvalue()
+            rendered[variant] = out
+    return rendered
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_pool_pid = None
+
+
+def new_pool(workers=WORKERS):
+    # workers started with spawn/forkserver import this module afresh and
+    # need the app registry
+    return ProcessPoolExecutor(max_workers=workers, initializer=django.setup)
+
+
+def get_pool():
+    """Process pool for the Pillow work, started on first use."""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = new_pool()
+            _pool_pid = os.getpid()
+    return _pool
+
+
+def _write(name, data):
+    # FileSystemStorage would pick a new name instead of overwriting
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    return default_storage.save(name, ContentFile(data))
+
+
+def _delete_files(variants, keep=()):
+    for info in (variants or {}).values():
+        for fmt in FORMATS:
+            name = info.get(fmt)
+            if name and name not in keep:
+                try:
+                    default_storage.delete(name)
+                except Exception as e:
+                    logger.warning("could not delete image variant %s: %s", name, e)
+
+
+def process_room_image(room, pool=None):
+    """
+    Render, store and record the variants of ``room.image``.
+    Returns the new ``image_variants`` value ({} when there is no image).
+    """
+    source = room.image.name if room.image else ""
+    previous = (room.image_variants or {}).get("variants", {})
+
+    if not source:
+        _delete_files(previous)
+        recorded = {}
+    else:
+        with default_storage.open(source, "rb") as fh:
+            data = fh.read()
+        if pool is None:
+            pool = get_pool()
+        rendered = pool.submit(render_variants, data).result()
+
+        stored = {}
+        for variant, out in rendered.items():
+            info = {"width": out["width"], "height": out["height"]}
+            for fmt in FORMATS:
+                info[fmt] = _write(variant_name(source, variant, fmt), out[fmt])
+            stored[variant] = info
+        recorded = {"source": source, "variants": stored}
+
+        kept = {info[fmt] for info in stored.values() for fmt in FORMATS}
+        _delete_files(previous, keep=kept)
+
+    # only if the image was not replaced while we were rendering
+    same_image = Q(image=source) if source else Q(image="") | Q(image__isnull=True)
+    updated = Room.objects.filter(same_image, pk=room.pk).update(
+        image_variants=recorded
+    )
+    if updated:
+        room.image_variants = recorded
+        # usually runs in dispatch_outbox; the version lives in the shared
+        # cache, so the web workers pick up the new srcset right away
+        transaction.on_commit(catalogue.invalidate)
+    return recorded
+
+
+def process_room_event(payload):
+    """Outbox handler for ``room_image.process``."""
+    room = Room.objects.filter(pk=payload["room_id"]).first()
+    if room is not None:
+        process_room_image(room)
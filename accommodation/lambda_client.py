@@ -1,25 +1,30 @@
 import json
-import boto3
 from django.conf import settings
 
+from aws_clients import get_client
+
 AWS_REGION = getattr(settings, "AWS_REGION_NAME", "us-east-1")
 LAMBDA_FUNCTION_NAME = getattr(settings, "BOOKING_LAMBDA_NAME", "yugo-booking")
 
-lambda_client = boto3.client("lambda", region_name=AWS_REGION)
-
 
-def invoke_booking_lambda(booking):
-    payload = {
+def booking_payload(booking):
+    return {
         "booking_id": booking.id,
         "user_email": booking.user_email,
         "room_name": booking.room.name,
-        "check_in": booking.check_in,
-        "check_out": booking.check_out,
+        "check_in": str(booking.check_in),
+        "check_out": str(booking.check_out),
         "total_price": str(booking.total_price),
     }
 
-    lambda_client.invoke(
+
+def send_booking_event(payload):
+    get_client("lambda", AWS_REGION).invoke(
         FunctionName=LAMBDA_FUNCTION_NAME,
         InvocationType="Event",
         Payload=json.dumps(payload).encode("utf-8"),
     )
+
+
+def invoke_booking_lambda(booking):
+    send_booking_event(booking_payload(booking))
@@ -0,0 +1,75 @@
+"""
+Helpers shared by the load-test and benchmark commands.
+
+Not a command itself: Django skips command modules starting with "_".
+"""
+import os
+import tempfile
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers (0 for an empty list)."""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    rank = max(int(round(pct / 100.0 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def latency_summary(seconds):
+    """p50/p95/p99/max of a list of durations, in milliseconds."""
+    return {
+        "p50_ms": round(percentile(seconds, 50) * 1000, 2),
+        "p95_ms": round(percentile(seconds, 95) * 1000, 2),
+        "p99_ms": round(percentile(seconds, 99) * 1000, 2),
+        "max_ms": round(max(seconds, default=0) * 1000, 2),
+    }
+
+
+@contextmanager
+def test_database(verbosity=0):
+    """
+    Run the block against a throw-away copy of the default database,
+    the same one ``manage.py test`` would create.
+
+    SQLite's default test database lives in memory and cannot take
+    concurrent writers from many threads, so it is put in a temporary
+    file instead. Aliases whose TEST MIRROR is the default database (the
+    read replicas) are pointed at it too, as ``manage.py test`` does.
+    """
+    test_settings = connection.settings_dict.setdefault("TEST", {})
+    tmpdir = None
+    if connection.vendor == "sqlite" and not test_settings.get("NAME"):
+        tmpdir = tempfile.mkdtemp(prefix="yugo-bench-")
+        test_settings["NAME"] = os.path.join(tmpdir, "bench.sqlite3")
+
+    setup_test_environment()
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(
+        verbosity=verbosity, autoclobber=True, serialize=False
+    )
+    mirrors = {}
+    for alias in connections:
+        mirror = connections[alias].settings_dict.get("TEST", {}).get("MIRROR")
+        if mirror == DEFAULT_DB_ALIAS:
+            mirrors[alias] = connections[alias].settings_dict["NAME"]
+            connections[alias].close()
+            connections[alias].settings_dict["NAME"] = connection.settings_dict["NAME"]
+    try:
+        yield
+    finally:
+        for alias, name in mirrors.items():
+            connections[alias].close()
+            connections[alias].settings_dict["NAME"] = name
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+        teardown_test_environment()
+        if tmpdir is not None:
+            test_settings.pop("NAME", None)
+            try:
+                os.rmdir(tmpdir)
+            except OSError:
+                pass
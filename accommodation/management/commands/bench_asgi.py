@@ -0,0 +1,380 @@
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+
+from asgiref.sync import ThreadSensitiveContext
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.test import AsyncClient, Client
+from django.urls import reverse
+
+import aws_clients
+from accommodation import outbox
+from accommodation.models import OutboxEvent, Room
+
+from ._bench import latency_summary, test_database
+
+VIEWS = ("support_ticket", "manager_next_ticket", "book_room")
+MODES = ("wsgi", "asgi")
+SUPPORT_QUEUE = "yugo-support-queue"
+
+
+class SimulatedLatency:
+    """before-send hook: every AWS request waits as if it crossed the network."""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def __call__(self, **kwargs):
+        time.sleep(self.seconds)
+
+    def install(self):
+        aws_clients.get_session().events.register_first("before-send", self)
+
+
+class SimulatedLambda:
+    """
+    Stands in for the booking Lambda, which moto can only run in Docker:
+    accepts every event after the same simulated round trip as the other
+    AWS calls.
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def __call__(self, payload):
+        time.sleep(self.seconds)
+
+    def install(self):
+        outbox.HANDLERS["booking.created"] = self
+
+
+def _dispatch_until(stop):
+    """
+    dispatch_outbox's loop in a thread: the WSGI deployment's delivery
+    process. Once stop is set it drains what is left and returns.
+    """
+    try:
+        while True:
+            try:
+                sent, failed = outbox.dispatch_batch()
+            except OperationalError:
+                # SQLite busy with the bookings; try again shortly
+                time.sleep(0.05)
+                continue
+            if not sent and not failed:
+                if stop.is_set():
+                    return
+                stop.wait(0.05)
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the WSGI (sync views, worker threads) and ASGI (async views, "
+        "one event loop) deployments under concurrent load, with moto "
+        "standing in for AWS and a fixed latency added to every AWS call. "
+        "Booking events go to a stand-in Lambda with the same latency; the "
+        "WSGI run delivers them from a dispatcher thread as dispatch_outbox "
+        "would, the ASGI run from the view after commit. "
+        "Each deployment runs in its own process so URL routing matches "
+        "what gunicorn or uvicorn would load."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--views", nargs="+", choices=VIEWS, default=list(VIEWS))
+        parser.add_argument("--requests", type=int, default=200, help="Timed requests per view.")
+        parser.add_argument("--concurrency", type=int, default=50, help="Clients sending at once.")
+        parser.add_argument(
+            "--wsgi-threads",
+            type=int,
+            default=8,
+            help="Requests a WSGI deployment serves at once (workers x threads).",
+        )
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=50.0,
+            help="Simulated round trip added to every AWS call, in ms.",
+        )
+        parser.add_argument("--output", help="Write results as JSON to this file ('-' for stdout).")
+        # internal: run one deployment and print its results as JSON
+        parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options["child"]:
+            results = self.run_child(options["child"], options)
+            self.stdout.write(json.dumps(results))
+            return
+
+        results = []
+        for mode in MODES:
+            results.extend(self.spawn(mode, options))
+
+        by_key = {(r["mode"], r["view"]): r for r in results}
+        for view in options["views"]:
+            wsgi, asgi = by_key[("wsgi", view)], by_key[("asgi", view)]
+            for result in (wsgi, asgi):
+                self.stdout.write(
+                    f"{view:<20} {result['mode']}  {result['requests_per_second']:>8.1f} req/s  "
+                    f"p50 {result['p50_ms']:>8.2f}ms  p95 {result['p95_ms']:>8.2f}ms  "
+                    f"p99 {result['p99_ms']:>8.2f}ms  {result['statuses']}"
+                    + (
+                        f"  events sent {result['events_sent']}, "
+                        f"undelivered {result['events_undelivered']}"
+                        if "events_sent" in result else ""
+                    )
+                )
+            speedup = asgi["requests_per_second"] / (wsgi["requests_per_second"] or 1)
+            self.stdout.write(f"{view:<20} asgi/wsgi throughput x{speedup:.2f}")
+
+        report = {
+            "meta": {
+                "requests": options["requests"],
+                "concurrency": options["concurrency"],
+                "wsgi_threads": options["wsgi_threads"],
+                "aws_latency_ms": options["latency"],
+                "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            },
+            "results": results,
+        }
+        if options["output"] == "-":
+            json.dump(report, sys.stdout, indent=2)
+            sys.stdout.write("\n")
+        elif options["output"]:
+            with open(options["output"], "w") as fh:
+                json.dump(report, fh, indent=2)
+
+    def spawn(self, mode, options):
+        """Run one deployment in a fresh process and return its results."""
+        command = [
+            sys.executable, sys.argv[0], "bench_asgi",
+            "--child", mode,
+            "--requests", str(options["requests"]),
+            "--concurrency", str(options["concurrency"]),
+            "--wsgi-threads", str(options["wsgi_threads"]),
+            "--latency", str(options["latency"]),
+            "--views", *options["views"],
+        ]
+        env = dict(os.environ, YUGO_ASYNC_VIEWS="1" if mode == "asgi" else "0")
+        self.stderr.write(f"running {mode} deployment...")
+        child = subprocess.run(command, env=env, stdout=subprocess.PIPE, text=True)
+        if child.returncode:
+            raise CommandError(f"{mode} benchmark failed (exit code {child.returncode})")
+        return json.loads(child.stdout.strip().splitlines()[-1])
+
+    def run_child(self, mode, options):
+        try:
+            from moto import mock_aws
+        except ImportError:
+            raise CommandError("bench_asgi needs moto for the AWS stand-ins: pip install moto")
+
+        if settings.ASYNC_VIEWS != (mode == "asgi"):
+            raise CommandError(f"the {mode} run needs YUGO_ASYNC_VIEWS={int(mode == 'asgi')}")
+
+        for name in ("AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY", "AWS_SESSION_TOKEN"):
+            os.environ[name] = "testing"
+        os.environ.setdefault("AWS_DEFAULT_REGION", settings.AWS_REGION_NAME)
+
+        results = []
+        with mock_aws(), tempfile.TemporaryDirectory(prefix="yugo-bench-") as spool_dir:
+            settings.SQS_SPOOL_DIR = spool_dir
+            aws_clients.reset()
+            sqs = aws_clients.get_client("sqs", settings.AWS_REGION_NAME)
+            sqs.create_queue(QueueName=SUPPORT_QUEUE)
+            SimulatedLatency(options["latency"] / 1000.0).install()
+            SimulatedLambda(options["latency"] / 1000.0).install()
+
+            with test_database():
+                cookies = self.seed(options)
+                for view in options["views"]:
+                    requests = list(self.requests_for(view, options["requests"]))
+                    if view == "manager_next_ticket":
+                        self.fill_queue(options["requests"])
+                    if mode == "wsgi":
+                        # the async views deliver booking events in-process,
+                        # so the WSGI run delivers them alongside as well
+                        stop = threading.Event()
+                        dispatcher = threading.Thread(target=_dispatch_until, args=(stop,))
+                        dispatcher.start()
+                        try:
+                            seconds, statuses, elapsed = self.run_wsgi(requests, cookies, options)
+                        finally:
+                            stop.set()
+                            dispatcher.join()
+                    else:
+                        seconds, statuses, elapsed = asyncio.run(
+                            self.run_asgi(requests, cookies, options)
+                        )
+                    results.append({
+                        "mode": mode,
+                        "view": view,
+                        "requests": len(seconds),
+                        "requests_per_second": round(len(seconds) / elapsed, 2),
+                        **latency_summary(seconds),
+                        "statuses": dict(sorted(statuses.items())),
+                        **(self.outbox_counts() if view == "book_room" else {}),
+                    })
+
+            if "support_ticket" in options["views"] and mode == "wsgi":
+                from producer import get_buffered_producer
+                get_buffered_producer(SUPPORT_QUEUE).close()
+        return results
+
+    def outbox_counts(self):
+        """Booking events delivered during the run, and those still waiting."""
+        counts = Counter(OutboxEvent.objects.values_list("status", flat=True))
+        failed_attempts = OutboxEvent.objects.filter(attempts__gt=0).count()
+        OutboxEvent.objects.all().delete()
+        return {
+            "events_sent": counts["sent"],
+            "events_undelivered": counts["pending"] + counts["failed"],
+            "events_retried": failed_attempts,
+        }
+
+    def seed(self, options):
+        user = get_user_model().objects.create_user(
+            "bench@example.com", password="bench", is_staff=True
+        )
+        Room.objects.bulk_create(
+            Room(
+                name=f"Room {i}",
+                location=f"Block {i % 10}",
+                room_type="classic",
+                price_per_night=100,
+                description="Benchmark room",
+            )
+            for i in range(options["concurrency"])
+        )
+        client = Client()
+        client.force_login(user)
+        return client.cookies
+
+    def fill_queue(self, count):
+        sqs = aws_clients.get_client("sqs", settings.AWS_REGION_NAME)
+        queue_url = aws_clients.get_queue_url(SUPPORT_QUEUE)
+        for start in range(0, count, 10):
+            sqs.send_message_batch(QueueUrl=queue_url, Entries=[
+                {
+                    "Id": str(i),
+                    "MessageBody": json.dumps({
+                        "name": "Bench",
+                        "email": "bench@example.com",
+                        "room": "Room 1",
+                        "subject": f"Queued {start + i}",
+                        "message": "The heating is off.",
+                    }),
+                }
+                for i in range(min(10, count - start))
+            ])
+
+    def requests_for(self, view, count):
+        """(method, url, data) for count requests; bookings never collide."""
+        room_ids = list(Room.objects.order_by("id").values_list("id", flat=True))
+        first_night = date.today() + timedelta(days=30)
+        for i in range(count):
+            if view == "support_ticket":
+                yield "post", reverse("support_ticket"), {
+                    "name": "Bench",
+                    "email": "bench@example.com",
+                    "room": "Room 1",
+                    "subject": f"Ticket {i}",
+                    "message": "The heating is off.",
+                }
+            elif view == "manager_next_ticket":
+                yield "post", reverse("manager_next_ticket"), {}
+            elif view == "book_room":
+                check_in = first_night + timedelta(days=(i // len(room_ids)) * 7)
+                yield "post", reverse("book_room", args=[room_ids[i % len(room_ids)]]), {
+                    "email": "bench@example.com",
+                    "check_in": check_in.isoformat(),
+                    "check_out": (check_in + timedelta(days=3)).isoformat(),
+                }
+
+    def run_wsgi(self, requests, cookies, options):
+        """
+        concurrency client threads; a semaphore stands in for the
+        deployment's worker threads, so waiting for a free worker counts
+        towards latency as it would behind gunicorn.
+        """
+        workers = threading.BoundedSemaphore(options["wsgi_threads"])
+        pending = iter(requests)
+        lock = threading.Lock()
+        seconds, statuses = [], Counter()
+
+        def client_loop(client):
+            while True:
+                with lock:
+                    request = next(pending, None)
+                if request is None:
+                    return
+                method, url, data = request
+                started = time.perf_counter()
+                with workers:
+                    response = getattr(client, method)(url, data)
+                took = time.perf_counter() - started
+                with lock:
+                    seconds.append(took)
+                    statuses[response.status_code] += 1
+
+        clients = []
+        for _ in range(options["concurrency"]):
+            client = Client()
+            client.cookies = cookies
+            # the first request through a client loads the middleware chain
+            client.get("/")
+            clients.append(client)
+
+        threads = [threading.Thread(target=client_loop, args=(client,)) for client in clients]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return seconds, statuses, time.perf_counter() - started
+
+    async def run_asgi(self, requests, cookies, options):
+        """concurrency client tasks against the ASGI handler on one event loop."""
+        from accommodation import async_views
+
+        pending = iter(requests)
+        seconds, statuses = [], Counter()
+
+        async def send(client, method, url, data):
+            # ASGIHandler gives every request its own thread for sync code;
+            # AsyncClient does not, so do it here
+            async with ThreadSensitiveContext():
+                return await getattr(client, method)(url, data)
+
+        async def client_loop(client):
+            for method, url, data in pending:
+                started = time.perf_counter()
+                response = await send(client, method, url, data)
+                seconds.append(time.perf_counter() - started)
+                statuses[response.status_code] += 1
+
+        clients = []
+        for _ in range(options["concurrency"]):
+            client = AsyncClient()
+            client.cookies = cookies
+            clients.append(client)
+        # the first request through a client loads the middleware chain
+        await asyncio.gather(*(send(client, "get", "/", None) for client in clients))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop(client) for client in clients))
+        elapsed = time.perf_counter() - started
+        # let after-commit deliveries finish before the loop closes
+        await asyncio.gather(*async_views._background_tasks, return_exceptions=True)
+        return seconds, statuses, elapsed
@@ -0,0 +1,247 @@
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from itertools import cycle
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+from django.urls import reverse
+
+from accommodation.models import Booking, Room, RoomNight
+
+from ._bench import latency_summary, test_database
+
+
+def _read_loop(cookies, urls, deadline, results, replica=None):
+    if replica is not None:
+        # this process stands for the app servers in front of one replica
+        settings.DATABASE_REPLICAS = [replica]
+    client = Client()
+    client.cookies = cookies
+    seconds, errors = [], 0
+    for url in cycle(urls):
+        if time.monotonic() >= deadline:
+            break
+        started = time.perf_counter()
+        response = client.get(url)
+        seconds.append(time.perf_counter() - started)
+        if response.status_code != 200:
+            errors += 1
+    connections.close_all()
+    results.put(("read", seconds, errors))
+
+
+def _write_loop(cookies, requests, deadline, results):
+    client = Client()
+    client.cookies = cookies
+    seconds, errors = [], 0
+    for url, data in requests:
+        if time.monotonic() >= deadline:
+            break
+        started = time.perf_counter()
+        response = client.post(url, data)
+        seconds.append(time.perf_counter() - started)
+        if response.status_code != 302:
+            errors += 1
+    connections.close_all()
+    results.put(("write", seconds, errors))
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure read throughput of the read-only views while bookings are "
+        "written, with 0, 1, 2, ... read replicas. Every level runs in its "
+        "own process with YUGO_DB_REPLICAS set; each replica is its own "
+        "SQLite copy of the seeded primary with its own reader processes "
+        "(--readers per database), so capacity is added the way a replica "
+        "and the app servers reading it would add it. Readers and writers "
+        "are forked processes going through the full middleware stack; "
+        "throughput is reported relative to the primary-only run, and can "
+        "only scale as far as there are CPUs for the added processes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--replicas", type=int, nargs="+", default=[0, 1, 2, 4])
+        parser.add_argument("--readers", type=int, default=2, help="Reading processes per database.")
+        parser.add_argument("--writers", type=int, default=2, help="Booking processes.")
+        parser.add_argument("--duration", type=float, default=10.0, help="Seconds per level.")
+        parser.add_argument("--rooms", type=int, default=200)
+        parser.add_argument("--output", help="Write results as JSON to this file ('-' for stdout).")
+        # internal: run one level and print its result as JSON
+        parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options["child"]:
+            self.stdout.write(json.dumps(self.run_level(options)))
+            return
+
+        results = []
+        baseline = None
+        for count in options["replicas"]:
+            result = self.spawn(count, options)
+            if count == 0:
+                baseline = result["reads_per_second"]
+            result["read_ratio"] = (
+                round(result["reads_per_second"] / baseline, 2) if baseline else None
+            )
+            results.append(result)
+            ratio = f"x{result['read_ratio']:.2f}" if result["read_ratio"] is not None else "-"
+            self.stdout.write(
+                f"{count} replicas  reads {result['reads_per_second']:>8.1f}/s {ratio:>6}  "
+                f"p50 {result['read']['p50_ms']:>7.2f}ms  p95 {result['read']['p95_ms']:>7.2f}ms  "
+                f"writes {result['writes_per_second']:>6.1f}/s  "
+                f"errors {result['read_errors'] + result['write_errors']}"
+            )
+
+        report = {
+            "meta": {
+                "readers_per_database": options["readers"],
+                "writers": options["writers"],
+                "duration": options["duration"],
+                "rooms": options["rooms"],
+                "cpus": os.cpu_count(),
+            },
+            "results": results,
+        }
+        if options["output"] == "-":
+            json.dump(report, sys.stdout, indent=2)
+            sys.stdout.write("\n")
+        elif options["output"]:
+            with open(options["output"], "w") as fh:
+                json.dump(report, fh, indent=2)
+
+    def spawn(self, count, options):
+        with tempfile.TemporaryDirectory(prefix="yugo-replicas-") as tmpdir:
+            paths = [os.path.join(tmpdir, f"replica{i}.sqlite3") for i in range(1, count + 1)]
+            command = [
+                sys.executable, sys.argv[0], "bench_replicas", "--child",
+                "--readers", str(options["readers"]),
+                "--writers", str(options["writers"]),
+                "--duration", str(options["duration"]),
+                "--rooms", str(options["rooms"]),
+            ]
+            env = dict(os.environ, YUGO_DB_REPLICAS=",".join(paths))
+            self.stderr.write(f"running with {count} replicas...")
+            child = subprocess.run(command, env=env, stdout=subprocess.PIPE, text=True)
+        if child.returncode:
+            raise CommandError(f"the run with {count} replicas failed (exit code {child.returncode})")
+        return json.loads(child.stdout.strip().splitlines()[-1])
+
+    def run_level(self, options):
+        if connection.vendor != "sqlite":
+            raise CommandError("bench_replicas copies SQLite files; point DATABASES at SQLite")
+
+        with test_database():
+            cookies, urls, bookings = self.seed(options)
+
+            # "replicate": every replica starts as a copy of the seeded primary
+            connections.close_all()
+            for alias in settings.DATABASE_REPLICAS:
+                target = os.environ["YUGO_DB_REPLICAS"].split(",")[
+                    settings.DATABASE_REPLICAS.index(alias)
+                ]
+                shutil.copyfile(connection.settings_dict["NAME"], target)
+                connections[alias].settings_dict["NAME"] = target
+
+            context = multiprocessing.get_context("fork")
+            results = context.Queue()
+            deadline = time.monotonic() + options["duration"]
+            # the primary-only run reads from the primary; otherwise every
+            # replica gets its own readers
+            databases = settings.DATABASE_REPLICAS or [None]
+            workers = [
+                context.Process(
+                    target=_read_loop, args=(cookies, urls, deadline, results, replica)
+                )
+                for replica in databases
+                for _ in range(options["readers"])
+            ] + [
+                context.Process(target=_write_loop, args=(cookies, part, deadline, results))
+                for part in (bookings[i::options["writers"]] for i in range(options["writers"]))
+            ]
+            started = time.monotonic()
+            for worker in workers:
+                worker.start()
+            collected = [results.get() for _ in workers]
+            elapsed = time.monotonic() - started
+            for worker in workers:
+                worker.join()
+
+        reads = [s for kind, seconds, _ in collected if kind == "read" for s in seconds]
+        writes = [s for kind, seconds, _ in collected if kind == "write" for s in seconds]
+        return {
+            "replicas": len(settings.DATABASE_REPLICAS),
+            "readers": options["readers"] * len(databases),
+            "reads_per_second": round(len(reads) / elapsed, 2),
+            "writes_per_second": round(len(writes) / elapsed, 2),
+            "read": latency_summary(reads),
+            "write": latency_summary(writes),
+            "read_errors": sum(e for kind, _, e in collected if kind == "read"),
+            "write_errors": sum(e for kind, _, e in collected if kind == "write"),
+        }
+
+    def seed(self, options):
+        user = get_user_model().objects.create_user(
+            "bench@example.com", password="bench", is_staff=True
+        )
+        rooms = Room.objects.bulk_create(
+            Room(
+                name=f"Room {i}",
+                location=f"Block {i % 10}",
+                room_type="classic",
+                price_per_night=100,
+                description="Benchmark room",
+            )
+            for i in range(options["rooms"])
+        )
+        today = date.today()
+        # a page of existing bookings for my_bookings to read
+        existing = Booking.objects.bulk_create(
+            Booking(
+                room=room,
+                user_email=user.username,
+                check_in=today + timedelta(days=10),
+                check_out=today + timedelta(days=13),
+                total_price=300,
+                status="confirmed",
+            )
+            for room in rooms[:20]
+        )
+        RoomNight.objects.bulk_create(
+            RoomNight(room_id=b.room_id, booking=b, night=b.check_in + timedelta(days=n))
+            for b in existing
+            for n in range(3)
+        )
+
+        client = Client()
+        client.force_login(user)
+        urls = [
+            reverse("my_bookings"),
+            reverse("booking_success", args=[existing[0].id]),
+            reverse("manager_room_list"),
+        ]
+
+        # more booking requests than any run can send; none overlap
+        bookings = []
+        for week in range(200):
+            for room in rooms:
+                check_in = today + timedelta(days=30 + week * 7)
+                bookings.append((
+                    reverse("book_room", args=[room.id]),
+                    {
+                        "email": user.username,
+                        "check_in": check_in.isoformat(),
+                        "check_out": (check_in + timedelta(days=3)).isoformat(),
+                    },
+                ))
+        return client.cookies, urls, bookings
@@ -0,0 +1,286 @@
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+import aws_clients
+from accommodation.models import Booking, Room, RoomNight
+
+from ._bench import latency_summary, test_database
+
+VIEWS = ("home", "book_room", "edit_booking", "my_bookings", "booking_success", "support_ticket")
+SUPPORT_QUEUE = "yugo-support-queue"
+
+
+class AwsCallCounter:
+    """Counts API calls made by every botocore client of the shared session."""
+
+    def __init__(self):
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, **kwargs):
+        with self._lock:
+            self.calls += 1
+
+    def install(self):
+        aws_clients.get_session().events.register("before-call", self)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the main views end to end through the Django test client "
+        "on a throw-away database, with S3, SQS, DynamoDB and Lambda served "
+        "by moto. Reports p50/p95/p99 latency, SQL queries and AWS calls per "
+        "request at each data size, writes them as JSON and fails when a "
+        "view got slower or runs more queries than a saved baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            type=int,
+            nargs="+",
+            default=[100, 1000, 10000],
+            help="Numbers of rooms to seed; bookings scale with them.",
+        )
+        parser.add_argument("--iterations", type=int, default=50, help="Timed requests per view and size.")
+        parser.add_argument("--warmup", type=int, default=5)
+        parser.add_argument("--views", nargs="+", choices=VIEWS, default=list(VIEWS))
+        parser.add_argument("--output", help="Write results as JSON to this file ('-' for stdout).")
+        parser.add_argument("--baseline", help="JSON results of an earlier run to compare against.")
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.25,
+            help="Allowed p95 slowdown against the baseline (0.25 = 25%%).",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            from moto import mock_aws
+        except ImportError:
+            raise CommandError("bench_views needs moto for the AWS stand-ins: pip install moto")
+
+        # moto intercepts every request; make sure nothing can reach AWS
+        for name in ("AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY", "AWS_SESSION_TOKEN"):
+            os.environ[name] = "testing"
+        os.environ.setdefault("AWS_DEFAULT_REGION", settings.AWS_REGION_NAME)
+
+        results = []
+        with mock_aws(), tempfile.TemporaryDirectory(prefix="yugo-bench-") as spool_dir:
+            settings.SQS_SPOOL_DIR = spool_dir
+            aws_clients.reset()
+            counter = AwsCallCounter()
+            counter.install()
+            self.create_aws_fixtures()
+            with test_database():
+                for size in options["sizes"]:
+                    fixtures = self.seed(size)
+                    for view in options["views"]:
+                        result = self.run_view(view, size, fixtures, counter, options)
+                        results.append(result)
+                        self.report(result)
+                    cache.clear()
+
+        report = {
+            "meta": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "database": connection.vendor,
+                "iterations": options["iterations"],
+                "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            },
+            "results": results,
+        }
+        if options["output"] == "-":
+            json.dump(report, sys.stdout, indent=2)
+            sys.stdout.write("\n")
+        elif options["output"]:
+            with open(options["output"], "w") as fh:
+                json.dump(report, fh, indent=2)
+
+        if options["baseline"]:
+            self.compare(results, options["baseline"], options["tolerance"])
+
+    def create_aws_fixtures(self):
+        region = settings.AWS_REGION_NAME
+        aws_clients.get_client("s3", getattr(settings, "AWS_S3_REGION_NAME", region)).create_bucket(
+            Bucket=settings.AWS_STORAGE_BUCKET_NAME
+        )
+        aws_clients.get_client("sqs", region).create_queue(QueueName=SUPPORT_QUEUE)
+
+    def seed(self, size):
+        """size rooms with images, two bookings per room spread over 20 users."""
+        User = get_user_model()
+        users = [
+            User.objects.get_or_create(username=f"bench{i}@example.com")[0]
+            for i in range(20)
+        ]
+        Room.objects.all().delete()
+        rooms = Room.objects.bulk_create(
+            Room(
+                name=f"Room {i}",
+                location=f"Block {i % 10}",
+                room_type=("classic", "premium", "studio")[i % 3],
+                price_per_night=80 + i % 50,
+                description="Benchmark room",
+                image=f"rooms/bench-{i}.jpg",
+            )
+            for i in range(size)
+        )
+
+        today = date.today()
+        bookings = []
+        for i, room in enumerate(rooms):
+            for stay in range(2):
+                check_in = today + timedelta(days=30 + stay * 10 + i % 7)
+                bookings.append(Booking(
+                    room=room,
+                    user_email=users[(i + stay) % len(users)].username,
+                    check_in=check_in,
+                    check_out=check_in + timedelta(days=3),
+                    total_price=300,
+                    status="confirmed",
+                ))
+        bookings = Booking.objects.bulk_create(bookings)
+        RoomNight.objects.bulk_create(
+            RoomNight(room_id=b.room_id, booking=b, night=b.check_in + timedelta(days=n))
+            for b in bookings
+            for n in range((b.check_out - b.check_in).days)
+        )
+
+        client = Client()
+        client.force_login(users[0])
+        return {
+            "client": client,
+            "user": users[0],
+            "rooms": rooms,
+            # a booking on a room nobody else uses, free to move around
+            "editable": bookings[-1],
+            "today": today,
+        }
+
+    def requests_for(self, view, fixtures, count):
+        """Yield (method, url, data) for count requests of one view."""
+        rooms, today = fixtures["rooms"], fixtures["today"]
+        editable = fixtures["editable"]
+        for i in range(count):
+            if view == "home":
+                yield "get", reverse("home"), None
+            elif view == "book_room":
+                # far future, one week per request, so every booking succeeds
+                room = rooms[i % len(rooms)]
+                check_in = today + timedelta(days=400 + (i // len(rooms)) * 7)
+                yield "post", reverse("book_room", args=[room.id]), {
+                    "email": fixtures["user"].username,
+                    "check_in": check_in.isoformat(),
+                    "check_out": (check_in + timedelta(days=3)).isoformat(),
+                }
+            elif view == "edit_booking":
+                check_in = today + timedelta(days=200 + i * 5)
+                yield "post", reverse("edit_booking", args=[editable.id]), {
+                    "check_in": check_in.isoformat(),
+                    "check_out": (check_in + timedelta(days=2)).isoformat(),
+                }
+            elif view == "my_bookings":
+                yield "get", reverse("my_bookings"), None
+            elif view == "booking_success":
+                yield "get", reverse("booking_success", args=[editable.id]), None
+            elif view == "support_ticket":
+                yield "post", reverse("support_ticket"), {
+                    "name": "Bench",
+                    "email": "bench@example.com",
+                    "room": "Room 1",
+                    "subject": f"Ticket {i}",
+                    "message": "The heating is off.",
+                }
+
+    def run_view(self, view, size, fixtures, counter, options):
+        client = fixtures["client"]
+        warmup, iterations = options["warmup"], options["iterations"]
+        requests = list(self.requests_for(view, fixtures, warmup + iterations))
+
+        for method, url, data in requests[:warmup]:
+            getattr(client, method)(url, data)
+
+        seconds, queries, statuses = [], [], set()
+        calls_before = counter.calls
+        for method, url, data in requests[warmup:]:
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = getattr(client, method)(url, data)
+                seconds.append(time.perf_counter() - started)
+            queries.append(len(captured))
+            statuses.add(response.status_code)
+
+        if view == "support_ticket":
+            # count the SQS batches the buffered producer sends afterwards;
+            # close() drains it and the next message starts it again
+            from producer import get_buffered_producer
+            get_buffered_producer(SUPPORT_QUEUE).close()
+        aws_calls = counter.calls - calls_before
+
+        bad = sorted(status for status in statuses if status >= 400)
+        if bad:
+            raise CommandError(f"{view} at size {size} answered {bad}")
+
+        return {
+            "view": view,
+            "size": size,
+            "requests": iterations,
+            **latency_summary(seconds),
+            "mean_ms": round(statistics.fmean(seconds) * 1000, 2),
+            "queries": max(queries),
+            "aws_calls_per_request": round(aws_calls / iterations, 3),
+        }
+
+    def report(self, result):
+        self.stdout.write(
+            f"{result['view']:<16} {result['size']:>6} rooms  "
+            f"p50 {result['p50_ms']:>7.2f}ms  p95 {result['p95_ms']:>7.2f}ms  "
+            f"p99 {result['p99_ms']:>7.2f}ms  queries {result['queries']:>3}  "
+            f"aws {result['aws_calls_per_request']}"
+        )
+
+    def compare(self, results, baseline_path, tolerance):
+        with open(baseline_path) as fh:
+            baseline = {
+                (r["view"], r["size"]): r for r in json.load(fh)["results"]
+            }
+
+        regressions = []
+        for result in results:
+            before = baseline.get((result["view"], result["size"]))
+            if before is None:
+                continue
+            label = f"{result['view']} at {result['size']} rooms"
+            if result["queries"] > before["queries"]:
+                regressions.append(f"{label}: {before['queries']} -> {result['queries']} queries")
+            if result["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+                regressions.append(f"{label}: p95 {before['p95_ms']}ms -> {result['p95_ms']}ms")
+            if result["aws_calls_per_request"] > before["aws_calls_per_request"]:
+                regressions.append(
+                    f"{label}: {before['aws_calls_per_request']} -> "
+                    f"{result['aws_calls_per_request']} AWS calls per request"
+                )
+
+        if regressions:
+            for line in regressions:
+                self.stderr.write(line)
+            raise CommandError(f"{len(regressions)} regressions against {baseline_path}")
+        self.stdout.write(self.style.SUCCESS(f"no regressions against {baseline_path}"))
@@ -0,0 +1,150 @@
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.urls import reverse
+
+from accommodation.models import Booking, Room, RoomNight
+
+from ._bench import latency_summary, test_database
+
+
+class Command(BaseCommand):
+    help = (
+        "Hammer book_room with many concurrent clients on a throw-away test "
+        "database, check that no room ended up double booked and report "
+        "throughput and latency for each concurrency level."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--clients",
+            type=int,
+            nargs="+",
+            default=[50, 200, 1000],
+            help="Concurrency levels to run, one after the other.",
+        )
+        parser.add_argument("--requests", type=int, default=3, help="Booking attempts per client.")
+        parser.add_argument("--rooms", type=int, default=5, help="Rooms competed for at each level.")
+        parser.add_argument("--window", type=int, default=30, help="Days in which stays start.")
+        parser.add_argument("--max-nights", type=int, default=4)
+        parser.add_argument("--seed", type=int, default=None)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        with test_database():
+            user = get_user_model().objects.create_user("loadtest", password="loadtest")
+            login = Client()
+            login.force_login(user)
+            session_cookies = login.cookies
+
+            overlaps = 0
+            for clients in options["clients"]:
+                overlaps += self.run_level(clients, session_cookies, rng, options)
+
+        if overlaps:
+            raise CommandError(f"{overlaps} double bookings found")
+        self.stdout.write(self.style.SUCCESS("no double bookings"))
+
+    def run_level(self, clients, session_cookies, rng, options):
+        rooms = Room.objects.bulk_create(
+            Room(
+                name=f"Load test {clients}-{i}",
+                location="Load test",
+                room_type="classic",
+                price_per_night=100,
+                description="",
+            )
+            for i in range(options["rooms"])
+        )
+        room_ids = [room.id for room in rooms]
+        first_night = date.today() + timedelta(days=1)
+
+        # every attempt is decided up front so the timed part only books
+        plans = []
+        for _ in range(clients):
+            attempts = []
+            for _ in range(options["requests"]):
+                check_in = first_night + timedelta(days=rng.randrange(options["window"]))
+                nights = rng.randint(1, options["max_nights"])
+                attempts.append((
+                    reverse("book_room", args=[rng.choice(room_ids)]),
+                    {
+                        "email": "loadtest@example.com",
+                        "check_in": check_in.isoformat(),
+                        "check_out": (check_in + timedelta(days=nights)).isoformat(),
+                    },
+                ))
+            plans.append(attempts)
+
+        start = threading.Barrier(clients)
+
+        def client(attempts):
+            http = Client()
+            http.cookies = session_cookies
+            results = []
+            start.wait()
+            try:
+                for url, data in attempts:
+                    started = time.perf_counter()
+                    try:
+                        status = http.post(url, data).status_code
+                    except Exception as e:
+                        status = type(e).__name__
+                    results.append((status, time.perf_counter() - started))
+            finally:
+                connections.close_all()
+            return results
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clients) as pool:
+            results = [r for batch in pool.map(client, plans) for r in batch]
+        elapsed = time.perf_counter() - started
+
+        statuses = Counter(status for status, _ in results)
+        summary = latency_summary([seconds for _, seconds in results])
+        overlaps = self.count_overlaps(room_ids)
+        booked = Booking.objects.filter(room_id__in=room_ids).count()
+
+        self.stdout.write(
+            f"{clients:>5} clients: {len(results)} requests in {elapsed:.2f}s "
+            f"({len(results) / elapsed:.0f} req/s), "
+            f"booked {statuses[302]}, taken {statuses[409]}, busy {statuses[503]}, "
+            f"other {len(results) - statuses[302] - statuses[409] - statuses[503]} | "
+            f"p50 {summary['p50_ms']}ms p95 {summary['p95_ms']}ms "
+            f"p99 {summary['p99_ms']}ms max {summary['max_ms']}ms | "
+            f"double bookings {overlaps}"
+        )
+        if booked != statuses[302]:
+            self.stderr.write(f"  {booked} bookings stored for {statuses[302]} successful responses")
+        return overlaps
+
+    def count_overlaps(self, room_ids):
+        """Overlapping stays per room, checked from the bookings themselves."""
+        overlaps = 0
+        bookings = (
+            Booking.objects.filter(room_id__in=room_ids)
+            .order_by("room_id", "check_in")
+            .values_list("room_id", "check_in", "check_out")
+        )
+        last_room, last_check_out = None, None
+        for room_id, check_in, check_out in bookings:
+            if room_id == last_room and check_in < last_check_out:
+                overlaps += 1
+            if room_id != last_room or check_out > last_check_out:
+                last_room, last_check_out = room_id, check_out
+
+        nights = sum(
+            (check_out - check_in).days
+            for _, check_in, check_out in bookings
+        )
+        if nights != RoomNight.objects.filter(room_id__in=room_ids).count():
+            overlaps += 1
+        return overlaps
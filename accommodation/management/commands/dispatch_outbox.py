@@ -0,0 +1,76 @@
+import json
+import signal
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from accommodation import outbox
+
+
+class Command(BaseCommand):
+    help = "Deliver pending outbox events (booking Lambda invocations) in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument("--workers", type=int, default=8)
+        parser.add_argument("--max-attempts", type=int, default=outbox.MAX_ATTEMPTS)
+        parser.add_argument(
+            "--idle-sleep",
+            type=float,
+            default=1.0,
+            help="Seconds to wait when there is nothing to send.",
+        )
+        parser.add_argument(
+            "--stats-every",
+            type=float,
+            default=60.0,
+            help="Log depth and lag every N seconds (0 to disable).",
+        )
+        parser.add_argument(
+            "--purge-after-days",
+            type=int,
+            default=7,
+            help="Delete sent events older than this many days (0 keeps them).",
+        )
+        parser.add_argument("--once", action="store_true", help="Drain once and exit.")
+        parser.add_argument("--stats", action="store_true", help="Print stats as JSON and exit.")
+
+    def handle(self, *args, **options):
+        if options["stats"]:
+            self.stdout.write(json.dumps(outbox.stats()))
+            return
+
+        self._stopping = False
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        last_stats = time.monotonic()
+        while not self._stopping:
+            sent, failed = outbox.dispatch_batch(
+                batch_size=options["batch_size"],
+                workers=options["workers"],
+                max_attempts=options["max_attempts"],
+            )
+            if sent or failed:
+                self.stdout.write(f"sent {sent}, failed {failed}")
+
+            if options["stats_every"] and time.monotonic() - last_stats >= options["stats_every"]:
+                self._housekeeping(options["purge_after_days"])
+                last_stats = time.monotonic()
+
+            if not sent and not failed:
+                if options["once"]:
+                    break
+                time.sleep(options["idle_sleep"])
+
+        self._housekeeping(options["purge_after_days"])
+
+    def _housekeeping(self, purge_after_days):
+        if purge_after_days:
+            outbox.purge_sent(timezone.now() - timedelta(days=purge_after_days))
+        self.stdout.write("outbox " + json.dumps(outbox.stats()))
+
+    def _stop(self, signum, frame):
+        self._stopping = True
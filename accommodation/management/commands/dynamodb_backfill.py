@@ -0,0 +1,140 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.core.management.base import BaseCommand, CommandError
+
+from aws_clients import get_table
+from accommodation.dynamodb_client import ROOMS_REGION, ROOMS_TABLE, room_to_item
+from accommodation.models import Room
+
+
+def _fingerprint(item):
+    return hash(tuple(sorted(item.items())))
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for value in iterable:
+        chunk.append(value)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class Command(BaseCommand):
+    help = (
+        "Push every Room to the YugoRooms DynamoDB table with parallel batch "
+        "writers, then diff the table against the database with a parallel "
+        "segmented Scan. Point AWS_ENDPOINT_URL_DYNAMODB at DynamoDB Local to "
+        "run it without AWS."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--table", default=ROOMS_TABLE)
+        parser.add_argument("--region", default=ROOMS_REGION)
+        parser.add_argument("--chunk-size", type=int, default=500, help="Rooms per DB fetch and per writer task.")
+        parser.add_argument("--writers", type=int, default=8)
+        parser.add_argument("--segments", type=int, default=8, help="Parallel Scan segments for verification.")
+        parser.add_argument("--verify-only", action="store_true")
+        parser.add_argument("--skip-verify", action="store_true")
+        parser.add_argument("--show", type=int, default=10, help="Sample ids to print per drift category.")
+        parser.add_argument("--fail-on-drift", action="store_true")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+
+        if not options["verify_only"]:
+            written, seconds = self.backfill(options)
+            self.stdout.write(
+                f"wrote {written} rooms in {seconds:.1f}s "
+                f"({written / seconds if seconds else 0:.0f} items/s)"
+            )
+
+        if not options["skip_verify"]:
+            drift = self.verify(options)
+            if drift and options["fail_on_drift"]:
+                raise CommandError(f"{drift} rooms differ between the database and DynamoDB")
+
+        self.stdout.write(f"total {time.perf_counter() - started:.1f}s")
+
+    def _rooms(self, chunk_size):
+        return Room.objects.order_by("pk").iterator(chunk_size=chunk_size)
+
+    def backfill(self, options):
+        table_name, region = options["table"], options["region"]
+
+        def write_chunk(items):
+            with get_table(table_name, region).batch_writer(
+                overwrite_by_pkeys=["room_id"]
+            ) as writer:
+                for item in items:
+                    writer.put_item(Item=item)
+            return len(items)
+
+        started = time.perf_counter()
+        written = 0
+        in_flight = set()
+        # bounded number of queued chunks keeps memory flat
+        max_in_flight = options["writers"] * 2
+        with ThreadPoolExecutor(max_workers=options["writers"]) as pool:
+            rooms = self._rooms(options["chunk_size"])
+            for chunk in _chunks(map(room_to_item, rooms), options["chunk_size"]):
+                if len(in_flight) >= max_in_flight:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    written += sum(f.result() for f in done)
+                in_flight.add(pool.submit(write_chunk, chunk))
+            written += sum(f.result() for f in in_flight)
+        return written, time.perf_counter() - started
+
+    def verify(self, options):
+        started = time.perf_counter()
+        expected = {
+            item["room_id"]: _fingerprint(item)
+            for item in map(room_to_item, self._rooms(options["chunk_size"]))
+        }
+        db_seconds = time.perf_counter() - started
+
+        table_name, region = options["table"], options["region"]
+        total_segments = options["segments"]
+
+        def scan_segment(segment):
+            table = get_table(table_name, region)
+            found = {}
+            kwargs = {
+                "Segment": segment,
+                "TotalSegments": total_segments,
+                "ConsistentRead": True,
+            }
+            while True:
+                response = table.scan(**kwargs)
+                for item in response.get("Items", []):
+                    found[item["room_id"]] = _fingerprint(item)
+                if "LastEvaluatedKey" not in response:
+                    return found
+                kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+        scan_started = time.perf_counter()
+        actual = {}
+        with ThreadPoolExecutor(max_workers=total_segments) as pool:
+            for found in pool.map(scan_segment, range(total_segments)):
+                actual.update(found)
+        scan_seconds = time.perf_counter() - scan_started
+
+        missing = sorted(expected.keys() - actual.keys(), key=int)
+        extra = sorted(actual.keys() - expected.keys())
+        changed = sorted(
+            (key for key in expected.keys() & actual.keys() if expected[key] != actual[key]),
+            key=int,
+        )
+
+        self.stdout.write(
+            f"verified {len(expected)} rooms against {len(actual)} items "
+            f"(db {db_seconds:.1f}s, scan {scan_seconds:.1f}s with {total_segments} segments)"
+        )
+        show = options["show"]
+        for label, keys in (("missing", missing), ("extra", extra), ("changed", changed)):
+            sample = ", ".join(keys[:show])
+            self.stdout.write(f"  {label}: {len(keys)}" + (f" e.g. {sample}" if keys else ""))
+        return len(missing) + len(extra) + len(changed)
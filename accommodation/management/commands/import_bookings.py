@@ -0,0 +1,132 @@
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, reset_queries
+
+from accommodation.booking_import import BookingImporter
+
+# one importer per worker process; it keeps rooms and calendars between chunks
+_importer = None
+
+
+def _start_worker(options):
+    global _importer
+    _importer = BookingImporter(**options)
+
+
+def _import_chunk(lines):
+    # with DEBUG on, Django would otherwise keep the SQL of every chunk
+    reset_queries()
+    return _importer.import_chunk(lines)
+
+
+def _chunks(fh, size):
+    """[(line_number, text)] lists of up to size non-blank lines."""
+    chunk = []
+    for line_number, text in enumerate(fh, 1):
+        text = text.strip()
+        if not text:
+            continue
+        chunk.append((line_number, text))
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class Command(BaseCommand):
+    help = (
+        "Import bookings from a JSON lines file, one "
+        '{"room_id", "email", "check_in", "check_out"} object per line. '
+        "The file is streamed in chunks; worker processes validate and price "
+        "each chunk and write it in one transaction. Rows that cannot be "
+        "imported are written, with the reason, to a rejects file. Bookings "
+        "are priced like book_room and send no booking.created events."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument(
+            "--rejects",
+            help="Where to write rejected rows as JSON lines (default: PATH.rejects.jsonl).",
+        )
+        parser.add_argument("--chunk-size", type=int, default=1000, help="Rows per transaction.")
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=min(4, os.cpu_count() or 1),
+            help="Worker processes; 0 imports in this process.",
+        )
+        parser.add_argument("--tax-rate", type=float, default=0.08)
+        parser.add_argument("--fixed-fee", type=float, default=50.0)
+        parser.add_argument("--max-nights", type=int, default=365, help="Reject longer stays.")
+
+    def handle(self, *args, **options):
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be at least 1")
+        importer_options = {
+            "tax_rate": options["tax_rate"],
+            "fixed_fee": options["fixed_fee"],
+            "max_nights": options["max_nights"],
+        }
+        rejects_path = options["rejects"] or f"{options['path']}.rejects.jsonl"
+
+        started = time.perf_counter()
+        self.verbosity = options["verbosity"]
+        self.imported = self.rejected = 0
+        try:
+            source = open(options["path"], encoding="utf-8")
+        except OSError as e:
+            raise CommandError(f"cannot read {options['path']}: {e.strerror}")
+
+        with source, open(rejects_path, "w", encoding="utf-8") as rejects:
+            self.rejects = rejects
+            chunks = _chunks(source, options["chunk_size"])
+            if options["workers"] < 1:
+                _start_worker(importer_options)
+                for chunk in chunks:
+                    self.record(*_import_chunk(chunk))
+            else:
+                self.run_pool(chunks, options["workers"], importer_options)
+
+        seconds = time.perf_counter() - started
+        self.stdout.write(
+            f"imported {self.imported} bookings, rejected {self.rejected} rows "
+            f"in {seconds:.1f}s ({(self.imported + self.rejected) / seconds if seconds else 0:.0f} rows/s)"
+        )
+        if self.rejected:
+            self.stdout.write(f"rejected rows are in {rejects_path}")
+
+    def run_pool(self, chunks, workers, importer_options):
+        # forked workers must open their own database connections
+        connections.close_all()
+        in_flight = set()
+        # bounded number of queued chunks keeps memory flat
+        max_in_flight = workers * 2
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("fork"),
+            initializer=_start_worker,
+            initargs=(importer_options,),
+        ) as pool:
+            for chunk in chunks:
+                if len(in_flight) >= max_in_flight:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self.record(*future.result())
+                in_flight.add(pool.submit(_import_chunk, chunk))
+            for future in in_flight:
+                self.record(*future.result())
+
+    def record(self, imported, rejects):
+        self.imported += imported
+        self.rejected += len(rejects)
+        for line_number, text, reason in rejects:
+            self.rejects.write(json.dumps({"line": line_number, "error": reason, "row": text}) + "\n")
+        if self.verbosity > 1:
+            self.stderr.write(f"{self.imported} imported, {self.rejected} rejected")
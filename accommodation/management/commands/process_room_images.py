@@ -0,0 +1,63 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from accommodation import images
+from accommodation.models import Room
+
+
+class Command(BaseCommand):
+    help = (
+        "Regenerate the resized WebP/JPEG variants of room images. Pillow "
+        "runs in a process pool; storage reads and writes run on threads."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--room", type=int, nargs="+", help="Only these room ids.")
+        parser.add_argument("--missing", action="store_true", help="Only rooms without variants.")
+        parser.add_argument("--workers", type=int, default=images.WORKERS, help="Pillow processes.")
+        parser.add_argument("--threads", type=int, default=8, help="Concurrent storage transfers.")
+
+    def handle(self, *args, **options):
+        rooms = Room.objects.exclude(image="").exclude(image__isnull=True).order_by("pk")
+        if options["room"]:
+            rooms = rooms.filter(pk__in=options["room"])
+        if options["missing"]:
+            rooms = rooms.filter(image_variants={})
+        rooms = list(rooms)
+        if not rooms:
+            self.stdout.write("no room images to process")
+            return
+
+        def process(room):
+            try:
+                return images.process_room_image(room, pool=pool)
+            finally:
+                connections.close_all()
+
+        started = time.perf_counter()
+        done = failed = 0
+        with images.new_pool(options["workers"]) as pool, \
+                ThreadPoolExecutor(max_workers=options["threads"]) as io:
+            futures = {io.submit(process, room): room for room in rooms}
+            for future in as_completed(futures):
+                room = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"room {room.pk} ({room.image.name}): {e}")
+                else:
+                    done += 1
+                    if options["verbosity"] > 1:
+                        self.stdout.write(f"room {room.pk}: {room.image.name}")
+
+        seconds = time.perf_counter() - started
+        self.stdout.write(
+            f"processed {done} images in {seconds:.1f}s "
+            f"({done / seconds if seconds else 0:.1f}/s), {failed} failed"
+        )
+        if failed:
+            raise CommandError(f"{failed} images could not be processed")
@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from accommodation import rollups
+from accommodation.models import Booking
+
+
+class Command(BaseCommand):
+    help = (
+        "Backfill RoomNight.revenue from booking prices and recompute the "
+        "daily location/room-type rollups from the night rows. Run it once "
+        "after migrating, and whenever rooms moved location or type or "
+        "bookings were changed outside the booking views. Bookings made "
+        "while it runs may be miscounted; run it when traffic is low."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all-revenue",
+            action="store_true",
+            help="Recompute the revenue of every night, not only nights without one.",
+        )
+        parser.add_argument("--skip-revenue", action="store_true")
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        chunk_size = options["chunk_size"]
+
+        if not options["skip_revenue"]:
+            bookings = Booking.objects.only("id", "total_price").order_by("id")
+            if not options["all_revenue"]:
+                bookings = bookings.filter(nights__revenue=0).distinct()
+            changed = 0
+            chunk = []
+            for booking in bookings.iterator(chunk_size=chunk_size):
+                chunk.append(booking)
+                if len(chunk) == chunk_size:
+                    with transaction.atomic():
+                        changed += rollups.fill_night_revenue(chunk)
+                    chunk = []
+            with transaction.atomic():
+                changed += rollups.fill_night_revenue(chunk)
+            self.stdout.write(f"set the revenue of {changed} nights")
+
+        count = rollups.rebuild(batch_size=chunk_size)
+        self.stdout.write(
+            f"rebuilt {count} rollup rows in {time.perf_counter() - started:.1f}s"
+        )
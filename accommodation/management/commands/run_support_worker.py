@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+from consumer import ConsumerWorker
+
+
+class Command(BaseCommand):
+    help = (
+        "Long-poll the support queue and process tickets on a thread pool, "
+        "deleting them in batches. Stops cleanly on SIGTERM/SIGINT."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--queue", default="yugo-support-queue")
+        parser.add_argument(
+            "--handler",
+            default="accommodation.tickets.store_ticket",
+            help="Dotted path to a callable taking the message body.",
+        )
+        parser.add_argument("--workers", type=int, default=10)
+        parser.add_argument("--wait-time", type=int, default=20, help="Long-poll seconds (max 20).")
+        parser.add_argument("--visibility-timeout", type=int, default=30)
+
+    def handle(self, *args, **options):
+        worker = ConsumerWorker(
+            options["queue"],
+            handler=import_string(options["handler"]),
+            workers=options["workers"],
+            wait_time=options["wait_time"],
+            visibility_timeout=options["visibility_timeout"],
+        )
+        self.stdout.write(f"consuming {options['queue']} with {options['workers']} workers")
+        worker.run()
+        self.stdout.write(f"processed {worker.processed}, failed {worker.failed}")
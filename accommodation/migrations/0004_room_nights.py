@@ -0,0 +1,93 @@
+# Generated by Django 4.2.26 on 2026-10-18 08:25
+
+from datetime import datetime, timedelta
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def _parse(value):
+    try:
+        return datetime.strptime(str(value).strip(), "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+
+def normalize_stay_dates(apps, schema_editor):
+    # check_in/check_out used to be free text; coerce anything that is not
+    # an ISO date into a one-night stay on the booking's creation date.
+    Booking = apps.get_model('accommodation', 'Booking')
+    for booking in Booking.objects.all().iterator():
+        check_in = _parse(booking.check_in)
+        check_out = _parse(booking.check_out)
+        if check_in and check_out and check_out > check_in:
+            continue
+        if check_in is None:
+            check_in = booking.created_at.date()
+        if check_out is None or check_out <= check_in:
+            check_out = check_in + timedelta(days=1)
+        booking.check_in = check_in.isoformat()
+        booking.check_out = check_out.isoformat()
+        booking.save(update_fields=['check_in', 'check_out'])
+
+
+def backfill_room_nights(apps, schema_editor):
+    Booking = apps.get_model('accommodation', 'Booking')
+    RoomNight = apps.get_model('accommodation', 'RoomNight')
+    Room = apps.get_model('accommodation', 'Room')
+
+    bookings = Booking.objects.exclude(status='cancelled').order_by('id')
+    for booking in bookings.iterator():
+        nights = [
+            RoomNight(
+                room_id=booking.room_id,
+                booking_id=booking.id,
+                night=booking.check_in + timedelta(days=offset),
+            )
+            for offset in range((booking.check_out - booking.check_in).days)
+        ]
+        # Older overlapping bookings win; later ones keep their record but
+        # do not claim nights that are already taken.
+        RoomNight.objects.bulk_create(nights, ignore_conflicts=True)
+
+    # Room.available was only ever flipped by the booking flow. Occupancy
+    # now lives in RoomNight, so the flag goes back to meaning "listed".
+    Room.objects.update(available=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accommodation', '0003_room_s3_url_alter_booking_check_in_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_stay_dates, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='booking',
+            name='check_in',
+            field=models.DateField(),
+        ),
+        migrations.AlterField(
+            model_name='booking',
+            name='check_out',
+            field=models.DateField(),
+        ),
+        migrations.CreateModel(
+            name='RoomNight',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('night', models.DateField()),
+                ('booking', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='nights', to='accommodation.booking')),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='nights', to='accommodation.room')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['night', 'room'], name='roomnight_night_room_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='roomnight',
+            constraint=models.UniqueConstraint(fields=('room', 'night'), name='unique_room_night'),
+        ),
+        migrations.RunPython(backfill_room_nights, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.26 on 2026-10-18 08:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accommodation', '0004_room_nights'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoomRateCalendar',
+            fields=[
+                ('room', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rate_calendar', serialize=False, to='accommodation.room')),
+                ('start_date', models.DateField()),
+                ('default_cents', models.BigIntegerField()),
+                ('rates', models.BinaryField()),
+                ('prefix', models.BinaryField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RoomRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('room_type', models.CharField(blank=True, choices=[('classic', 'Classic Room'), ('premium', 'Premium Room'), ('studio', 'Studio Apartment')], max_length=50)),
+                ('label', models.CharField(blank=True, max_length=80)),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField(help_text='Last night the rate applies to.')),
+                ('weekdays', models.CharField(blank=True, help_text="Weekday numbers (Mon=0) the rate applies to, e.g. '45' for Fri/Sat nights. Leave blank for every night.", max_length=7)),
+                ('nightly_rate', models.DecimalField(decimal_places=2, max_digits=8)),
+                ('priority', models.IntegerField(default=0)),
+                ('room', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='rates', to='accommodation.room')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['room', 'start_date'], name='accommodati_room_id_7ccca7_idx'), models.Index(fields=['room_type', 'start_date'], name='accommodati_room_ty_b43977_idx')],
+            },
+        ),
+    ]
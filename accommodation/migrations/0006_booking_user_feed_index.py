@@ -0,0 +1,17 @@
+# Generated by Django 4.2.26 on 2026-10-18 08:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accommodation', '0005_room_rates'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['user_email', '-created_at', '-id'], name='booking_user_feed_idx'),
+        ),
+    ]
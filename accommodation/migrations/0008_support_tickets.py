@@ -0,0 +1,67 @@
+# Generated by Django 4.2.26 on 2026-10-18 08:35
+
+from django.db import migrations, models
+
+FTS_TABLE = 'accommodation_supportticket_fts'
+
+FTS_SQL = [
+    f"""CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        name, email, room, subject, message,
+        content='accommodation_supportticket', content_rowid='id'
+    )""",
+    f"""CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON accommodation_supportticket BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, email, room, subject, message)
+        VALUES (new.id, new.name, new.email, new.room, new.subject, new.message);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON accommodation_supportticket BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, email, room, subject, message)
+        VALUES ('delete', old.id, old.name, old.email, old.room, old.subject, old.message);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE ON accommodation_supportticket BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, email, room, subject, message)
+        VALUES ('delete', old.id, old.name, old.email, old.room, old.subject, old.message);
+        INSERT INTO {FTS_TABLE}(rowid, name, email, room, subject, message)
+        VALUES (new.id, new.name, new.email, new.room, new.subject, new.message);
+    END""",
+]
+
+
+def create_fts_index(apps, schema_editor):
+    # FTS5 is SQLite-only; other backends fall back to LIKE searches
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in FTS_SQL:
+        schema_editor.execute(statement)
+
+
+def drop_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for suffix in ('ai', 'ad', 'au'):
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}")
+    schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accommodation', '0007_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SupportTicket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(max_length=64, unique=True)),
+                ('name', models.CharField(max_length=100)),
+                ('email', models.EmailField(db_index=True, max_length=254)),
+                ('room', models.CharField(blank=True, max_length=50)),
+                ('subject', models.CharField(max_length=150)),
+                ('message', models.TextField()),
+                ('created_at', models.DateTimeField()),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.RunPython(create_fts_index, drop_fts_index),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.26 on 2026-10-18 09:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accommodation', '0009_room_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='roomnight',
+            name='revenue',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.CreateModel(
+            name='LocationDayRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('location', models.CharField(max_length=120)),
+                ('room_type', models.CharField(choices=[('classic', 'Classic Room'), ('premium', 'Premium Room'), ('studio', 'Studio Apartment')], max_length=50)),
+                ('day', models.DateField()),
+                ('room_nights', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day', 'location'], name='rollup_day_location_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='locationdayrollup',
+            constraint=models.UniqueConstraint(fields=('location', 'room_type', 'day'), name='unique_location_day_rollup'),
+        ),
+    ]
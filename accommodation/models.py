@@ -1,6 +1,8 @@
+from django.core.exceptions import ValidationError
 from django.db import models
-from django.conf import settings
-import boto3
+from django.utils import timezone
+
+from .image_urls import signed_url
 
 
 class Room(models.Model):
@@ -16,6 +18,8 @@ class Room(models.Model):
     price_per_night = models.DecimalField(max_digits=8, decimal_places=2)
     description = models.TextField(blank=True, null=True)
     image = models.ImageField(upload_to="rooms/", blank=True, null=True)
+    # resized copies of ``image``, written by accommodation.images
+    image_variants = models.JSONField(default=dict, blank=True)
     s3_url = models.URLField(max_length=500, blank=True, null=True)
     available = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -23,24 +27,20 @@ class Room(models.Model):
     def __str__(self):
         return f"{self.name} ({self.get_room_type_display()})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        room = super().from_db(db, field_names, values)
+        # the stored type, so a save can tell it changed without a query
+        # (see accommodation.signals.rebuild_calendar_on_type_change)
+        room._loaded_room_type = room.__dict__.get("room_type")
+        return room
+
     @property
     def signed_image_url(self):
         if not self.image:
             return ""
 
-        bucket_name = settings.AWS_STORAGE_BUCKET_NAME
-        region_name = getattr(settings, "AWS_S3_REGION_NAME", "us-east-1")
-
-        s3_client = boto3.client("s3", region_name=region_name)
-
-        return s3_client.generate_presigned_url(
-            "get_object",
-            Params={
-                "Bucket": bucket_name,
-                "Key": self.image.name,
-            },
-            ExpiresIn=3600,
-        )
+        return signed_url(self.image.name)
 
 
 class Booking(models.Model):
@@ -56,8 +56,8 @@ class Booking(models.Model):
         related_name="bookings",
     )
     user_email = models.EmailField()
-    check_in = models.CharField(max_length=50)
-    check_out = models.CharField(max_length=50)
+    check_in = models.DateField()
+    check_out = models.DateField()
     total_price = models.DecimalField(max_digits=10, decimal_places=2)
     status = models.CharField(
         max_length=20,
@@ -66,5 +66,194 @@ class Booking(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["user_email", "-created_at", "-id"],
+                name="booking_user_feed_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"Booking #{self.id} for {self.room.name} ({self.user_email})"
+
+
+class RoomNight(models.Model):
+    """
+    One row per occupied room night. The (room, night) unique constraint
+    is what rejects overlapping stays, and the (night, room) index lets a
+    date-range availability check for many rooms run as one index scan.
+    """
+
+    room = models.ForeignKey(
+        Room,
+        on_delete=models.CASCADE,
+        related_name="nights",
+    )
+    booking = models.ForeignKey(
+        Booking,
+        on_delete=models.CASCADE,
+        related_name="nights",
+    )
+    night = models.DateField()
+    # this night's share of the booking's total_price, so the rows double
+    # as the per-room daily revenue rollup (see accommodation.rollups)
+    revenue = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["room", "night"],
+                name="unique_room_night",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["night", "room"], name="roomnight_night_room_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.room_id} @ {self.night} (booking #{self.booking_id})"
+
+
+class LocationDayRollup(models.Model):
+    """
+    Booked room nights and revenue per location, room type and day, kept
+    up to date by accommodation.rollups in the booking transactions.
+    Reports read these rows instead of bookings.
+    """
+
+    location = models.CharField(max_length=120)
+    room_type = models.CharField(max_length=50, choices=Room.ROOM_TYPES)
+    day = models.DateField()
+    # not Positive: a drifted row going below zero must not block a
+    # cancellation; rebuild_rollups puts it right
+    room_nights = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["location", "room_type", "day"],
+                name="unique_location_day_rollup",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["day", "location"], name="rollup_day_location_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.location} / {self.room_type} @ {self.day}"
+
+
+class RoomRate(models.Model):
+    """
+    A nightly-rate rule, e.g. summer, term-time or weekend pricing.
+    Applies to one room, or to every room of a room type. Room rules win
+    over room-type rules; within each, higher priority wins.
+    """
+
+    room = models.ForeignKey(
+        Room,
+        on_delete=models.CASCADE,
+        related_name="rates",
+        blank=True,
+        null=True,
+    )
+    room_type = models.CharField(max_length=50, choices=Room.ROOM_TYPES, blank=True)
+    label = models.CharField(max_length=80, blank=True)
+    start_date = models.DateField()
+    end_date = models.DateField(help_text="Last night the rate applies to.")
+    weekdays = models.CharField(
+        max_length=7,
+        blank=True,
+        help_text="Weekday numbers (Mon=0) the rate applies to, e.g. '45' for "
+                  "Fri/Sat nights. Leave blank for every night.",
+    )
+    nightly_rate = models.DecimalField(max_digits=8, decimal_places=2)
+    priority = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["room", "start_date"]),
+            models.Index(fields=["room_type", "start_date"]),
+        ]
+
+    def clean(self):
+        super().clean()
+        if self.start_date and self.end_date and self.end_date < self.start_date:
+            raise ValidationError({"end_date": "The last night cannot be before the first."})
+
+    def __str__(self):
+        target = self.room or self.get_room_type_display() or "all rooms"
+        return f"{self.label or 'Rate'} for {target}: €{self.nightly_rate}"
+
+
+class RoomRateCalendar(models.Model):
+    """
+    Precomputed per-night rates and prefix sums for one room, stored as
+    packed int64 cents (see yugo_booking_lib.rate_calendar).
+    """
+
+    room = models.OneToOneField(
+        Room,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="rate_calendar",
+    )
+    start_date = models.DateField()
+    default_cents = models.BigIntegerField()
+    rates = models.BinaryField()
+    prefix = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Rate calendar for room {self.room_id} from {self.start_date}"
+
+
+class OutboxEvent(models.Model):
+    """
+    An event written in the same transaction as the change it describes
+    and delivered later by ``manage.py dispatch_outbox``.
+    """
+
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("sent", "Sent"),
+        ("failed", "Failed"),
+    ]
+
+    event_type = models.CharField(max_length=50)
+    payload = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="pending")
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    available_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    dispatched_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "available_at"], name="outbox_pending_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} #{self.id} ({self.status})"
+
+
+class SupportTicket(models.Model):
+    """
+    Local copy of a support ticket taken off the SQS queue. On SQLite the
+    text columns are also indexed in an FTS5 table (see tickets.py).
+    """
+
+    fingerprint = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=100)
+    email = models.EmailField(db_index=True)
+    room = models.CharField(max_length=50, blank=True)
+    subject = models.CharField(max_length=150)
+    message = models.TextField()
+    created_at = models.DateTimeField()
+    received_at = models.DateTimeField(auto_now_add=True)
+
     def __str__(self):
-        return f"Booking #{self.id} for {self.room.name} ({self.user_email})",
+        return f"Ticket #{self.id}: {self.subject} ({self.email})"
@@ -0,0 +1,188 @@
+"""
+Transactional outbox.
+
+Views call ``enqueue`` inside the transaction that writes the booking, so
+the event is stored if and only if the booking is. The dispatcher
+(``manage.py dispatch_outbox``) claims due events in batches, delivers them
+on a thread pool and retries failures with exponential backoff.
+
+Async views may deliver an event themselves right after commit
+(``enqueue(..., deliver_now=True)`` then ``adeliver``); the event stays
+leased from the dispatcher meanwhile and falls back to it on failure.
+"""
+import logging
+import random
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from aws_clients import run_async
+
+from .images import process_room_event
+from .lambda_client import send_booking_event
+from .models import OutboxEvent
+from .rates import refresh_rule_event
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = getattr(settings, "OUTBOX_MAX_ATTEMPTS", 8)
+BACKOFF_BASE = getattr(settings, "OUTBOX_BACKOFF_BASE", 2.0)
+BACKOFF_MAX = getattr(settings, "OUTBOX_BACKOFF_MAX", 300.0)
+# how long a claimed event is hidden from other dispatchers
+LEASE_SECONDS = getattr(settings, "OUTBOX_LEASE_SECONDS", 60)
+
+HANDLERS = {}
+
+
+def handles(event_type):
+    """Register the function that delivers one event type."""
+    def register(func):
+        HANDLERS[event_type] = func
+        return func
+    return register
+
+
+def enqueue(event_type, payload, deliver_now=False):
+    """
+    Store an event. Call inside the caller's transaction.
+
+    deliver_now=True means the caller sends it itself once committed
+    (see adeliver): the event starts out leased, so dispatchers only pick
+    it up if that attempt fails or never happens.
+    """
+    available_at = timezone.now()
+    if deliver_now:
+        available_at += timedelta(seconds=LEASE_SECONDS)
+    return OutboxEvent.objects.create(
+        event_type=event_type,
+        payload=payload,
+        available_at=available_at,
+    )
+
+
+def backoff_seconds(attempts):
+    delay = min(BACKOFF_BASE * (2 ** (attempts - 1)), BACKOFF_MAX)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def claim_batch(batch_size):
+    """
+    Take up to batch_size due events and lease them, so concurrent
+    dispatchers never deliver the same event at the same time.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        events = list(
+            OutboxEvent.objects.select_for_update(skip_locked=True)
+            .filter(status="pending", available_at__lte=now)
+            .order_by("available_at", "id")[:batch_size]
+        )
+        if events:
+            OutboxEvent.objects.filter(id__in=[e.id for e in events]).update(
+                available_at=now + timedelta(seconds=LEASE_SECONDS)
+            )
+    return events
+
+
+def _deliver(event):
+    try:
+        HANDLERS[event.event_type](event.payload)
+    except Exception as e:
+        return e
+    return None
+
+
+def _deliver_in_thread(event):
+    # Handlers use the ORM (room_image.process, rate_rule.refresh), and the
+    # connections Django opens in a pool thread outlive the pool otherwise.
+    try:
+        return _deliver(event)
+    finally:
+        connections.close_all()
+
+
+def dispatch_batch(batch_size=100, workers=8, max_attempts=MAX_ATTEMPTS):
+    """Deliver one batch. Returns (sent, failed) counts."""
+    events = claim_batch(batch_size)
+    if not events:
+        return 0, 0
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        errors = list(pool.map(_deliver_in_thread, events))
+    return record_results(events, errors, max_attempts)
+
+
+def record_results(events, errors, max_attempts=MAX_ATTEMPTS):
+    """
+    Mark delivered events sent and schedule retries for the rest.
+    errors[i] is None when events[i] was delivered. Returns (sent, failed).
+    """
+    now = timezone.now()
+    sent = [event.id for event, error in zip(events, errors) if error is None]
+    OutboxEvent.objects.filter(id__in=sent).update(
+        status="sent",
+        dispatched_at=now,
+        last_error="",
+    )
+
+    failed = 0
+    for event, error in zip(events, errors):
+        if error is None:
+            continue
+        failed += 1
+        attempts = event.attempts + 1
+        logger.warning(
+            "outbox event %s (%s) failed, attempt %s: %s",
+            event.id, event.event_type, attempts, error,
+        )
+        OutboxEvent.objects.filter(id=event.id).update(
+            attempts=attempts,
+            last_error=str(error)[:2000],
+            status="failed" if attempts >= max_attempts else "pending",
+            available_at=now + timedelta(seconds=backoff_seconds(attempts)),
+        )
+    return len(sent), failed
+
+
+async def adeliver(event):
+    """
+    Deliver an event enqueued with deliver_now=True from async code,
+    after its transaction committed. Never raises: a failure is recorded
+    and the dispatcher retries it.
+    """
+    try:
+        error = await run_async(_deliver_in_thread, event)
+        await sync_to_async(record_results)([event], [error])
+    except Exception:
+        logger.exception("outbox event %s could not be delivered inline", event.id)
+
+
+def stats():
+    """Outbox depth and dispatch lag, for monitoring."""
+    pending = OutboxEvent.objects.filter(status="pending")
+    oldest = pending.aggregate(oldest=Min("created_at"))["oldest"]
+    lag = (timezone.now() - oldest).total_seconds() if oldest else 0.0
+    return {
+        "depth": pending.count(),
+        "failed": OutboxEvent.objects.filter(status="failed").count(),
+        "lag_seconds": round(max(lag, 0.0), 3),
+    }
+
+
+def purge_sent(older_than):
+    """Delete delivered events dispatched before ``older_than``."""
+    deleted, _ = OutboxEvent.objects.filter(
+        status="sent",
+        dispatched_at__lt=older_than,
+    ).delete()
+    return deleted
+
+
+handles("booking.created")(send_booking_event)
+handles("room_image.process")(process_room_event)
+handles("rate_rule.refresh")(refresh_rule_event)
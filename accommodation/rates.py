@@ -0,0 +1,183 @@
+"""
+Seasonal nightly rates.
+
+RoomRate rows are the rules managers edit. Each room's rules are flattened
+into a RoomRateCalendar (per-night cents plus prefix sums), so quoting a
+stay is one primary-key lookup and O(1) arithmetic regardless of length.
+Saving a one-room rule refreshes that calendar straight away; room-type and
+all-rooms rules are refreshed by the outbox dispatcher (``rate_rule.refresh``),
+so until it runs the rooms they cover quote with the previous rates.
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, transaction
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+
+from yugo_booking_lib.booking_price import BookingPrice
+from yugo_booking_lib.rate_calendar import RateCalendar, to_cents
+
+from .models import Room, RoomRate, RoomRateCalendar
+
+
+def _rule_queryset(room):
+    # calendars are stored and shared, so build them from the primary, never
+    # from a replica that may not have the latest rule yet
+    return RoomRate.objects.using(DEFAULT_DB_ALIAS).filter(
+        Q(room=room)
+        | Q(room__isnull=True, room_type=room.room_type)
+        | Q(room__isnull=True, room_type="")
+    )
+
+
+def _precedence(rule):
+    # all-rooms rules < room-type rules < room rules, then priority
+    scope = 2 if rule.room_id else (1 if rule.room_type else 0)
+    return scope, rule.priority, rule.id
+
+
+def _nightly_cents(room, start, end):
+    """Effective rate in cents for every night in [start, end)."""
+    cents = [to_cents(room.price_per_night)] * (end - start).days
+    rules = _rule_queryset(room).filter(start_date__lt=end, end_date__gte=start)
+
+    for rule in sorted(rules, key=_precedence):
+        rate = to_cents(rule.nightly_rate)
+        weekdays = {int(day) for day in rule.weekdays if day.isdigit()}
+        night = max(rule.start_date, start)
+        last = min(rule.end_date + timedelta(days=1), end)
+        while night < last:
+            if not weekdays or night.weekday() in weekdays:
+                cents[(night - start).days] = rate
+            night += timedelta(days=1)
+    return cents
+
+
+def _save(room, calendar):
+    rates, prefix = calendar.to_bytes()
+    RoomRateCalendar.objects.update_or_create(
+        room=room,
+        defaults={
+            "start_date": calendar.start,
+            "default_cents": calendar.default_cents,
+            "rates": rates,
+            "prefix": prefix,
+        },
+    )
+
+
+def rebuild_calendar(room, start=None, end=None, save=True):
+    """
+    Refresh a room's calendar. With start/end only the nights in
+    [start, end) are recomputed; otherwise (or if the stored calendar is
+    missing or its base price is stale) the whole calendar is rebuilt.
+    With save=False the result is returned without storing it.
+    """
+    default_cents = to_cents(room.price_per_night)
+    record = RoomRateCalendar.objects.using(DEFAULT_DB_ALIAS).filter(room=room).first()
+
+    if start is not None and record and record.default_cents == default_cents:
+        calendar = RateCalendar.from_bytes(
+            record.start_date, record.default_cents, record.rates, record.prefix
+        )
+    else:
+        calendar = RateCalendar(timezone.localdate(), default_cents)
+        span = _rule_queryset(room).aggregate(
+            first=Min("start_date"),
+            last=Max("end_date"),
+        )
+        if span["first"] is None:
+            if save:
+                _save(room, calendar)
+            return calendar
+        start, end = span["first"], span["last"] + timedelta(days=1)
+
+    calendar.set_rates(start, _nightly_cents(room, start, end))
+    if save:
+        _save(room, calendar)
+    return calendar
+
+
+def get_calendar(room):
+    record = RoomRateCalendar.objects.filter(room=room).first()
+    if record is None or record.default_cents != to_cents(room.price_per_night):
+        try:
+            with transaction.atomic():
+                return rebuild_calendar(room)
+        except DatabaseError:
+            # Another request is storing the same calendar, or the
+            # database is too busy to take the write. The stored copy is
+            # only a cache, so quote from a fresh build.
+            return rebuild_calendar(room, save=False)
+    return RateCalendar.from_bytes(
+        record.start_date, record.default_cents, record.rates, record.prefix
+    )
+
+
+def get_calendars(rooms):
+    """get_calendar for many rooms, reading the stored calendars in one query."""
+    records = {
+        record.room_id: record
+        for record in RoomRateCalendar.objects.filter(room__in=[room.pk for room in rooms])
+    }
+    calendars = {}
+    for room in rooms:
+        record = records.get(room.pk)
+        if record is None or record.default_cents != to_cents(room.price_per_night):
+            calendars[room.pk] = get_calendar(room)
+        else:
+            calendars[room.pk] = RateCalendar.from_bytes(
+                record.start_date, record.default_cents, record.rates, record.prefix
+            )
+    return calendars
+
+
+def rooms_for_rule(rule):
+    if rule.room_id:
+        return Room.objects.filter(pk=rule.room_id)
+    if rule.room_type:
+        return Room.objects.filter(room_type=rule.room_type)
+    return Room.objects.all()
+
+
+def refresh_for_rule(rule):
+    """Recompute only the nights a rule covers, for every room it touches."""
+    start = rule.start_date
+    end = rule.end_date + timedelta(days=1)
+    for room in rooms_for_rule(rule).iterator():
+        rebuild_calendar(room, start, end)
+
+
+def refresh_rule_event(payload):
+    """
+    Outbox handler for ``rate_rule.refresh``: refresh_for_rule for a
+    room-type or all-rooms rule, which may since have been changed or
+    deleted, so the event carries the scope and nights it covered.
+    """
+    refresh_for_rule(RoomRate(
+        room_type=payload["room_type"],
+        start_date=date.fromisoformat(payload["start_date"]),
+        end_date=date.fromisoformat(payload["end_date"]),
+    ))
+
+
+def price_stay(calendar, check_in, check_out, tax_rate=0.0, fixed_fee=0.0, pricer=None):
+    total = (pricer or BookingPrice()).calculate_stay_price(
+        calendar,
+        check_in,
+        check_out,
+        tax_rate=tax_rate,
+        fixed_fee=fixed_fee,
+    )
+    return Decimal(str(total))
+
+
+def quote_stay(room, check_in, check_out, tax_rate=0.0, fixed_fee=0.0):
+    return price_stay(
+        get_calendar(room),
+        check_in,
+        check_out,
+        tax_rate=tax_rate,
+        fixed_fee=fixed_fee,
+    )
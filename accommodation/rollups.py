@@ -0,0 +1,209 @@
+"""
+Daily occupancy and revenue rollups for reporting.
+
+Every booked night carries its share of the booking's price
+(``RoomNight.revenue``), so the night rows are the per-room daily
+rollup. ``LocationDayRollup`` adds the same numbers up per location,
+room type and day. ``reserve_nights`` / ``release_nights`` call
+``add_nights`` / ``remove_nights`` inside the booking transaction, so
+the rollups change exactly when the nights do: on booking, editing,
+cancelling and deleting.
+
+Rooms that move to another location or type, and bookings changed
+outside the views (admin, shell), are corrected by
+``manage.py rebuild_rollups``.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import ROUND_DOWN, Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+
+from .models import LocationDayRollup, Room, RoomNight
+
+CENT = Decimal("0.01")
+ROOM_TYPE_LABELS = dict(Room.ROOM_TYPES)
+
+
+def night_revenue(total_price, nights):
+    """
+    Split total_price over a list of nights, to the cent, with the
+    rounding remainder on the last night. Returns [(night, revenue)].
+    """
+    if not nights:
+        return []
+    total = Decimal(str(total_price)).quantize(CENT)
+    share = (total / len(nights)).quantize(CENT, rounding=ROUND_DOWN)
+    shares = [share] * (len(nights) - 1) + [total - share * (len(nights) - 1)]
+    return list(zip(nights, shares))
+
+
+def _apply(deltas):
+    """deltas: {(location, room_type, day): (room_nights, revenue)} to add."""
+    if not deltas:
+        return
+    # make sure every row exists, then add to it in place; two bookings of
+    # the same location never overwrite each other's counts
+    LocationDayRollup.objects.bulk_create(
+        [
+            LocationDayRollup(location=location, room_type=room_type, day=day)
+            for location, room_type, day in deltas
+        ],
+        ignore_conflicts=True,
+    )
+    # a fixed order, so two transactions never wait on each other's rows
+    for key in sorted(deltas):
+        location, room_type, day = key
+        room_nights, revenue = deltas[key]
+        LocationDayRollup.objects.filter(
+            location=location,
+            room_type=room_type,
+            day=day,
+        ).update(
+            room_nights=F("room_nights") + room_nights,
+            revenue=F("revenue") + revenue,
+        )
+
+
+def add_nights(room, nights):
+    """Count newly created RoomNight rows of one room."""
+    _apply({
+        (room.location, room.room_type, n.night): (1, n.revenue)
+        for n in nights
+    })
+
+
+def add_many(rooms, nights):
+    """add_nights for the nights of many rooms at once; rooms maps id to Room."""
+    deltas = {}
+    for n in nights:
+        room = rooms[n.room_id]
+        key = (room.location, room.room_type, n.night)
+        room_nights, revenue = deltas.get(key, (0, 0))
+        deltas[key] = (room_nights + 1, revenue + n.revenue)
+    _apply(deltas)
+
+
+def remove_nights(room, nights):
+    """Uncount RoomNight rows of one room that are about to be deleted."""
+    _apply({
+        (room.location, room.room_type, night): (-1, -revenue)
+        for night, revenue in nights.values_list("night", "revenue")
+    })
+
+
+def fill_night_revenue(bookings):
+    """
+    Set RoomNight.revenue for the nights of the given bookings from their
+    total_price. For nights created before revenue was recorded.
+    """
+    bookings = {b.id: b for b in bookings}
+    nights = defaultdict(list)
+    for night in RoomNight.objects.filter(booking_id__in=bookings).order_by("night"):
+        nights[night.booking_id].append(night)
+
+    changed = []
+    for booking_id, rows in nights.items():
+        shares = night_revenue(bookings[booking_id].total_price, [r.night for r in rows])
+        for row, (_, revenue) in zip(rows, shares):
+            if row.revenue != revenue:
+                row.revenue = revenue
+                changed.append(row)
+    RoomNight.objects.bulk_update(changed, ["revenue"], batch_size=500)
+    return len(changed)
+
+
+def rebuild(batch_size=1000):
+    """Recompute every LocationDayRollup row from the night rows."""
+    totals = (
+        RoomNight.objects
+        .values(location=F("room__location"), room_type=F("room__room_type"), day=F("night"))
+        .annotate(room_nights=Count("id"), total=Sum("revenue"))
+        .order_by()
+    )
+    with transaction.atomic():
+        LocationDayRollup.objects.all().delete()
+        batch = []
+        count = 0
+        for row in totals.iterator(chunk_size=batch_size):
+            batch.append(LocationDayRollup(
+                location=row["location"],
+                room_type=row["room_type"],
+                day=row["day"],
+                room_nights=row["room_nights"],
+                revenue=row["total"] or 0,
+            ))
+            if len(batch) >= batch_size:
+                LocationDayRollup.objects.bulk_create(batch)
+                count += len(batch)
+                batch = []
+        LocationDayRollup.objects.bulk_create(batch)
+        count += len(batch)
+    return count
+
+
+def report(start, end, group_by="location", location=None, room_type=None):
+    """
+    Occupancy and revenue from start to end (inclusive) per location or
+    room type, plus a per-day series, read from the rollups only.
+
+    Occupancy is room nights sold over room nights available, counting
+    the rooms that exist now.
+    """
+    days = (end - start).days + 1
+    rows = LocationDayRollup.objects.filter(day__gte=start, day__lte=end)
+    rooms = Room.objects.all()
+    if location:
+        rows = rows.filter(location=location)
+        rooms = rooms.filter(location=location)
+    if room_type:
+        rows = rows.filter(room_type=room_type)
+        rooms = rooms.filter(room_type=room_type)
+
+    capacity = dict(
+        rooms.values_list(group_by).annotate(n=Count("id")).order_by()
+    )
+    all_rooms = sum(capacity.values())
+
+    def summarise(room_nights, revenue, room_count, span):
+        available = room_count * span
+        return {
+            "room_nights": room_nights,
+            "revenue": revenue,
+            "occupancy_pct": round(100 * room_nights / available, 1) if available else None,
+            "average_rate": (revenue / room_nights).quantize(CENT) if room_nights else None,
+        }
+
+    groups = []
+    for row in (
+        rows.values(group_by)
+        .annotate(room_nights=Sum("room_nights"), revenue=Sum("revenue"))
+        .order_by(group_by)
+    ):
+        groups.append(dict(
+            summarise(row["room_nights"], row["revenue"], capacity.get(row[group_by], 0), days),
+            name=row[group_by],
+            label=ROOM_TYPE_LABELS.get(row[group_by], row[group_by])
+            if group_by == "room_type" else row[group_by],
+        ))
+
+    by_day = {
+        row["day"]: row
+        for row in rows.values("day")
+        .annotate(room_nights=Sum("room_nights"), revenue=Sum("revenue"))
+        .order_by()
+    }
+    series = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        row = by_day.get(day, {"room_nights": 0, "revenue": Decimal(0)})
+        series.append(dict(summarise(row["room_nights"], row["revenue"], all_rooms, 1), day=day))
+
+    total_nights = sum(g["room_nights"] for g in groups)
+    total_revenue = sum((g["revenue"] for g in groups), Decimal(0))
+    return {
+        "groups": groups,
+        "days": series,
+        "total": summarise(total_nights, total_revenue, all_rooms, days),
+    }
@@ -1,15 +1,39 @@
+import hashlib
+import json
 import logging
-import boto3
-from botocore.exceptions import ClientError
+import mimetypes
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
+from s3transfer.utils import ChunksizeAdjuster
+
+from aws_clients import get_client, get_session
+
+MB = 1024 * 1024
+
+# Parts of 16 MB keep a 1 GB video to 64 parts; files under the threshold
+# go up in a single PUT.
+SYNC_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=16 * MB,
+    multipart_chunksize=16 * MB,
+    max_concurrency=4,
+    use_threads=True,
+)
+SYNC_CACHE_NAME = '.s3sync-cache.json'
 
 
 def create_bucket(bucket_name, region=None):
     try:
         if region is None:
-            s3_client = boto3.client('s3')
+            s3_client = get_client('s3')
             s3_client.create_bucket(Bucket=bucket_name)
         else:
-            s3_client = boto3.client('s3', region_name=region)
+            s3_client = get_client('s3', region)
             location = {'LocationConstraint': region}
             s3_client.create_bucket(
                 Bucket=bucket_name,
@@ -22,18 +46,17 @@ def create_bucket(bucket_name, region=None):
 
 
 def list_buckets():
-    s3_client = boto3.client('s3')
+    '''Names of the account's buckets.'''
+    s3_client = get_client('s3')
     response = s3_client.list_buckets()
-    print('Existing buckets:')
-    for bucket in response['Buckets']:
-        print(f'  {bucket["Name"]}')
+    return [bucket['Name'] for bucket in response['Buckets']]
 
 
 def upload_file(file_name, bucket, object_key=None):
     if object_key is None:
         object_key = file_name
 
-    s3_client = boto3.client('s3')
+    s3_client = get_client('s3')
     try:
         s3_client.upload_file(file_name, bucket, object_key)
     except ClientError as e:
@@ -43,7 +66,7 @@ def upload_file(file_name, bucket, object_key=None):
 
 
 def delete_object(region, bucket_name, object_key):
-    s3_client = boto3.client('s3', region_name=region)
+    s3_client = get_client('s3', region)
     try:
         s3_client.delete_object(Bucket=bucket_name, Key=object_key)
     except ClientError as e:
@@ -53,7 +76,7 @@ def delete_object(region, bucket_name, object_key):
 
 
 def delete_bucket(region, bucket_name):
-    s3_client = boto3.client('s3', region_name=region)
+    s3_client = get_client('s3', region)
     try:
         s3_client.delete_bucket(Bucket=bucket_name)
     except ClientError as e:
@@ -62,19 +85,237 @@ def delete_bucket(region, bucket_name):
     return True
 
 
+def list_objects(bucket, prefix='', region=None):
+    '''Map every key under prefix to (size, ETag) with paginated listing.'''
+    s3_client = get_client('s3', region)
+    objects = {}
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            objects[obj['Key']] = (obj['Size'], obj['ETag'].strip('"'))
+    return objects
+
+
+def local_etag(path, size, config=SYNC_TRANSFER_CONFIG):
+    '''
+    The ETag S3 will give this file when uploaded with ``config``: the MD5
+    for a single PUT, or the MD5 of the part MD5s plus "-<parts>" for a
+    multipart upload.
+    '''
+    if size < config.multipart_threshold:
+        digest = hashlib.md5()
+        with open(path, 'rb') as fh:
+            for block in iter(lambda: fh.read(MB), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    # s3transfer grows the part size the same way for very large files
+    chunksize = ChunksizeAdjuster().adjust_chunksize(config.multipart_chunksize, size)
+    parts = []
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(chunksize), b''):
+            parts.append(hashlib.md5(chunk).digest())
+    return '{}-{}'.format(hashlib.md5(b''.join(parts)).hexdigest(), len(parts))
+
+
+def _load_cache(cache_path):
+    try:
+        with open(cache_path) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_cache(cache_path, cache):
+    tmp_path = '{}.{}.tmp'.format(cache_path, os.getpid())
+    with open(tmp_path, 'w') as fh:
+        json.dump(cache, fh)
+    os.replace(tmp_path, cache_path)
+
+
+def _walk(local_dir, skip_prefix):
+    for root, dirs, files in os.walk(local_dir):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            if path.startswith(skip_prefix):
+                continue
+            yield os.path.relpath(path, local_dir).replace(os.sep, '/'), path
+
+
+class SyncProgress:
+    '''Thread-safe byte/file counters, printed at most every interval.'''
+
+    def __init__(self, total_files, interval=2.0, out=print):
+        self.total_files = total_files
+        self.interval = interval
+        self.out = out
+        self.files = 0
+        self.bytes = 0
+        self.started = time.monotonic()
+        self._last_report = self.started
+        self._lock = threading.Lock()
+
+    def add_bytes(self, count):
+        with self._lock:
+            self.bytes += count
+            self._maybe_report()
+
+    def file_done(self):
+        with self._lock:
+            self.files += 1
+            self._maybe_report()
+
+    def throughput(self):
+        elapsed = time.monotonic() - self.started
+        return self.bytes / elapsed / MB if elapsed else 0.0
+
+    def _maybe_report(self):
+        now = time.monotonic()
+        if self.out and now - self._last_report >= self.interval:
+            self._last_report = now
+            self.out('  {}/{} files checked, {:.1f} MB uploaded, {:.1f} MB/s'.format(
+                self.files, self.total_files, self.bytes / MB, self.throughput()))
+
+
+def sync_directory(local_dir, bucket, prefix='', region=None, workers=8,
+                   config=SYNC_TRANSFER_CONFIG, delete=False, dry_run=False,
+                   cache_path=None, extra_args=None, out=print):
+    '''
+    Upload every file under local_dir to bucket/prefix, skipping files
+    whose size and ETag already match the object in S3.
+
+    The bucket is listed once. Local ETags are remembered in cache_path
+    (default: .s3sync-cache.json in local_dir) by size and mtime, so on a
+    re-sync only new or modified files are read, and only changed files
+    are uploaded. Files are spread over ``workers`` threads, and large
+    ones also upload their parts in parallel per ``config``.
+    With delete=True, objects under prefix with no local file are removed.
+
+    Returns a dict of counts, bytes and timings.
+    '''
+    local_dir = os.path.abspath(local_dir)
+    prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+    cache_path = cache_path or os.path.join(local_dir, SYNC_CACHE_NAME)
+    started = time.monotonic()
+
+    remote = list_objects(bucket, prefix, region)
+    listed = time.monotonic() - started
+
+    old_cache = _load_cache(cache_path)
+    new_cache = {}
+    cache_lock = threading.Lock()
+    files = list(_walk(local_dir, skip_prefix=cache_path))
+    progress = SyncProgress(len(files), out=out)
+
+    # bigger pool: every file in flight may hold max_concurrency connections
+    s3_client = get_session().client('s3', region_name=region, config=Config(
+        max_pool_connections=workers * max(config.max_concurrency, 1) + 4,
+        retries={'max_attempts': 10, 'mode': 'adaptive'},
+    ))
+
+    def sync_one(rel_path, path):
+        key = prefix + rel_path
+        stat = os.stat(path)
+        cached = old_cache.get(rel_path)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            etag = cached[2]
+        else:
+            etag = local_etag(path, stat.st_size, config)
+        with cache_lock:
+            new_cache[rel_path] = [stat.st_size, stat.st_mtime_ns, etag]
+
+        if remote.get(key) == (stat.st_size, etag):
+            return 'skipped', 0
+        if dry_run:
+            return 'uploaded', stat.st_size
+
+        args = dict(extra_args or {})
+        content_type = mimetypes.guess_type(path)[0]
+        if content_type and 'ContentType' not in args:
+            args['ContentType'] = content_type
+        s3_client.upload_file(
+            path, bucket, key,
+            ExtraArgs=args or None,
+            Config=config,
+            Callback=progress.add_bytes,
+        )
+        return 'uploaded', stat.st_size
+
+    counts = {'uploaded': 0, 'skipped': 0, 'failed': 0, 'deleted': 0}
+    uploaded_bytes = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(sync_one, rel, path): rel for rel, path in files}
+        for future in as_completed(futures):
+            try:
+                outcome, size = future.result()
+            except (ClientError, BotoCoreError, OSError) as e:
+                logging.error('%s: %s', futures[future], e)
+                outcome, size = 'failed', 0
+            counts[outcome] += 1
+            uploaded_bytes += size
+            progress.file_done()
+
+    if delete:
+        local_keys = {prefix + rel for rel, _ in files}
+        stale = sorted(key for key in remote if key not in local_keys)
+        for start in range(0, len(stale), 1000):
+            batch = stale[start:start + 1000]
+            if not dry_run:
+                s3_client.delete_objects(Bucket=bucket, Delete={
+                    'Objects': [{'Key': key} for key in batch],
+                    'Quiet': True,
+                })
+            counts['deleted'] += len(batch)
+
+    _save_cache(cache_path, new_cache)
+
+    elapsed = time.monotonic() - started
+    result = dict(
+        counts,
+        files=len(files),
+        remote_objects=len(remote),
+        uploaded_bytes=uploaded_bytes,
+        list_seconds=round(listed, 3),
+        seconds=round(elapsed, 3),
+        mb_per_second=round(uploaded_bytes / elapsed / MB, 2) if elapsed else 0.0,
+    )
+    if out:
+        out('{files} files: {uploaded} uploaded ({mb:.1f} MB), {skipped} unchanged, '
+            '{failed} failed, {deleted} deleted in {seconds:.1f}s '
+            '(listing {list_seconds:.1f}s, {mb_per_second} MB/s)'.format(
+                mb=uploaded_bytes / MB, **result))
+    return result
+
+
 def main():
     import argparse
 
     parser = argparse.ArgumentParser(description="S3 demo script")
     parser.add_argument('bucket_name', help='S3 bucket name')
-    parser.add_argument('file_name', help='Local file to upload')
-    parser.add_argument('object_key', help='Object key in S3')
+    parser.add_argument('file_name', help='Local file to upload, or a directory to sync')
+    parser.add_argument('object_key', nargs='?', default=None,
+                        help='Object key in S3 (key prefix when syncing a directory)')
+    parser.add_argument('--workers', type=int, default=8, help='Files uploaded at once')
+    parser.add_argument('--delete', action='store_true',
+                        help='Remove objects that no longer exist locally')
+    parser.add_argument('--dry-run', action='store_true')
 
     region = 'us-east-1'
 
     args = parser.parse_args()
     create_bucket(args.bucket_name)
-    upload_file(args.file_name, args.bucket_name, args.object_key)
+    if os.path.isdir(args.file_name):
+        sync_directory(
+            args.file_name,
+            args.bucket_name,
+            prefix=args.object_key or '',
+            workers=args.workers,
+            delete=args.delete,
+            dry_run=args.dry_run,
+        )
+    else:
+        upload_file(args.file_name, args.bucket_name, args.object_key)
 
 
 if __name__ == '__main__':
@@ -1,15 +1,81 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 
-from .models import Room
-from .dynamodb_client import save_room_to_dynamodb
+from .models import Room, RoomRate
+from .dynamodb_client import room_to_item
+from .dynamodb_sync import get_room_queue
+from .rates import rebuild_calendar, refresh_for_rule
+from . import catalogue, outbox
 
 
 @receiver(post_save, sender=Room)
-def sync_room_to_dynamodb(sender, instance, created, **kwargs):
-    if instance.image and hasattr(instance.image, "url"):
-        s3_url = instance.image.url
+def sync_room_to_dynamodb(sender, instance, created, update_fields=None, **kwargs):
+    # s3_url only changes with the image; other saves skip the extra UPDATE
+    if update_fields is None or "image" in update_fields:
+        s3_url = instance.image.url if instance.image else instance.s3_url
         if instance.s3_url != s3_url:
             Room.objects.filter(pk=instance.pk).update(s3_url=s3_url)
             instance.s3_url = s3_url
-    save_room_to_dynamodb(instance)
+
+    # write-behind: snapshot the item now, hand it to the sync queue once
+    # the row is committed
+    item = room_to_item(instance)
+    transaction.on_commit(lambda: get_room_queue().put(item))
+
+
+@receiver(post_save, sender=Room)
+@receiver(post_delete, sender=Room)
+def invalidate_room_catalogue(sender, instance, **kwargs):
+    # after commit, so a rebuild can never cache the pre-save rows
+    transaction.on_commit(catalogue.invalidate)
+
+
+@receiver(post_save, sender=Room)
+def rebuild_calendar_on_type_change(sender, instance, created, update_fields=None, **kwargs):
+    # room-type rules follow the type; the stored calendar still holds the
+    # old type's rates and would keep pricing with them. Comparing with the
+    # type the room was loaded with (Room.from_db) avoids a SELECT per save.
+    if update_fields is not None and "room_type" not in update_fields:
+        return
+    previous = getattr(instance, "_loaded_room_type", None)
+    instance._loaded_room_type = instance.room_type
+    if not created and previous is not None and previous != instance.room_type:
+        rebuild_calendar(instance)
+
+
+@receiver(pre_save, sender=RoomRate)
+def remember_previous_rate(sender, instance, **kwargs):
+    instance._previous_rate = (
+        RoomRate.objects.filter(pk=instance.pk).first() if instance.pk else None
+    )
+
+
+def _refresh_calendars(rule):
+    if rule.room_id:
+        refresh_for_rule(rule)
+        return
+    # A room-type or all-rooms rule touches many rooms: the dispatcher
+    # rebuilds their calendars after commit instead of this request.
+    outbox.enqueue("rate_rule.refresh", {
+        "room_type": rule.room_type,
+        "start_date": rule.start_date.isoformat(),
+        "end_date": rule.end_date.isoformat(),
+    })
+
+
+@receiver(post_save, sender=RoomRate)
+def refresh_rate_calendars(sender, instance, **kwargs):
+    previous = getattr(instance, "_previous_rate", None)
+    if previous is not None:
+        _refresh_calendars(previous)
+    _refresh_calendars(instance)
+
+
+@receiver(post_delete, sender=RoomRate)
+def refresh_rate_calendars_on_delete(sender, instance, origin=None, **kwargs):
+    # When a Room is deleted its rules cascade away with it; there is no
+    # calendar left to refresh.
+    if getattr(origin, "model", type(origin)) is not RoomRate:
+        return
+    _refresh_calendars(instance)
@@ -1,3 +1,1979 @@
-from django.test import TestCase
+import asyncio
+import importlib
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+import boto3
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, connections, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import clear_url_caches, reverse
+from django.utils import timezone
+from moto import mock_aws
+from PIL import Image
+
+import aws_clients
+import aws_metrics
+import yugo_site.urls
+from consumer import ConsumerWorker
+from producer import BufferedProducer
+from yugo_booking_lib.booking_price import BookingPrice
+from yugo_booking_lib.rate_calendar import RateCalendar
+from yugo_site.db_router import PIN_COOKIE, PrimaryPinMiddleware
+from yugo_site.profiling import ProfilingMiddleware
+
+from . import async_views, booking_feed, catalogue, image_urls, images, outbox, s3_utils, tickets
+from . import rollups
+from .availability import ROOM_TAKEN, RoomUnavailable, move_nights, release_nights, reserve_nights
+from .booking_import import NIGHTS_TAKEN, BookingImporter
+from .dynamodb_client import (
+    ROOMS_REGION,
+    ROOMS_TABLE,
+    TTLCache,
+    batch_get_rooms,
+    create_rooms_table,
+    get_room,
+    query_rooms_by_listing_status,
+    query_rooms_by_location,
+    room_cache,
+    room_to_item,
+)
+from .dynamodb_sync import WriteBehindQueue
+from .models import (
+    Booking,
+    LocationDayRollup,
+    OutboxEvent,
+    Room,
+    RoomNight,
+    RoomRate,
+    SupportTicket,
+)
+from .rates import get_calendar, quote_stay
+from .views import BOOKING_BUSY, BOOKING_CANCELLED
+
+FAKE_AWS_ENV = {
+    "AWS_ACCESS_KEY_ID": "testing",
+    "AWS_SECRET_ACCESS_KEY": "testing",
+    "AWS_SESSION_TOKEN": "testing",
+    "AWS_DEFAULT_REGION": "us-east-1",
+}
+
+
+class MockAWSMixin:
+    """moto in place of AWS, with the shared clients in aws_clients rebuilt."""
+
+    def setUp(self):
+        super().setUp()
+        env = mock.patch.dict(os.environ, FAKE_AWS_ENV)
+        env.start()
+        self.addCleanup(env.stop)
+        aws = mock_aws()
+        aws.start()
+        self.addCleanup(aws.stop)
+        aws_clients.reset()
+        self.addCleanup(aws_clients.reset)
+
+
+def create_table(table_name):
+    """A table keyed like YugoRooms, in moto."""
+    boto3.client("dynamodb", region_name="us-east-1").create_table(
+        TableName=table_name,
+        KeySchema=[{"AttributeName": "room_id", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "room_id", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+
+
+def make_room(name="A1", location="Leeds", room_type="classic", price="100.00", **fields):
+    return Room.objects.create(
+        name=name,
+        location=location,
+        room_type=room_type,
+        price_per_night=Decimal(price),
+        **fields,
+    )
+
+
+def rollup(room, day):
+    """(room_nights, revenue) of the rollup row for room's location and type on day."""
+    row = LocationDayRollup.objects.filter(
+        location=room.location, room_type=room.room_type, day=day
+    ).first()
+    return (row.room_nights, row.revenue) if row else (0, Decimal("0"))
+
+
+class BookingViewTests(TestCase):
+    def setUp(self):
+        self.room = make_room()
+        self.client.force_login(User.objects.create_user("guest", password="x"))
+
+    def book(self, check_in, check_out):
+        return self.client.post(
+            reverse("book_room", args=[self.room.id]),
+            {"email": "guest@example.com", "check_in": str(check_in), "check_out": str(check_out)},
+        )
+
+    def assertNightsMatch(self, booking, check_in, check_out):
+        nights = list(
+            RoomNight.objects.filter(booking=booking).order_by("night").values_list("night", "revenue")
+        )
+        self.assertEqual(
+            [night for night, _ in nights],
+            [check_in + timedelta(days=n) for n in range((check_out - check_in).days)],
+        )
+        self.assertEqual(sum(revenue for _, revenue in nights), booking.total_price)
+        for night, revenue in nights:
+            self.assertEqual(rollup(self.room, night), (1, revenue))
+
+    def test_booking_reserves_nights_and_counts_them(self):
+        check_in, check_out = date(2026, 3, 1), date(2026, 3, 4)
+        response = self.book(check_in, check_out)
+
+        booking = Booking.objects.get()
+        self.assertRedirects(
+            response, reverse("booking_success", args=[booking.id]), fetch_redirect_response=False
+        )
+        self.assertEqual(
+            booking.total_price,
+            quote_stay(self.room, check_in, check_out, tax_rate=0.08, fixed_fee=50.0),
+        )
+        self.assertNightsMatch(booking, check_in, check_out)
+        self.assertEqual(OutboxEvent.objects.get().payload["booking_id"], booking.id)
+
+    def test_overlapping_stay_is_rejected(self):
+        self.book(date(2026, 3, 1), date(2026, 3, 4))
+
+        response = self.book(date(2026, 3, 3), date(2026, 3, 6))
+
+        self.assertEqual(response.status_code, 409)
+        self.assertContains(response, ROOM_TAKEN, status_code=409)
+        self.assertEqual(Booking.objects.count(), 1)
+        self.assertEqual(RoomNight.objects.count(), 3)
+
+    def test_overlap_missed_by_the_read_is_caught_by_the_night_constraint(self):
+        self.book(date(2026, 3, 1), date(2026, 3, 4))
+
+        # as if another request booked the nights just after the cheap check
+        with mock.patch(
+            "accommodation.views.availability_for",
+            side_effect=lambda room_ids, *stay: {room_id: True for room_id in room_ids},
+        ):
+            response = self.book(date(2026, 3, 3), date(2026, 3, 6))
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Booking.objects.count(), 1)
+        self.assertEqual(rollup(self.room, date(2026, 3, 3))[0], 1)
+        self.assertEqual(rollup(self.room, date(2026, 3, 5))[0], 0)
+
+    def test_booking_answers_busy_when_the_database_is_locked(self):
+        with mock.patch(
+            "accommodation.views.claim_room",
+            side_effect=OperationalError("database is locked"),
+        ):
+            response = self.book(date(2026, 3, 1), date(2026, 3, 4))
+
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(Booking.objects.exists())
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_back_to_back_stays_do_not_overlap(self):
+        self.book(date(2026, 3, 1), date(2026, 3, 4))
+
+        self.assertEqual(self.book(date(2026, 3, 4), date(2026, 3, 6)).status_code, 302)
+        self.assertEqual(RoomNight.objects.count(), 5)
+
+    def test_edit_moves_nights_and_rollups(self):
+        self.book(date(2026, 3, 1), date(2026, 3, 4))
+        booking = Booking.objects.get()
+
+        response = self.client.post(
+            reverse("edit_booking", args=[booking.id]),
+            {"check_in": "2026-03-10", "check_out": "2026-03-12"},
+        )
+
+        self.assertEqual(response.status_code, 302)
+        booking.refresh_from_db()
+        self.assertNightsMatch(booking, date(2026, 3, 10), date(2026, 3, 12))
+        for day in (1, 2, 3):
+            self.assertEqual(rollup(self.room, date(2026, 3, day)), (0, Decimal("0")))
+
+    def test_edit_onto_booked_nights_keeps_the_old_stay(self):
+        self.book(date(2026, 3, 1), date(2026, 3, 4))
+        self.book(date(2026, 3, 10), date(2026, 3, 12))
+        booking = Booking.objects.get(check_in=date(2026, 3, 10))
+
+        response = self.client.post(
+            reverse("edit_booking", args=[booking.id]),
+            {"check_in": "2026-03-02", "check_out": "2026-03-05"},
+        )
+
+        self.assertEqual(response.status_code, 409)
+        booking.refresh_from_db()
+        self.assertEqual(booking.check_in, date(2026, 3, 10))
+        self.assertNightsMatch(booking, date(2026, 3, 10), date(2026, 3, 12))
+        self.assertEqual(rollup(self.room, date(2026, 3, 4)), (0, Decimal("0")))
+
+    def test_edit_answers_busy_when_the_database_is_locked(self):
+        self.book(date(2026, 3, 1), date(2026, 3, 4))
+        booking = Booking.objects.get()
+
+        with mock.patch(
+            "accommodation.views.move_nights",
+            side_effect=OperationalError("database is locked"),
+        ):
+            response = self.client.post(
+                reverse("edit_booking", args=[booking.id]),
+                {"check_in": "2026-03-10", "check_out": "2026-03-12"},
+            )
+
+        self.assertEqual(response.status_code, 503)
+        booking.refresh_from_db()
+        self.assertEqual(booking.check_in, date(2026, 3, 1))
+
+    def test_cancel_releases_nights_and_locks_the_booking(self):
+        self.book(date(2026, 3, 1), date(2026, 3, 4))
+        booking = Booking.objects.get()
+
+        self.client.post(reverse("cancel_booking", args=[booking.id]))
+
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, "cancelled")
+        self.assertFalse(RoomNight.objects.exists())
+        self.assertEqual(rollup(self.room, date(2026, 3, 2)), (0, Decimal("0")))
+
+        response = self.client.post(
+            reverse("edit_booking", args=[booking.id]),
+            {"check_in": "2026-03-01", "check_out": "2026-03-04"},
+        )
+        self.assertContains(response, BOOKING_CANCELLED, status_code=409)
+        self.assertFalse(RoomNight.objects.exists())
+        self.assertEqual(self.book(date(2026, 3, 1), date(2026, 3, 4)).status_code, 302)
+
+    def test_cancel_answers_busy_when_the_database_is_locked(self):
+        self.book(date(2026, 3, 1), date(2026, 3, 4))
+        booking = Booking.objects.get()
+
+        with mock.patch(
+            "accommodation.views.release_nights",
+            side_effect=OperationalError("database is locked"),
+        ):
+            response = self.client.post(reverse("cancel_booking", args=[booking.id]))
+
+        self.assertContains(response, BOOKING_BUSY, status_code=503)
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, "confirmed")
+        self.assertEqual(RoomNight.objects.filter(booking=booking).count(), 3)
+
+    def test_delete_releases_nights(self):
+        self.book(date(2026, 3, 1), date(2026, 3, 4))
+        booking = Booking.objects.get()
+
+        self.client.post(reverse("delete_booking", args=[booking.id]))
+
+        self.assertFalse(Booking.objects.exists())
+        self.assertFalse(RoomNight.objects.exists())
+        self.assertEqual(rollup(self.room, date(2026, 3, 1)), (0, Decimal("0")))
+        self.assertEqual(self.book(date(2026, 3, 1), date(2026, 3, 4)).status_code, 302)
+
+
+class CalculateManyTests(TestCase):
+    def rows(self, count=2000):
+        rng = random.Random(7)
+        start = date(2026, 1, 1)
+        rows = []
+        for _ in range(count):
+            check_in = start + timedelta(days=rng.randrange(365))
+            check_out = check_in + timedelta(days=rng.randrange(-2, 40))
+            rows.append((
+                check_in.isoformat(),
+                check_out.isoformat(),
+                # three decimals put some totals right on a half cent
+                rng.randrange(1000, 500000) / 1000,
+                rng.choice([0.0, 0.08, 0.2, 0.125]),
+                rng.choice([0.0, 50.0, 12.5, 0.005]),
+            ))
+        return rows
+
+    def assertMatchesScalar(self, use_numpy):
+        pricer = BookingPrice()
+        rows = self.rows()
+        check_ins, check_outs, rates, taxes, fees = map(list, zip(*rows))
+
+        nights, totals = pricer.calculate_many(
+            check_ins, check_outs, rates, taxes, fees, use_numpy=use_numpy
+        )
+
+        expected_nights = [max(pricer.calculate_nights(ci, co), 0) for ci, co in zip(check_ins, check_outs)]
+        self.assertEqual(nights, expected_nights)
+        self.assertEqual(totals, [
+            pricer.calculate_total_price(n, rate, tax, fee)
+            for n, rate, tax, fee in zip(expected_nights, rates, taxes, fees)
+        ])
+
+    def test_python_loop_matches_scalar_methods(self):
+        self.assertMatchesScalar(use_numpy=False)
+
+    def test_numpy_matches_scalar_methods(self):
+        self.assertMatchesScalar(use_numpy=True)
+
+    def test_single_numbers_apply_to_every_row(self):
+        nights, totals = BookingPrice().calculate_many(
+            [date(2026, 1, 1), date(2026, 2, 1)],
+            [date(2026, 1, 3), date(2026, 2, 4)],
+            100.0,
+            tax_rates=0.1,
+            fixed_fees=5.0,
+        )
+        self.assertEqual(nights, [2, 3])
+        self.assertEqual(totals, [225.0, 335.0])
+
+    def test_lengths_must_match(self):
+        with self.assertRaises(ValueError):
+            BookingPrice().calculate_many(["2026-01-01"], [], [100.0])
+
+
+class OutboxTests(MockAWSMixin, TestCase):
+    def enqueue(self):
+        return outbox.enqueue("booking.created", {"booking_id": 1})
+
+    def test_failed_delivery_is_retried_with_backoff(self):
+        event = self.enqueue()
+
+        # moto has no yugo-booking function, so the Lambda invoke fails
+        started = timezone.now()
+        with self.assertLogs("accommodation.outbox", "WARNING"):
+            self.assertEqual(outbox.dispatch_batch(), (0, 1))
+
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.attempts), ("pending", 1))
+        self.assertTrue(event.last_error)
+        delay = (event.available_at - started).total_seconds()
+        self.assertGreaterEqual(delay, outbox.BACKOFF_BASE * 0.8)
+        self.assertLessEqual(delay, outbox.BACKOFF_BASE * 1.2 + 1)
+        # not due yet
+        self.assertEqual(outbox.dispatch_batch(), (0, 0))
+
+        OutboxEvent.objects.filter(pk=event.pk).update(available_at=started)
+        handler = mock.Mock()
+        with mock.patch.dict(outbox.HANDLERS, {"booking.created": handler}):
+            self.assertEqual(outbox.dispatch_batch(), (1, 0))
+
+        handler.assert_called_once_with({"booking_id": 1})
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.last_error), ("sent", ""))
+
+    def test_worker_threads_close_their_connections(self):
+        for _ in range(3):
+            self.enqueue()
+        handler_threads, closing_threads = [], []
+        handler = mock.Mock(side_effect=lambda payload: handler_threads.append(threading.get_ident()))
+
+        with mock.patch.dict(outbox.HANDLERS, {"booking.created": handler}), \
+                mock.patch("accommodation.outbox.connections") as connections:
+            connections.close_all.side_effect = lambda: closing_threads.append(threading.get_ident())
+            self.assertEqual(outbox.dispatch_batch(workers=2), (3, 0))
+
+        self.assertEqual(len(closing_threads), 3)
+        self.assertEqual(sorted(closing_threads), sorted(handler_threads))
+        self.assertNotIn(threading.get_ident(), closing_threads)
+
+    def test_backoff_doubles_up_to_the_cap(self):
+        with mock.patch.object(outbox.random, "uniform", return_value=1.0):
+            delays = [outbox.backoff_seconds(attempts) for attempts in range(1, 20)]
+        self.assertEqual(delays[:3], [outbox.BACKOFF_BASE * n for n in (1, 2, 4)])
+        self.assertEqual(max(delays), outbox.BACKOFF_MAX)
+
+    def test_event_fails_for_good_after_max_attempts(self):
+        event = self.enqueue()
+        OutboxEvent.objects.filter(pk=event.pk).update(attempts=outbox.MAX_ATTEMPTS - 1)
+
+        handler = mock.Mock(side_effect=RuntimeError("boom"))
+        with mock.patch.dict(outbox.HANDLERS, {"booking.created": handler}), \
+                self.assertLogs("accommodation.outbox", "WARNING"):
+            self.assertEqual(outbox.dispatch_batch(), (0, 1))
+
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.attempts), ("failed", outbox.MAX_ATTEMPTS))
+        self.assertEqual(event.last_error, "boom")
+        self.assertEqual(outbox.stats()["failed"], 1)
+
+
+class WriteBehindQueueTests(MockAWSMixin, TestCase):
+    table_name = "YugoRoomsTest"
+
+    def make_queue(self, **options):
+        written = []
+        queue = WriteBehindQueue(
+            table_name=self.table_name,
+            flush_interval=60,
+            max_attempts=2,
+            on_written=written.extend,
+            **options,
+        )
+        self.addCleanup(queue.stop, timeout=1)
+        return queue, written
+
+    def stored(self):
+        table = aws_clients.get_table(self.table_name, "us-east-1")
+        return {item["room_id"]: item["name"] for item in table.scan()["Items"]}
+
+    def test_repeated_puts_of_an_item_coalesce(self):
+        create_table(self.table_name)
+        queue, written = self.make_queue()
+
+        queue.put({"room_id": "1", "name": "first"})
+        queue.put({"room_id": "2", "name": "other"})
+        queue.put({"room_id": "1", "name": "second"})
+        self.assertEqual(queue.pending(), 2)
+
+        self.assertEqual(queue.flush(), [])
+        self.assertEqual(queue.pending(), 0)
+        self.assertEqual(sorted(written), ["1", "2"])
+        self.assertEqual(self.stored(), {"1": "second", "2": "other"})
+
+    def test_failed_write_is_requeued_behind_newer_versions(self):
+        queue, written = self.make_queue()
+
+        # the table does not exist yet, so every attempt fails
+        with self.assertLogs("accommodation.dynamodb_sync", "ERROR"):
+            queue._write([{"room_id": "1", "name": "old"}, {"room_id": "2", "name": "only"}])
+        self.assertEqual(queue.pending(), 2)
+        self.assertEqual(written, [])
+
+        queue.put({"room_id": "1", "name": "new"})
+        with self.assertLogs("accommodation.dynamodb_sync", "ERROR"):
+            queue._write([{"room_id": "1", "name": "stale"}])
+        create_table(self.table_name)
+        self.assertEqual(queue.flush(), [])
+
+        self.assertEqual(self.stored(), {"1": "new", "2": "only"})
+
+    def test_item_is_given_up_after_max_attempts(self):
+        queue, _ = self.make_queue()
+        queue.put({"room_id": "1", "name": "lost"})
+
+        with self.assertLogs("accommodation.dynamodb_sync", "ERROR") as logs:
+            self.assertEqual(queue.flush(), [])
+
+        self.assertEqual(queue.pending(), 0)
+        self.assertIn("giving up syncing 1", "\n".join(logs.output))
+
+
+class DynamoDBBackfillTests(MockAWSMixin, TestCase):
+    table_name = "YugoRoomsBackfill"
+
+    def run_backfill(self, *args, **options):
+        out = StringIO()
+        call_command(
+            "dynamodb_backfill", *args, table=self.table_name, writers=2, segments=2,
+            stdout=out, **options,
+        )
+        return out.getvalue()
+
+    def test_verify_reports_missing_extra_and_changed_items(self):
+        create_table(self.table_name)
+        rooms = [make_room(name=f"R{n}") for n in range(5)]
+
+        output = self.run_backfill()
+        self.assertIn("wrote 5 rooms", output)
+        self.assertIn("verified 5 rooms against 5 items", output)
+        for label in ("missing", "extra", "changed"):
+            self.assertIn(f"  {label}: 0\n", output)
+
+        table = aws_clients.get_table(self.table_name, "us-east-1")
+        table.delete_item(Key={"room_id": str(rooms[0].id)})
+        table.put_item(Item={"room_id": "999999", "name": "Gone"})
+        Room.objects.filter(pk=rooms[1].pk).update(name="Renamed")
+
+        output = self.run_backfill("--verify-only")
+        self.assertNotIn("wrote", output)
+        self.assertIn("verified 5 rooms against 5 items", output)
+        self.assertIn(f"  missing: 1 e.g. {rooms[0].id}\n", output)
+        self.assertIn("  extra: 1 e.g. 999999\n", output)
+        self.assertIn(f"  changed: 1 e.g. {rooms[1].id}\n", output)
+
+        with self.assertRaisesMessage(CommandError, "3 rooms differ"):
+            self.run_backfill("--verify-only", "--fail-on-drift")
+
+        # a second backfill puts back the missing and changed rooms; the
+        # extra item is only reported
+        output = self.run_backfill()
+        self.assertIn("  missing: 0\n", output)
+        self.assertIn("  extra: 1 e.g. 999999\n", output)
+        self.assertIn("  changed: 0\n", output)
+
+
+class BufferedProducerTests(MockAWSMixin, TestCase):
+    queue_name = "yugo-test-queue"
+
+    def setUp(self):
+        super().setUp()
+        self.spool_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.spool_dir)
+
+    def make_producer(self, **options):
+        producer = BufferedProducer(
+            self.queue_name, spool_dir=self.spool_dir, max_attempts=2, region="us-east-1", **options
+        )
+        self.addCleanup(producer.close, timeout=1)
+        return producer
+
+    def spooled(self):
+        messages = []
+        for name in os.listdir(self.spool_dir):
+            with open(os.path.join(self.spool_dir, name), encoding="utf-8") as spool:
+                messages.extend(json.loads(line) for line in spool)
+        return messages
+
+    def received(self):
+        sqs = boto3.client("sqs", region_name="us-east-1")
+        queue_url = sqs.get_queue_url(QueueName=self.queue_name)["QueueUrl"]
+        messages = []
+        while True:
+            batch = sqs.receive_message(QueueUrl=queue_url, MaxNumberOfMessages=10).get("Messages", [])
+            if not batch:
+                return messages
+            messages.extend(message["Body"] for message in batch)
+
+    def test_unsent_batch_is_spilled_and_replayed(self):
+        producer = self.make_producer()
+
+        # no queue yet: SQS keeps failing
+        with self.assertLogs(level="ERROR"):
+            self.assertFalse(producer._send(["one", "two"]))
+        self.assertEqual(sorted(self.spooled()), ["one", "two"])
+
+        boto3.client("sqs", region_name="us-east-1").create_queue(QueueName=self.queue_name)
+        producer._replay_spool()
+
+        self.assertEqual(self.spooled(), [])
+        self.assertEqual(sorted(self.received()), ["one", "two"])
+
+    def test_full_buffer_spills_instead_of_blocking(self):
+        boto3.client("sqs", region_name="us-east-1").create_queue(QueueName=self.queue_name)
+        producer = self.make_producer(max_buffer=1)
+
+        # no sender thread, so the buffer stays full
+        with mock.patch.object(producer, "_ensure_thread"):
+            for message in ("a", "b", "c"):
+                self.assertTrue(producer.send_message(message))
+        self.assertEqual(sorted(self.spooled()), ["b", "c"])
+
+        producer.close(timeout=1)
+        producer._replay_spool()
+
+        self.assertEqual(sorted(self.received()), ["a", "b", "c"])
+
+
+class SearchTicketsTests(TestCase):
+    def store(self, **fields):
+        body = {
+            "name": "Ann",
+            "email": "ann@example.com",
+            "room": "A1",
+            "subject": "Question",
+            "message": "Hello",
+            "created_at": "2026-01-01T10:00:00Z",
+        }
+        body.update(fields)
+        return tickets.store_ticket(json.dumps(body))
+
+    def ids(self, **filters):
+        found, _ = tickets.search_tickets(**filters)
+        return [ticket.id for ticket in found]
+
+    def test_text_search_matches_words_anywhere(self):
+        heating = self.store(subject="Heating broken", message="The radiator is cold")
+        wifi = self.store(subject="Wi-Fi", message="No signal in the kitchen")
+        self.store(subject="Parking", message="Where do I park?")
+
+        self.assertEqual(self.ids(q="radiator"), [heating.id])
+        self.assertEqual(self.ids(q="KITCHEN signal"), [wifi.id])
+        self.assertEqual(self.ids(q="radiator kitchen"), [])
+
+    def test_room_and_email_filters(self):
+        first = self.store(room="B12", email="Bob@Example.com ", subject="Noise")
+        self.store(room="C3", email="cat@example.com", subject="Noise")
+
+        self.assertEqual(self.ids(q="noise", room="B12"), [first.id])
+        self.assertEqual(self.ids(email="bob@example.com"), [first.id])
+
+    def test_user_input_cannot_break_fts_syntax(self):
+        ticket = self.store(subject="Door lock", message='It says "error" AND stops')
+
+        self.assertEqual(self.ids(q='"error" AND (stops'), [ticket.id])
+        self.assertEqual(len(self.ids(q='*"')), 1)
+
+    def test_redelivered_message_is_stored_once(self):
+        self.assertEqual(self.store().id, self.store().id)
+
+    def test_pages_newest_first(self):
+        stored = [self.store(subject=f"Ticket {n}") for n in range(3)]
+
+        page, before = tickets.search_tickets(q="ticket", size=2)
+        self.assertEqual([t.id for t in page], [stored[2].id, stored[1].id])
+        page, before = tickets.search_tickets(q="ticket", before=before, size=2)
+        self.assertEqual([t.id for t in page], [stored[0].id])
+        self.assertIsNone(before)
+
+
+@override_settings(PROFILING_ENABLED=True, PROFILING_SAMPLE_RATE=1.0, PROFILING_QUERY_BUDGET=1)
+class ProfilingMiddlewareTests(TestCase):
+    def setUp(self):
+        make_room()
+
+    def assertProfiled(self, response, logs):
+        self.assertIn('db;dur=', response["Server-Timing"])
+        self.assertIn('desc="2 queries"', response["Server-Timing"])
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual((record["queries"], record["over_query_budget"]), (2, True))
+
+    def test_sync_requests(self):
+        def view(request):
+            return HttpResponse(f"{Room.objects.count()} {len(list(Room.objects.all()))}")
+
+        middleware = ProfilingMiddleware(view)
+        self.assertFalse(iscoroutinefunction(middleware))
+        with self.assertLogs("yugo.profiling", "WARNING") as logs:
+            response = middleware(RequestFactory().get("/"))
+        self.assertProfiled(response, logs)
+
+    async def test_async_requests(self):
+        async def view(request):
+            count = await Room.objects.acount()
+            rooms = await sync_to_async(list)(Room.objects.all())
+            return HttpResponse(f"{count} {len(rooms)}")
+
+        middleware = ProfilingMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        with self.assertLogs("yugo.profiling", "WARNING") as logs:
+            response = await middleware(RequestFactory().get("/"))
+        self.assertProfiled(response, logs)
+
+
+class RoomQueryTests(MockAWSMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        create_rooms_table()
+        self.rooms = {
+            "cheap": make_room(name="Cheap", price="60.00"),
+            "dear": make_room(name="Dear", room_type="premium", price="150.00"),
+            "middle": make_room(name="Middle", location="York", room_type="studio", price="95.00"),
+            "closed": make_room(name="Closed", price="80.00", available=False),
+        }
+        table = aws_clients.get_table(ROOMS_TABLE, ROOMS_REGION)
+        for room in self.rooms.values():
+            table.put_item(Item=room_to_item(room))
+
+    def names(self, items):
+        return [item["name"] for item in items]
+
+    def test_by_location_and_type(self):
+        self.assertEqual(
+            sorted(self.names(query_rooms_by_location("Leeds"))), ["Cheap", "Closed", "Dear"]
+        )
+        self.assertEqual(self.names(query_rooms_by_location("Leeds", "premium")), ["Dear"])
+        self.assertEqual(self.names(query_rooms_by_location("Bath")), [])
+
+    def test_by_listing_status_in_price_order(self):
+        self.assertEqual(
+            self.names(query_rooms_by_listing_status()), ["Cheap", "Middle", "Dear"]
+        )
+        self.assertEqual(
+            self.names(query_rooms_by_listing_status(descending=True)), ["Dear", "Middle", "Cheap"]
+        )
+        self.assertEqual(self.names(query_rooms_by_listing_status("unlisted")), ["Closed"])
+
+    def test_price_range(self):
+        self.assertEqual(
+            self.names(query_rooms_by_listing_status(min_price=60, max_price=95)), ["Cheap", "Middle"]
+        )
+        self.assertEqual(self.names(query_rooms_by_listing_status(min_price="95.00")), ["Middle", "Dear"])
+        self.assertEqual(self.names(query_rooms_by_listing_status(max_price=59.99)), [])
+
+    def test_pages_are_fetched_as_the_caller_iterates(self):
+        table = mock.Mock(wraps=aws_clients.get_table(ROOMS_TABLE, ROOMS_REGION))
+        with mock.patch("accommodation.dynamodb_client.get_table", return_value=table):
+            items = query_rooms_by_listing_status(page_size=1)
+            self.assertEqual(next(items)["name"], "Cheap")
+            self.assertEqual(table.query.call_count, 1)
+            self.assertEqual(self.names(items), ["Middle", "Dear"])
+        self.assertGreaterEqual(table.query.call_count, 3)
+
+
+class BookingImportTests(TestCase):
+    def setUp(self):
+        self.room = make_room()
+        self.other = make_room(name="B2", location="York", room_type="studio", price="80.00")
+        self.unlisted = make_room(name="C3", available=False)
+
+    def line(self, room=None, email="guest@example.com", check_in="2026-05-01", check_out="2026-05-03"):
+        return json.dumps({
+            "room_id": (room or self.room).id,
+            "email": email,
+            "check_in": check_in,
+            "check_out": check_out,
+        })
+
+    def import_lines(self, lines, **options):
+        importer = BookingImporter(tax_rate=0.08, fixed_fee=50.0, max_nights=30, **options)
+        return importer.import_chunk(list(enumerate(lines, 1)))
+
+    def test_rejects_say_why(self):
+        existing = Booking.objects.create(
+            room=self.other,
+            user_email="earlier@example.com",
+            check_in=date(2026, 5, 1),
+            check_out=date(2026, 5, 4),
+            total_price=Decimal("240.00"),
+            status="confirmed",
+        )
+        reserve_nights(existing)
+
+        imported, rejects = self.import_lines([
+            self.line(),
+            "{not json",
+            json.dumps({"room_id": 999999, "email": "a@example.com",
+                        "check_in": "2026-05-01", "check_out": "2026-05-02"}),
+            self.line(room=self.unlisted),
+            self.line(room=self.other, check_in="2026-05-03", check_out="2026-05-05"),
+            self.line(check_in="2026-05-02", check_out="2026-05-04"),
+            self.line(check_in="2026-05-09", check_out="2026-05-08"),
+            self.line(check_in="2026-06-01", check_out="2026-08-01"),
+            self.line(email="not-an-email", check_in="2026-07-01", check_out="2026-07-02"),
+            self.line(room=self.other, check_in="2026-05-04", check_out="2026-05-06"),
+        ])
+
+        self.assertEqual(imported, 2)
+        self.assertEqual(dict((n, reason) for n, _, reason in rejects), {
+            2: "not valid JSON",
+            3: "there is no room 999999",
+            4: "the room is not taking bookings",
+            5: NIGHTS_TAKEN,
+            6: NIGHTS_TAKEN,
+            7: "Check-out must be after check-in.",
+            8: "stays are limited to 30 nights",
+            9: "email is not a valid address",
+        })
+
+        booking = Booking.objects.get(room=self.room)
+        self.assertEqual(
+            booking.total_price,
+            quote_stay(self.room, booking.check_in, booking.check_out, tax_rate=0.08, fixed_fee=50.0),
+        )
+        self.assertEqual(rollup(self.room, date(2026, 5, 1))[0], 1)
+        self.assertEqual(rollup(self.other, date(2026, 5, 5))[0], 1)
+
+    def test_prices_match_the_web_quote_to_the_cent(self):
+        room = make_room(name="D4", price="163.68")
+        RoomRate.objects.create(
+            room=room,
+            start_date=date(2026, 5, 2),
+            end_date=date(2026, 5, 2),
+            nightly_rate=Decimal("82.44"),
+        )
+        importer = BookingImporter(tax_rate=0.125, fixed_fee=0.0, max_nights=30)
+
+        # an average nightly rate of 136.60 would round this half-cent tie down
+        imported = importer.import_chunk([(1, self.line(room=room, check_out="2026-05-04"))])
+
+        self.assertEqual(imported, (1, []))
+        self.assertEqual(Booking.objects.get().total_price, Decimal("461.03"))
+        self.assertEqual(
+            quote_stay(room, date(2026, 5, 1), date(2026, 5, 4), tax_rate=0.125), Decimal("461.03")
+        )
+
+    def test_second_import_of_a_file_rejects_every_row(self):
+        lines = [self.line(), self.line(room=self.other)]
+        self.assertEqual(self.import_lines(lines)[0], 2)
+
+        imported, rejects = self.import_lines(lines)
+
+        self.assertEqual(imported, 0)
+        self.assertEqual([reason for _, _, reason in rejects], [NIGHTS_TAKEN] * 2)
+        self.assertEqual(Booking.objects.count(), 2)
+
+    def test_busy_database_is_retried(self):
+        write = BookingImporter._write
+        calls = []
+
+        def locked_once(importer, bookings):
+            calls.append(len(bookings))
+            if len(calls) == 1:
+                raise OperationalError("database is locked")
+            return write(importer, bookings)
+
+        with mock.patch.object(BookingImporter, "_write", locked_once), \
+                mock.patch("accommodation.booking_import.time.sleep"):
+            imported, rejects = self.import_lines([self.line()])
+
+        self.assertEqual((imported, rejects, calls), (1, [], [1, 1]))
+        self.assertEqual(RoomNight.objects.count(), 2)
+
+    def test_rows_are_rejected_when_the_database_stays_busy(self):
+        with mock.patch.object(
+            BookingImporter, "_write", side_effect=OperationalError("database is locked")
+        ), mock.patch("accommodation.booking_import.time.sleep"):
+            imported, rejects = self.import_lines([self.line(), "{not json"])
+
+        self.assertEqual(imported, 0)
+        self.assertEqual(
+            [(n, reason) for n, _, reason in rejects],
+            [(2, "not valid JSON"), (1, "the database stayed busy")],
+        )
+        self.assertFalse(Booking.objects.exists())
+
+    def test_command_writes_rejects_file(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "bookings.jsonl")
+        with open(path, "w", encoding="utf-8") as fh:
+            fh.write("\n".join([self.line(), "", self.line(room=self.unlisted)]) + "\n")
+
+        out = StringIO()
+        call_command("import_bookings", path, workers=0, stdout=out)
+
+        self.assertIn("imported 1 bookings, rejected 1 rows", out.getvalue())
+        with open(path + ".rejects.jsonl", encoding="utf-8") as fh:
+            rejects = [json.loads(line) for line in fh]
+        self.assertEqual(rejects, [{
+            "line": 3,
+            "error": "the room is not taking bookings",
+            "row": self.line(room=self.unlisted),
+        }])
+
+
+def image_file(name="room.png", size=(40, 30), format="PNG"):
+    """A small in-memory image upload."""
+    buffer = BytesIO()
+    Image.new("RGB", size, "teal").save(buffer, format=format)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type=f"image/{format.lower()}")
+
+
+def route_async_views(enabled):
+    """Rebuild the URLconf, which picks the view module when imported."""
+    with override_settings(ASYNC_VIEWS=enabled):
+        importlib.reload(yugo_site.urls)
+    clear_url_caches()
+
+
+class AsyncViewTests(MockAWSMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        route_async_views(True)
+        self.addCleanup(route_async_views, False)
+        boto3.client("s3", region_name="us-east-1").create_bucket(
+            Bucket=settings.AWS_STORAGE_BUCKET_NAME
+        )
+        self.room = make_room()
+        self.async_client.force_login(User.objects.create_user("manager", password="x", is_staff=True))
+
+    async def book(self, check_in="2026-03-01", check_out="2026-03-04"):
+        return await self.async_client.post(
+            reverse("book_room", args=[self.room.id]),
+            {"email": "guest@example.com", "check_in": check_in, "check_out": check_out},
+        )
+
+    async def test_booking_delivers_its_event_after_the_response(self):
+        handler = mock.Mock()
+        with mock.patch.dict(outbox.HANDLERS, {"booking.created": handler}):
+            response = await self.book()
+            booking = await Booking.objects.aget()
+            self.assertRedirects(
+                response, reverse("booking_success", args=[booking.id]), fetch_redirect_response=False
+            )
+            await asyncio.gather(*async_views._background_tasks)
+
+        handler.assert_called_once()
+        self.assertEqual(handler.call_args.args[0]["booking_id"], booking.id)
+        event = await OutboxEvent.objects.aget()
+        self.assertEqual(event.status, "sent")
+
+    async def test_failed_background_delivery_is_left_to_the_dispatcher(self):
+        handler = mock.Mock(side_effect=RuntimeError("boom"))
+        with mock.patch.dict(outbox.HANDLERS, {"booking.created": handler}), \
+                self.assertLogs("accommodation.outbox", "WARNING"):
+            await self.book()
+            await asyncio.gather(*async_views._background_tasks)
+
+        event = await OutboxEvent.objects.aget()
+        self.assertEqual((event.status, event.attempts, event.last_error), ("pending", 1, "boom"))
+
+    async def test_booking_taken_nights_answers_conflict(self):
+        with mock.patch("accommodation.async_views.outbox.adeliver", new=mock.AsyncMock()) as adeliver:
+            await self.book()
+            response = await self.book("2026-03-03", "2026-03-06")
+
+        self.assertContains(response, ROOM_TAKEN, status_code=409)
+        self.assertEqual(await Booking.objects.acount(), 1)
+        adeliver.assert_awaited_once()
+
+    async def test_booking_answers_busy_when_the_database_is_locked(self):
+        with mock.patch(
+            "accommodation.async_views._create_booking",
+            side_effect=OperationalError("database is locked"),
+        ), mock.patch("accommodation.async_views.outbox.adeliver", new=mock.AsyncMock()) as adeliver:
+            response = await self.book()
+
+        self.assertContains(response, BOOKING_BUSY, status_code=503)
+        self.assertFalse(await Booking.objects.aexists())
+        adeliver.assert_not_awaited()
+
+    async def test_support_ticket_is_handed_to_the_buffered_producer(self):
+        ticket = {
+            "name": "Guest",
+            "email": "guest@example.com",
+            "room": "A1",
+            "subject": "Heating",
+            "message": "The radiator is cold.",
+        }
+        with mock.patch("accommodation.async_views.get_buffered_producer") as producer:
+            response = await self.async_client.post(reverse("support_ticket"), ticket)
+
+        self.assertEqual(response.status_code, 200)
+        producer.assert_called_once_with(async_views.SUPPORT_QUEUE, spool_dir=settings.SQS_SPOOL_DIR)
+        sent = json.loads(producer.return_value.send_message.call_args.args[0])
+        self.assertEqual({key: sent[key] for key in ticket}, ticket)
+        self.assertIn("created_at", sent)
+
+    async def test_manager_next_ticket_stores_and_deletes_the_message(self):
+        sqs = boto3.client("sqs", region_name="us-east-1")
+        queue_url = sqs.create_queue(QueueName=async_views.SUPPORT_QUEUE)["QueueUrl"]
+        sqs.send_message(QueueUrl=queue_url, MessageBody=json.dumps({
+            "name": "Guest",
+            "email": "guest@example.com",
+            "subject": "Heating",
+            "message": "The radiator is cold.",
+        }))
+
+        response = await self.async_client.post(reverse("manager_next_ticket"))
+        self.assertContains(response, "saved and removed from the SQS queue")
+        self.assertEqual((await SupportTicket.objects.aget()).subject, "Heating")
+
+        response = await self.async_client.post(reverse("manager_next_ticket"))
+        self.assertContains(response, "No support ticket was waiting")
+        self.assertEqual(await SupportTicket.objects.acount(), 1)
+
+    def stored_keys(self):
+        listing = boto3.client("s3", region_name="us-east-1").list_objects_v2(
+            Bucket=settings.AWS_STORAGE_BUCKET_NAME
+        )
+        return [item["Key"] for item in listing.get("Contents", [])]
+
+    async def post_image(self, data):
+        return await self.async_client.post(
+            reverse("manage_room_image", args=[self.room.id]), data
+        )
+
+    def give_room_an_image(self):
+        self.room.image.save("existing.png", image_file(), save=False)
+        Room.objects.filter(pk=self.room.pk).update(image=self.room.image.name)
+        return self.room.image.name
+
+    async def test_new_image_is_uploaded(self):
+        response = await self.post_image({"image": image_file()})
+
+        self.assertRedirects(response, reverse("manager_room_list"), fetch_redirect_response=False)
+        await self.room.arefresh_from_db()
+        self.assertTrue(self.room.image.name.startswith("rooms/room"))
+        self.assertEqual(await sync_to_async(self.stored_keys)(), [self.room.image.name])
+        self.assertTrue(await OutboxEvent.objects.filter(event_type="room_image.process").aexists())
+
+    async def test_clearing_the_image_uploads_nothing(self):
+        await sync_to_async(self.give_room_an_image)()
+
+        with mock.patch("accommodation.async_views.run_async") as run:
+            response = await self.post_image({"image-clear": "on"})
+
+        self.assertEqual(response.status_code, 302)
+        run.assert_not_called()
+        await self.room.arefresh_from_db()
+        self.assertFalse(self.room.image)
+
+    async def test_unchanged_image_is_not_uploaded_again(self):
+        name = await sync_to_async(self.give_room_an_image)()
+
+        with mock.patch("accommodation.async_views.run_async") as run:
+            response = await self.post_image({})
+
+        self.assertEqual(response.status_code, 302)
+        run.assert_not_called()
+        await self.room.arefresh_from_db()
+        self.assertEqual(self.room.image.name, name)
+
+
+class RateCalendarTests(TestCase):
+    def setUp(self):
+        self.room = make_room()
+
+    def rate(self, night, room=None):
+        """Nightly rate in cents that the stored calendar quotes."""
+        return get_calendar(room or self.room).rate_for(night)
+
+    def add_rule(self, start, end, rate, **scope):
+        return RoomRate.objects.create(
+            start_date=start, end_date=end, nightly_rate=Decimal(rate), **scope
+        )
+
+    def dispatch_rate_events(self):
+        events = OutboxEvent.objects.filter(event_type="rate_rule.refresh", status="pending")
+        for event in events:
+            outbox.HANDLERS[event.event_type](event.payload)
+        return events.update(status="sent")
+
+    def test_stays_are_priced_from_prefix_sums(self):
+        calendar = RateCalendar(date(2026, 6, 1), 10000)
+        calendar.set_rates(date(2026, 6, 3), [15000, 15000])
+
+        self.assertEqual(calendar.stay_cents(date(2026, 6, 1), date(2026, 6, 3)), 20000)
+        self.assertEqual(calendar.stay_cents(date(2026, 6, 2), date(2026, 6, 4)), 25000)
+        self.assertEqual(calendar.stay_cents(date(2026, 6, 4), date(2026, 6, 6)), 25000)
+        # nights before and after the calendar are charged the default
+        self.assertEqual(calendar.stay_cents(date(2026, 5, 30), date(2026, 6, 7)), 90000)
+        self.assertEqual(calendar.stay_cents(date(2026, 6, 4), date(2026, 6, 4)), 0)
+
+        copy = RateCalendar.from_bytes(calendar.start, calendar.default_cents, *calendar.to_bytes())
+        self.assertEqual(copy.stay_cents(date(2026, 5, 30), date(2026, 6, 7)), 90000)
+
+    def test_overlapping_rules_and_window_edges(self):
+        self.add_rule(date(2026, 6, 1), date(2026, 6, 10), "80.00")
+        self.add_rule(date(2026, 6, 5), date(2026, 6, 7), "120.00", room_type="classic")
+        self.add_rule(date(2026, 6, 7), date(2026, 6, 7), "130.00", room_type="classic", priority=1)
+        self.add_rule(date(2026, 6, 6), date(2026, 6, 6), "200.00", room=self.room)
+
+        self.assertEqual(
+            [self.rate(date(2026, 6, day)) for day in range(1, 12)],
+            [8000, 8000, 8000, 8000, 12000, 20000, 13000, 8000, 8000, 8000, 10000],
+        )
+        self.assertEqual(self.rate(date(2026, 5, 31)), 10000)
+        # end_date is the last night charged at the rule's rate
+        self.assertEqual(
+            quote_stay(self.room, date(2026, 6, 10), date(2026, 6, 12)), Decimal("180.00")
+        )
+
+    def test_room_rule_refreshes_the_calendar_when_saved_or_deleted(self):
+        self.assertEqual(self.rate(date(2026, 6, 2)), 10000)
+
+        rule = self.add_rule(date(2026, 6, 1), date(2026, 6, 3), "150.00", room=self.room)
+        self.assertEqual(self.rate(date(2026, 6, 2)), 15000)
+
+        rule.start_date, rule.end_date = date(2026, 6, 10), date(2026, 6, 12)
+        rule.save()
+        self.assertEqual(self.rate(date(2026, 6, 2)), 10000)
+        self.assertEqual(self.rate(date(2026, 6, 12)), 15000)
+
+        rule.delete()
+        self.assertEqual(self.rate(date(2026, 6, 12)), 10000)
+
+    def test_wide_rules_are_refreshed_by_the_dispatcher(self):
+        other = make_room(name="B2", room_type="studio", price="90.00")
+        for room in (self.room, other):
+            self.rate(date(2026, 6, 2), room)  # stores the calendar
+
+        rule = self.add_rule(date(2026, 6, 1), date(2026, 6, 3), "70.00")
+        # the saving request leaves every room's calendar alone
+        self.assertEqual(self.rate(date(2026, 6, 2)), 10000)
+        self.assertEqual(self.dispatch_rate_events(), 1)
+        self.assertEqual(self.rate(date(2026, 6, 2)), 7000)
+        self.assertEqual(self.rate(date(2026, 6, 2), other), 7000)
+
+        rule.delete()
+        self.assertEqual(self.dispatch_rate_events(), 1)
+        self.assertEqual(self.rate(date(2026, 6, 2)), 10000)
+        self.assertEqual(self.rate(date(2026, 6, 2), other), 9000)
+
+    def test_type_change_rebuilds_the_calendar_without_reading_the_room(self):
+        self.add_rule(date(2026, 6, 1), date(2026, 6, 3), "150.00", room_type="premium")
+        self.dispatch_rate_events()
+        room = Room.objects.get(pk=self.room.pk)
+        self.assertEqual(self.rate(date(2026, 6, 2), room), 10000)
+
+        room.room_type = "premium"
+        with CaptureQueriesContext(connection) as queries:
+            room.save()
+
+        self.assertFalse([
+            query["sql"] for query in queries.captured_queries
+            if query["sql"].startswith("SELECT") and 'FROM "accommodation_room"' in query["sql"]
+        ])
+        self.assertEqual(self.rate(date(2026, 6, 2), room), 15000)
+
+
+class RoomReadCacheTests(MockAWSMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        create_rooms_table()
+        room_cache.clear()
+        self.addCleanup(room_cache.clear)
+        self.table = aws_clients.get_table(ROOMS_TABLE, ROOMS_REGION)
+        for number in range(1, 131):
+            self.table.put_item(Item={"room_id": str(number), "name": f"Room {number}"})
+
+    def rename(self, room_id, name):
+        self.table.put_item(Item={"room_id": str(room_id), "name": name})
+
+    def test_get_room_reads_through_the_cache(self):
+        self.assertEqual(get_room(1)["name"], "Room 1")
+        self.assertIsNone(get_room(999))
+        self.rename(1, "Renamed")
+        self.table.put_item(Item={"room_id": "999", "name": "New"})
+
+        # both answers, the missing room included, come from the cache
+        self.assertEqual(get_room(1)["name"], "Room 1")
+        self.assertIsNone(get_room(999))
+        self.assertEqual(get_room(1, consistent_read=True)["name"], "Room 1")
+
+        room_cache.invalidate(["1", "999"])
+        self.assertEqual(get_room(1)["name"], "Renamed")
+        self.assertEqual(get_room(999)["name"], "New")
+
+    def test_batch_get_rooms_chunks_and_caches(self):
+        ids = list(range(1, 131)) + [999]
+        resource = mock.Mock(wraps=aws_clients.get_resource("dynamodb", ROOMS_REGION))
+        with mock.patch("accommodation.dynamodb_client.get_resource", return_value=resource):
+            rooms = batch_get_rooms(ids)
+            self.assertEqual(resource.batch_get_item.call_count, 2)
+
+            self.assertEqual(len(rooms), 130)
+            # keyed by the ids as given
+            self.assertEqual(rooms[130]["name"], "Room 130")
+            self.assertEqual(batch_get_rooms(ids), rooms)
+            self.assertEqual(resource.batch_get_item.call_count, 2)
+        self.assertEqual(get_room(130)["name"], "Room 130")
+
+    def test_unprocessed_keys_are_retried(self):
+        first = {
+            "Responses": {ROOMS_TABLE: [{"room_id": "1", "name": "Room 1"}]},
+            "UnprocessedKeys": {ROOMS_TABLE: {"Keys": [{"room_id": "2"}]}},
+        }
+        second = {"Responses": {ROOMS_TABLE: [{"room_id": "2", "name": "Room 2"}]}}
+        resource = mock.Mock()
+        resource.batch_get_item.side_effect = [first, second]
+        with mock.patch("accommodation.dynamodb_client.get_resource", return_value=resource), \
+                mock.patch("accommodation.dynamodb_client.time.sleep") as sleep:
+            rooms = batch_get_rooms([1, 2])
+
+        self.assertEqual(sorted(rooms), [1, 2])
+        self.assertEqual(
+            resource.batch_get_item.call_args.kwargs["RequestItems"],
+            {ROOMS_TABLE: {"Keys": [{"room_id": "2"}]}},
+        )
+        sleep.assert_called_once()
+
+    def test_write_behind_writes_invalidate_the_cache(self):
+        self.assertEqual(get_room(1)["name"], "Room 1")
+        queue = WriteBehindQueue(flush_interval=60, on_written=room_cache.invalidate)
+        self.addCleanup(queue.stop, timeout=1)
+
+        queue.put({"room_id": "1", "name": "Renamed"})
+        self.assertEqual(get_room(1)["name"], "Room 1")
+        self.assertEqual(queue.flush(), [])
+
+        self.assertEqual(get_room(1)["name"], "Renamed")
+
+    def test_entries_expire_and_the_oldest_is_evicted(self):
+        cache = TTLCache(maxsize=2, ttl=30.0)
+        with mock.patch("accommodation.dynamodb_client.time.monotonic", return_value=1000.0) as now:
+            cache.set("a", 1)
+            cache.set("b", 2)
+            now.return_value = 1029.0
+            self.assertEqual(cache.get("a"), 1)
+            cache.set("c", 3)
+            # "b" was the least recently used
+            self.assertEqual((cache.get("a"), cache.get("b"), cache.get("c")), (1, None, 3))
+
+            now.return_value = 1031.0
+            self.assertIsNone(cache.get("a"))
+            self.assertEqual(cache.get("c"), 3)
+            self.assertEqual(cache.get("a", "default"), "default")
+
+    def test_reads_started_before_an_invalidation_are_not_stored(self):
+        cache = TTLCache()
+        generation = cache.generation()
+        cache.invalidate(["a"])
+
+        cache.set("a", "stale", generation)
+        self.assertIsNone(cache.get("a"))
+        cache.set("a", "fresh", cache.generation())
+        self.assertEqual(cache.get("a"), "fresh")
+
+
+class ImageURLTests(MockAWSMixin, TestCase):
+    variants = {
+        "source": "rooms/loft.jpg",
+        "variants": {
+            "retina": {
+                "width": 960,
+                "height": 640,
+                "webp": "rooms/loft.retina.webp",
+                "jpeg": "rooms/loft.retina.jpg",
+            },
+            "card": {
+                "width": 480,
+                "height": 320,
+                "webp": "rooms/loft.card.webp",
+                "jpeg": "rooms/loft.card.jpg",
+            },
+        },
+    }
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.loft = make_room(name="Loft", image="rooms/loft.jpg", image_variants=self.variants)
+        self.plain = make_room(name="Plain")
+
+    def attach(self):
+        with mock.patch("accommodation.image_urls._sign", wraps=image_urls._sign) as sign, \
+                mock.patch.object(cache, "get_many", wraps=cache.get_many) as get_many:
+            rooms = image_urls.attach_image_urls(Room.objects.order_by("name"))
+        return rooms, sign, get_many
+
+    def test_urls_are_signed_in_one_batch(self):
+        (loft, plain), sign, get_many = self.attach()
+
+        get_many.assert_called_once()
+        self.assertEqual(len(get_many.call_args.args[0]), 5)
+        self.assertEqual(
+            sorted(call.args[2] for call in sign.call_args_list),
+            sorted(["rooms/loft.jpg"] + [
+                key for info in self.variants["variants"].values()
+                for fmt, key in info.items() if fmt in ("webp", "jpeg")
+            ]),
+        )
+        self.assertIn("/rooms/loft.jpg?", loft.image_src)
+        webp = loft.image_srcset["webp"].split(", ")
+        self.assertEqual([entry.rsplit(" ", 1)[1] for entry in webp], ["480w", "960w"])
+        self.assertIn("/rooms/loft.card.webp?", webp[0])
+
+    def test_rooms_without_an_image_are_skipped(self):
+        (loft, plain), sign, _ = self.attach()
+
+        self.assertEqual((plain.image_src, plain.image_srcset), ("", {}))
+        self.assertEqual(sign.call_count, 5)
+
+    def test_cached_urls_are_handed_out_again(self):
+        (first, _), _, _ = self.attach()
+        (again, _), sign, _ = self.attach()
+
+        sign.assert_not_called()
+        self.assertEqual((again.image_src, again.image_srcset), (first.image_src, first.image_srcset))
+
+
+class CatalogueTests(TestCase):
+    def setUp(self):
+        # committed saves would reach the shared DynamoDB write-behind
+        # queue and be flushed into a later test's moto table
+        sync = mock.patch("accommodation.signals.get_room_queue")
+        sync.start()
+        self.addCleanup(sync.stop)
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.rooms = [make_room(name=name) for name in ("A1", "A2", "A3")]
+
+    def names(self, size=catalogue.PAGE_SIZE):
+        rooms, _ = catalogue.get_page(size=size)
+        return [room.name for room in rooms]
+
+    def lock_rebuild(self, size=catalogue.PAGE_SIZE):
+        """As if another process were rebuilding the current first page."""
+        cache.add(f"room-catalogue:{catalogue.current_version()}:0:{size}:lock", 1)
+
+    def test_pages_follow_the_room_ids(self):
+        rooms, next_after = catalogue.get_page(size=2)
+        self.assertEqual([room.name for room in rooms], ["A1", "A2"])
+        self.assertEqual(rooms[0].room_type_display, "Classic Room")
+
+        rooms, next_after = catalogue.get_page(after=next_after, size=2)
+        self.assertEqual(([room.name for room in rooms], next_after), (["A3"], None))
+
+    def test_room_changes_bump_the_version(self):
+        version = catalogue.current_version()
+        self.assertEqual(self.names(), ["A1", "A2", "A3"])
+
+        with mock.patch("accommodation.catalogue._build_page") as build:
+            self.assertEqual(self.names(), ["A1", "A2", "A3"])
+        build.assert_not_called()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            make_room(name="A4")
+        self.assertEqual(catalogue.current_version(), version + 1)
+        self.assertEqual(self.names(), ["A1", "A2", "A3", "A4"])
+
+    def test_a_lost_version_restarts_above_any_stored_one(self):
+        version = catalogue.current_version()
+        cache.delete(catalogue.VERSION_KEY)
+
+        catalogue.invalidate()
+
+        self.assertGreater(catalogue.current_version(), version)
+
+    def test_last_good_snapshot_is_served_while_another_process_rebuilds(self):
+        self.names()
+        with self.captureOnCommitCallbacks(execute=True):
+            make_room(name="A4")
+        self.lock_rebuild()
+
+        with mock.patch("accommodation.catalogue._build_page") as build:
+            self.assertEqual(self.names(), ["A1", "A2", "A3"])
+        build.assert_not_called()
+
+    def test_without_a_snapshot_the_page_is_built_after_waiting(self):
+        self.lock_rebuild()
+
+        with mock.patch.object(catalogue, "REBUILD_WAIT", 0.1):
+            self.assertEqual(self.names(), ["A1", "A2", "A3"])
+
+    def test_process_local_cache_is_flagged(self):
+        self.assertEqual(catalogue.check_shared_cache(None), [])
+        locmem = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+        with override_settings(CACHES=locmem):
+            warnings = catalogue.check_shared_cache(None)
+        self.assertEqual([warning.id for warning in warnings], ["accommodation.W001"])
+
+
+class BookingFeedTests(TestCase):
+    email = "guest@example.com"
+
+    def setUp(self):
+        self.room = make_room()
+        moment = timezone.now()
+        self.bookings = []
+        for n in range(7):
+            booking = Booking.objects.create(
+                room=self.room,
+                user_email=self.email,
+                check_in=date(2026, 3, 1) + timedelta(days=2 * n),
+                check_out=date(2026, 3, 2) + timedelta(days=2 * n),
+                total_price=Decimal("100.00"),
+            )
+            self.bookings.append(booking)
+        # three bookings made in the same instant share a created_at
+        for n, booking in enumerate(self.bookings):
+            booking.created_at = moment - timedelta(minutes=min(n, 4))
+        Booking.objects.bulk_update(self.bookings, ["created_at"])
+        Booking.objects.create(
+            room=self.room,
+            user_email="someone@example.com",
+            check_in=date(2026, 4, 1),
+            check_out=date(2026, 4, 2),
+            total_price=Decimal("100.00"),
+        )
+
+    def test_pages_run_newest_first_without_gaps_or_repeats(self):
+        seen, cursor = [], None
+        while True:
+            with self.assertNumQueries(1):
+                page, cursor = booking_feed.get_page(self.email, cursor, size=2)
+                # the room is joined in the same query
+                self.assertEqual({booking.room.name for booking in page}, {"A1"})
+            seen.extend(booking.id for booking in page)
+            if cursor is None:
+                break
+
+        expected = sorted(self.bookings, key=lambda b: (b.created_at, b.id), reverse=True)
+        self.assertEqual(seen, [booking.id for booking in expected])
+
+    def test_last_full_page_has_no_cursor(self):
+        page, cursor = booking_feed.get_page(self.email, size=7)
+        self.assertEqual((len(page), cursor), (7, None))
+
+    def test_garbled_cursor_starts_from_the_newest(self):
+        first, _ = booking_feed.get_page(self.email, size=3)
+        for cursor in ("nonsense", "2026-03-01_x", ""):
+            page, _ = booking_feed.get_page(self.email, cursor, size=3)
+            self.assertEqual(page, first)
+
+    def test_my_bookings_follows_the_cursor(self):
+        self.client.force_login(User.objects.create_user(self.email, password="x"))
+        newest, _ = booking_feed.get_page(self.email, size=3)
+
+        response = self.client.get(
+            reverse("my_bookings"), {"before": booking_feed.encode_cursor(newest[-1])}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        shown = [booking.id for booking in response.context["bookings"]]
+        self.assertEqual(len(shown), 4)
+        self.assertFalse(set(shown) & {booking.id for booking in newest})
+        self.assertIsNone(response.context["next_cursor"])
+
+
+class ConsumerWorkerTests(MockAWSMixin, TestCase):
+    queue_name = "yugo-test-queue"
+
+    def setUp(self):
+        super().setUp()
+        self.sqs = boto3.client("sqs", region_name="us-east-1")
+        self.queue_url = self.sqs.create_queue(QueueName=self.queue_name)["QueueUrl"]
+        self.client_spy = mock.Mock(wraps=aws_clients.get_client("sqs"))
+        patcher = mock.patch("consumer.get_client", return_value=self.client_spy)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def send(self, *bodies):
+        for body in bodies:
+            self.sqs.send_message(QueueUrl=self.queue_url, MessageBody=body)
+
+    def run_worker(self, worker, until):
+        thread = threading.Thread(target=worker.run)
+        thread.start()
+        deadline = time.monotonic() + 10
+        while not until() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        worker.stop()
+        thread.join(timeout=15)
+        self.assertFalse(thread.is_alive())
+
+    def queue_counts(self):
+        attributes = self.sqs.get_queue_attributes(
+            QueueUrl=self.queue_url,
+            AttributeNames=["ApproximateNumberOfMessages", "ApproximateNumberOfMessagesNotVisible"],
+        )["Attributes"]
+        return (
+            int(attributes["ApproximateNumberOfMessages"]),
+            int(attributes["ApproximateNumberOfMessagesNotVisible"]),
+        )
+
+    def test_messages_are_received_and_deleted_in_batches(self):
+        bodies = [f"ticket {n}" for n in range(15)]
+        self.send(*bodies)
+        handled = []
+        worker = ConsumerWorker(self.queue_name, handler=handled.append, workers=2, wait_time=1)
+
+        self.run_worker(worker, lambda: worker.processed == 15)
+
+        self.assertEqual(sorted(handled), sorted(bodies))
+        self.assertEqual((worker.processed, worker.failed), (15, 0))
+        self.assertEqual(self.queue_counts(), (0, 0))
+        receives = self.client_spy.receive_message.call_args_list
+        self.assertTrue(all(1 <= call.kwargs["MaxNumberOfMessages"] <= 10 for call in receives))
+        deletes = [
+            len(call.kwargs["Entries"]) for call in self.client_spy.delete_message_batch.call_args_list
+        ]
+        self.assertEqual(sum(deletes), 15)
+        self.assertLessEqual(max(deletes), 10)
+
+    def test_failed_messages_stay_on_the_queue(self):
+        self.send("good", "bad")
+
+        def handler(body):
+            if body == "bad":
+                raise ValueError(body)
+
+        worker = ConsumerWorker(self.queue_name, handler=handler, workers=2, wait_time=1)
+        with self.assertLogs("consumer", "ERROR"):
+            self.run_worker(worker, lambda: worker.processed + worker.failed == 2)
+
+        self.assertEqual((worker.processed, worker.failed), (1, 1))
+        # "bad" is hidden until its visibility timeout runs out, then redelivered
+        self.assertEqual(self.queue_counts(), (0, 1))
+
+    def test_receive_errors_are_retried(self):
+        self.send("ticket")
+        receive = self.client_spy.receive_message
+        calls = []
+
+        def flaky_receive(**kwargs):
+            calls.append(kwargs)
+            if len(calls) == 1:
+                raise ClientError({"Error": {"Code": "ServiceUnavailable"}}, "ReceiveMessage")
+            return aws_clients.get_client("sqs").receive_message(**kwargs)
+
+        receive.side_effect = flaky_receive
+        worker = ConsumerWorker(self.queue_name, handler=lambda body: None, workers=1, wait_time=1)
+        with self.assertLogs(level="ERROR"):
+            self.run_worker(worker, lambda: worker.processed == 1)
+
+        self.assertGreaterEqual(len(calls), 2)
+        self.assertEqual(worker.processed, 1)
+
+    def test_slow_messages_get_more_visibility_time(self):
+        self.send("slow", "fast")
+        messages = self.sqs.receive_message(
+            QueueUrl=self.queue_url, MaxNumberOfMessages=2, VisibilityTimeout=30
+        )["Messages"]
+        worker = ConsumerWorker(self.queue_name, visibility_timeout=30)
+        now = time.monotonic()
+        deadlines = {"slow": now + 5, "fast": now + 25}
+        for message in messages:
+            worker._in_flight[message["MessageId"]] = [
+                message["ReceiptHandle"], deadlines[message["Body"]]
+            ]
+
+        worker._extend_visibility(self.client_spy, self.queue_url)
+
+        (call,) = self.client_spy.change_message_visibility_batch.call_args_list
+        slow = next(m for m in messages if m["Body"] == "slow")
+        self.assertEqual(
+            call.kwargs["Entries"],
+            [{"Id": "0", "ReceiptHandle": slow["ReceiptHandle"], "VisibilityTimeout": 30}],
+        )
+        self.assertGreaterEqual(worker._in_flight[slow["MessageId"]][1], now + 30)
+
+
+class RoomImageMixin(MockAWSMixin):
+    def setUp(self):
+        super().setUp()
+        boto3.client("s3", region_name="us-east-1").create_bucket(
+            Bucket=settings.AWS_STORAGE_BUCKET_NAME
+        )
+
+    def room_with_image(self, name="Loft", size=(2000, 1000)):
+        room = make_room(name=name)
+        room.image.save(f"{name.lower()}.png", image_file(size=size), save=False)
+        Room.objects.filter(pk=room.pk).update(image=room.image.name)
+        return room
+
+    def assertVariantsStored(self, room):
+        room.refresh_from_db()
+        variants = room.image_variants["variants"]
+        self.assertEqual(room.image_variants["source"], room.image.name)
+        self.assertEqual(
+            {name: info["width"] for name, info in variants.items()},
+            {"card": 480, "retina": 960, "hero": 1600},
+        )
+        for info in variants.values():
+            for fmt, pil_format in (("webp", "WEBP"), ("jpeg", "JPEG")):
+                with default_storage.open(info[fmt], "rb") as fh, Image.open(fh) as image:
+                    self.assertEqual(image.format, pil_format)
+                    self.assertEqual(image.size, (info["width"], info["height"]))
+
+
+class RoomImageTests(RoomImageMixin, TestCase):
+    def test_variants_keep_the_aspect_ratio_and_never_upscale(self):
+        rendered = images.render_variants(image_file(size=(600, 300)).read())
+
+        self.assertEqual(
+            {name: (out["width"], out["height"]) for name, out in rendered.items()},
+            {"card": (480, 240), "retina": (600, 300), "hero": (600, 300)},
+        )
+        with Image.open(BytesIO(rendered["card"]["webp"])) as image:
+            self.assertEqual((image.format, image.size), ("WEBP", (480, 240)))
+        self.assertEqual(images.variant_name("rooms/loft.png", "card", "jpeg"), "rooms/loft.card.jpg")
+
+    def test_variants_are_rendered_in_a_process_pool_and_stored(self):
+        room = self.room_with_image()
+
+        with images.new_pool(1) as pool:
+            images.process_room_image(room, pool=pool)
+            self.assertVariantsStored(room)
+            old = [info["webp"] for info in room.image_variants["variants"].values()]
+
+            # a new image replaces the old variants
+            room.image.save("attic.png", image_file(size=(800, 400)), save=False)
+            Room.objects.filter(pk=room.pk).update(image=room.image.name)
+            images.process_room_image(room, pool=pool)
+
+        for name in old:
+            self.assertFalse(default_storage.exists(name))
+        room.refresh_from_db()
+        self.assertEqual(room.image_variants["variants"]["hero"]["width"], 800)
+
+
+class ProcessRoomImagesCommandTests(RoomImageMixin, TransactionTestCase):
+    # the command saves rooms from its transfer threads, which only see
+    # committed rows
+
+    def setUp(self):
+        super().setUp()
+        # the committed rooms are not for the shared DynamoDB sync queue
+        sync = mock.patch("accommodation.signals.get_room_queue")
+        sync.start()
+        self.addCleanup(sync.stop)
+
+    def test_command_processes_every_image_in_the_pool(self):
+        rooms = [self.room_with_image(name) for name in ("Loft", "Attic")]
+        make_room(name="Plain")
+
+        out = StringIO()
+        call_command("process_room_images", workers=2, threads=2, stdout=out)
+
+        self.assertIn("processed 2 images", out.getvalue())
+        self.assertIn("0 failed", out.getvalue())
+        for room in rooms:
+            self.assertVariantsStored(room)
+
+        call_command("process_room_images", missing=True, stdout=out)
+        self.assertIn("no room images to process", out.getvalue())
+
+
+class SyncDirectoryTests(MockAWSMixin, TestCase):
+    bucket = "yugo-sync-test"
+
+    def setUp(self):
+        super().setUp()
+        boto3.client("s3", region_name="us-east-1").create_bucket(Bucket=self.bucket)
+        self.local_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.local_dir)
+        self.write("index.html", b"<h1>Yugo</h1>")
+        self.write("img/room.png", b"png" * 100)
+
+    def write(self, rel_path, data):
+        path = os.path.join(self.local_dir, rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as fh:
+            fh.write(data)
+
+    def sync(self, **kwargs):
+        with mock.patch.object(s3_utils, "local_etag", wraps=s3_utils.local_etag) as etag:
+            result = s3_utils.sync_directory(
+                self.local_dir, self.bucket, prefix="site", workers=2, out=None, **kwargs
+            )
+        hashed = sorted(os.path.relpath(c.args[0], self.local_dir) for c in etag.call_args_list)
+        return result, hashed
+
+    def test_resync_only_reads_and_uploads_changed_files(self):
+        result, hashed = self.sync()
+        self.assertEqual((result["uploaded"], result["skipped"]), (2, 0))
+        self.assertEqual(hashed, ["img/room.png", "index.html"])
+        self.assertTrue(os.path.exists(os.path.join(self.local_dir, s3_utils.SYNC_CACHE_NAME)))
+        # the cache itself stays local
+        self.assertEqual(
+            set(s3_utils.list_objects(self.bucket, "site/")), {"site/index.html", "site/img/room.png"}
+        )
+
+        result, hashed = self.sync()
+        self.assertEqual((result["uploaded"], result["skipped"]), (0, 2))
+        self.assertEqual(hashed, [])
+
+        self.write("index.html", b"<h1>Yugo Leeds</h1>")
+        result, hashed = self.sync()
+        self.assertEqual((result["uploaded"], result["skipped"]), (1, 1))
+        self.assertEqual(hashed, ["index.html"])
+
+    def test_lost_cache_rehashes_but_does_not_reupload(self):
+        self.sync()
+        os.remove(os.path.join(self.local_dir, s3_utils.SYNC_CACHE_NAME))
+
+        result, hashed = self.sync()
+
+        self.assertEqual((result["uploaded"], result["skipped"]), (0, 2))
+        self.assertEqual(len(hashed), 2)
+
+    def test_multipart_etag_matches_s3(self):
+        config = s3_utils.TransferConfig(
+            multipart_threshold=5 * s3_utils.MB, multipart_chunksize=5 * s3_utils.MB
+        )
+        self.write("video.mp4", os.urandom(6 * s3_utils.MB))
+        self.sync(config=config)
+        os.remove(os.path.join(self.local_dir, s3_utils.SYNC_CACHE_NAME))
+
+        result, _ = self.sync(config=config)
+
+        self.assertEqual((result["uploaded"], result["skipped"]), (0, 3))
+        self.assertTrue(s3_utils.list_objects(self.bucket)["site/video.mp4"][1].endswith("-2"))
+
+    def test_delete_removes_objects_with_no_local_file(self):
+        self.sync()
+        os.remove(os.path.join(self.local_dir, "img", "room.png"))
+
+        result, _ = self.sync(delete=True, dry_run=True)
+        self.assertEqual(result["deleted"], 1)
+        self.assertIn("site/img/room.png", s3_utils.list_objects(self.bucket))
+
+        result, _ = self.sync(delete=True)
+        self.assertEqual(result["deleted"], 1)
+        self.assertEqual(set(s3_utils.list_objects(self.bucket)), {"site/index.html"})
+
+    def test_list_buckets_returns_the_names(self):
+        self.assertEqual(s3_utils.list_buckets(), [self.bucket])
+
+
+def sample(metric, labels):
+    """A metric's current value (a histogram's observation count) for labels."""
+    value = metric._values.get(labels, 0)
+    return sum(value[0]) if isinstance(value, list) else value
+
+
+class AWSMetricsTests(MockAWSMixin, TestCase):
+    def test_calls_are_counted_by_outcome(self):
+        s3 = aws_clients.get_client("s3")
+        ok = ("s3", "ListBuckets")
+        missing = ("s3", "HeadBucket")
+        before = (
+            sample(aws_metrics.requests_total, ok + ("ok", "")),
+            sample(aws_metrics.request_duration, ok),
+            sample(aws_metrics.response_bytes, ok),
+            sample(aws_metrics.requests_total, missing + ("error", "404")),
+        )
+
+        s3.list_buckets()
+        with self.assertRaises(ClientError):
+            s3.head_bucket(Bucket="no-such-bucket")
+
+        after = (
+            sample(aws_metrics.requests_total, ok + ("ok", "")),
+            sample(aws_metrics.request_duration, ok),
+            sample(aws_metrics.response_bytes, ok),
+            sample(aws_metrics.requests_total, missing + ("error", "404")),
+        )
+        self.assertEqual([b - a for a, b in zip(before, after)], [1, 1, 1, 1])
+        self.assertIn('aws_requests_total{service="s3",operation="ListBuckets",outcome="ok"',
+                      aws_metrics.render())
+
+    def test_dynamodb_capacity_is_requested_and_counted(self):
+        create_table("MetricsRooms")
+        table = aws_clients.get_resource("dynamodb").Table("MetricsRooms")
+        labels = ("MetricsRooms", "PutItem", "total")
+        before = sample(aws_metrics.capacity_units, labels)
+
+        response = table.put_item(Item={"room_id": "1"})
+
+        self.assertIn("ConsumedCapacity", response)
+        self.assertGreater(sample(aws_metrics.capacity_units, labels), before)
+
+    def test_throttled_attempts_are_counted(self):
+        operation = mock.Mock()
+        operation.service_model.service_name = "sqs"
+        operation.name = "SendMessage"
+        labels = ("sqs", "SendMessage", "ThrottlingException")
+        before = sample(aws_metrics.throttles_total, labels)
+
+        throttled = (None, {"Error": {"Code": "ThrottlingException"}})
+        self.assertIsNone(aws_metrics._needs_retry(response=throttled, operation=operation))
+        aws_metrics._needs_retry(response=(None, {}), operation=operation)
+
+        self.assertEqual(sample(aws_metrics.throttles_total, labels), before + 1)
+
+
+@override_settings(METRICS_TOKEN="s3cret")
+class MetricsViewTests(TestCase):
+    def get(self, **headers):
+        return self.client.get(reverse("metrics"), **headers)
+
+    def test_scraper_with_the_token_reads_metrics(self):
+        response = self.get(HTTP_AUTHORIZATION="Bearer s3cret")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("yugo_outbox_depth", response.content.decode())
+
+    def test_staff_read_metrics_without_the_token(self):
+        self.client.force_login(User.objects.create_user("ops", password="x", is_staff=True))
+
+        self.assertEqual(self.get().status_code, 200)
+
+    def test_everyone_else_is_forbidden(self):
+        self.assertEqual(self.get().status_code, 403)
+        self.assertEqual(self.get(HTTP_AUTHORIZATION="Bearer wrong").status_code, 403)
+        self.client.force_login(User.objects.create_user("guest", password="x"))
+        self.assertEqual(self.get().status_code, 403)
+
+    @override_settings(METRICS_TOKEN="")
+    def test_no_token_configured_means_staff_only(self):
+        self.assertEqual(self.get(HTTP_AUTHORIZATION="Bearer ").status_code, 403)
+
+
+REPLICA = "replica1"
+
+
+@override_settings(DATABASE_REPLICAS=[REPLICA], DATABASE_PIN_SECONDS=7)
+class PrimaryReplicaRoutingTests(TransactionTestCase):
+    # A connection to the test database under a replica alias, like the
+    # TEST MIRROR settings.py gives YUGO_DB_REPLICAS. Added after Django's
+    # class setup, which would block queries to an alias not in
+    # ``databases``; a TransactionTestCase, so it sees committed rows.
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        primary = connections["default"].settings_dict
+        connections.settings[REPLICA] = dict(primary, TEST=dict(primary["TEST"], MIRROR="default"))
+
+    @classmethod
+    def tearDownClass(cls):
+        connections[REPLICA].close()
+        del connections[REPLICA]
+        del connections.settings[REPLICA]
+        super().tearDownClass()
+
+    def setUp(self):
+        sync = mock.patch("accommodation.signals.get_room_queue")
+        sync.start()
+        self.addCleanup(sync.stop)
+        cache.clear()
+        self.addCleanup(cache.clear)
+        make_room()
+
+    def request(self, method, url, data=None):
+        """The response and the tables each alias was asked to read."""
+        with CaptureQueriesContext(connections["default"]) as primary, \
+                CaptureQueriesContext(connections[REPLICA]) as replica:
+            response = getattr(self.client, method)(url, data)
+        return response, self.tables(primary), self.tables(replica)
+
+    def tables(self, queries):
+        return {
+            table
+            for query in queries
+            for table in ("accommodation_room", "accommodation_roomnight", "auth_user")
+            if f'"{table}"' in query["sql"]
+        }
+
+    def test_read_only_requests_read_from_the_replica(self):
+        response, primary, replica = self.request("get", reverse("home"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(replica, {"accommodation_roomnight"})
+        # the shared catalogue page is always built from the primary
+        self.assertEqual(primary, {"accommodation_room"})
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_writes_go_to_the_primary_and_pin_the_browser(self):
+        response, primary, replica = self.request("post", reverse("signup"), {
+            "username": "guest",
+            "password1": "a-long-passphrase",
+            "password2": "a-long-passphrase",
+        })
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(primary, {"auth_user"})
+        self.assertEqual(replica, set())
+        self.assertEqual(response.cookies[PIN_COOKIE]["max-age"], 7)
+
+        # within the pin window even the read-only pages use the primary
+        _, primary, replica = self.request("get", reverse("home"))
+        self.assertIn("accommodation_roomnight", primary)
+        self.assertEqual(replica, set())
+
+        # once the cookie expired the replica serves them again
+        del self.client.cookies[PIN_COOKIE]
+        _, primary, replica = self.request("get", reverse("home"))
+        self.assertEqual(replica, {"auth_user", "accommodation_roomnight"})
+        self.assertNotIn("accommodation_roomnight", primary)
+
+    def test_a_write_pins_the_rest_of_the_request(self):
+        seen = []
+
+        def view(request):
+            seen.append(Room.objects.all().db)
+            with transaction.atomic():
+                seen.append(Room.objects.all().db)
+            seen.append(Room.objects.all().db)
+            make_room(name="A2")
+            seen.append(Room.objects.all().db)
+            return HttpResponse()
+
+        response = PrimaryPinMiddleware(view)(RequestFactory().get("/"))
+
+        self.assertEqual(seen, [REPLICA, "default", REPLICA, "default"])
+        self.assertIn(PIN_COOKIE, response.cookies)
+        # outside a request everything reads from the primary
+        self.assertEqual(Room.objects.all().db, "default")
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        self.rooms = [
+            make_room(name="A1"),
+            make_room(name="A2"),
+            make_room(name="P1", room_type="premium"),
+            make_room(name="Y1", location="York", room_type="studio"),
+        ]
+
+    def rollup_rows(self):
+        # the incremental path leaves emptied rows at zero; rebuild drops them
+        return sorted(
+            LocationDayRollup.objects.exclude(room_nights=0, revenue=0)
+            .values_list("location", "room_type", "day", "room_nights", "revenue")
+        )
+
+    def book(self, room, check_in, nights, total_price):
+        booking = Booking.objects.create(
+            room=room,
+            user_email="guest@example.com",
+            check_in=check_in,
+            check_out=check_in + timedelta(days=nights),
+            total_price=total_price,
+        )
+        try:
+            reserve_nights(booking)
+        except RoomUnavailable:
+            booking.delete()
+            return None
+        return booking
+
+    def test_rebuild_matches_the_incremental_counts(self):
+        rng = random.Random(24)
+        bookings = []
+        for _ in range(60):
+            booking = self.book(
+                rng.choice(self.rooms),
+                date(2026, 6, 1) + timedelta(days=rng.randrange(30)),
+                rng.randint(1, 5),
+                Decimal(rng.randrange(5000, 90000)) / 100,
+            )
+            if booking:
+                bookings.append(booking)
+
+        for booking in rng.sample(bookings, 15):
+            action = rng.choice(("move", "cancel", "delete"))
+            if action == "move":
+                booking.check_in += timedelta(days=rng.randint(-3, 3))
+                booking.check_out = booking.check_in + timedelta(days=rng.randint(1, 4))
+                try:
+                    move_nights(booking)
+                except RoomUnavailable:
+                    continue
+            else:
+                release_nights(booking)
+                if action == "delete":
+                    booking.delete()
+
+        incremental = self.rollup_rows()
+        self.assertTrue(incremental)
+        self.assertEqual(
+            sum(row[3] for row in incremental), RoomNight.objects.count()
+        )
+
+        rollups.rebuild(batch_size=7)
+        self.assertEqual(self.rollup_rows(), incremental)
+
+    def test_night_revenue_adds_up_to_the_price(self):
+        nights = [date(2026, 6, day) for day in (1, 2, 3)]
+
+        shares = rollups.night_revenue(Decimal("100.00"), nights)
+
+        self.assertEqual([revenue for _, revenue in shares],
+                         [Decimal("33.33"), Decimal("33.33"), Decimal("33.34")])
+        self.assertEqual(rollups.night_revenue(Decimal("10"), []), [])
+
+    def test_command_backfills_revenue_and_repairs_drift(self):
+        room = self.rooms[0]
+        booking = self.book(room, date(2026, 6, 1), 2, Decimal("150.00"))
+        expected = self.rollup_rows()
+
+        # nights from before revenue was recorded, and a room moved to
+        # another location behind the rollups' back
+        RoomNight.objects.filter(booking=booking).update(revenue=0)
+        LocationDayRollup.objects.filter(day=date(2026, 6, 1)).update(room_nights=5)
+        out = StringIO()
+        call_command("rebuild_rollups", stdout=out)
+
+        self.assertIn("set the revenue of 2 nights", out.getvalue())
+        self.assertEqual(self.rollup_rows(), expected)
+
+        Room.objects.filter(pk=room.pk).update(location="Bath")
+        call_command("rebuild_rollups", skip_revenue=True, stdout=out)
+        self.assertEqual(rollup(room, date(2026, 6, 1)), (0, Decimal("0")))
+        room.location = "Bath"
+        self.assertEqual(rollup(room, date(2026, 6, 1)), (1, Decimal("75.00")))
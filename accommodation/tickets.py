@@ -0,0 +1,105 @@
+"""
+Local, searchable store of support tickets.
+
+The SQS worker (``manage.py run_support_worker``) and the manager
+"next ticket" button hand every message body to ``store_ticket``. Managers
+then browse and search tickets from the database without touching SQS.
+On SQLite, text search uses the FTS5 index created in migration 0008.
+"""
+import hashlib
+import json
+import re
+
+from django.conf import settings
+from django.db import IntegrityError, connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import SupportTicket
+
+PAGE_SIZE = getattr(settings, "TICKET_PAGE_SIZE", 25)
+FTS_TABLE = "accommodation_supportticket_fts"
+
+
+def store_ticket(body):
+    """
+    Save one queue message as a SupportTicket. Redelivered messages are
+    ignored, because the ticket is keyed by a hash of its body.
+    """
+    data = json.loads(body)
+    created_at = parse_datetime(data.get("created_at") or "") or timezone.now()
+    if timezone.is_naive(created_at):
+        created_at = timezone.make_aware(created_at, timezone.utc)
+
+    fingerprint = hashlib.sha256(body.encode("utf-8")).hexdigest()
+    ticket = SupportTicket.objects.filter(fingerprint=fingerprint).first()
+    if ticket is not None:
+        return ticket
+
+    # Not get_or_create: on SQLite its INSERT runs in a transaction (FTS
+    # trigger included) that fails at once with "database is locked" when
+    # another thread is storing a ticket, while a plain INSERT waits.
+    try:
+        ticket = SupportTicket.objects.create(
+            fingerprint=fingerprint,
+            name=data.get("name", "")[:100],
+            email=data.get("email", "").strip().lower(),
+            room=(data.get("room") or "")[:50],
+            subject=data.get("subject", "")[:150],
+            message=data.get("message", ""),
+            created_at=created_at,
+        )
+    except IntegrityError:
+        ticket = SupportTicket.objects.get(fingerprint=fingerprint)
+    return ticket
+
+
+def _fts_terms(text):
+    """Quote every word so user input can never break FTS5 syntax."""
+    words = re.findall(r"\w+", text)
+    return " ".join('"{}"'.format(word) for word in words)
+
+
+def _use_fts():
+    return connection.vendor == "sqlite"
+
+
+def search_tickets(q="", room="", email="", before=None, size=PAGE_SIZE):
+    """
+    Newest tickets first, optionally filtered by free text, room and
+    email. Keyset pagination on id: pass the returned cursor as before.
+    Returns (tickets, next_before).
+    """
+    tickets = SupportTicket.objects.order_by("-id")
+
+    if email:
+        tickets = tickets.filter(email=email.strip().lower())
+    if before:
+        tickets = tickets.filter(id__lt=before)
+
+    if _use_fts():
+        match = []
+        if q and _fts_terms(q):
+            match.append(_fts_terms(q))
+        if room and _fts_terms(room):
+            match.append("room : ({})".format(_fts_terms(room)))
+        if match:
+            tickets = tickets.filter(
+                id__in=RawSQL(
+                    f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s",
+                    [" AND ".join(match)],
+                )
+            )
+    else:
+        if q:
+            tickets = tickets.filter(
+                Q(subject__icontains=q) | Q(message__icontains=q) | Q(name__icontains=q)
+            )
+        if room:
+            tickets = tickets.filter(room__icontains=room)
+
+    page = list(tickets[:size + 1])
+    next_before = page[size - 1].id if len(page) > size else None
+    return page[:size], next_before
@@ -1,12 +1,18 @@
+from django.conf import settings
 from django.urls import path
 from django.contrib.auth import views as auth_views
 
 from . import views
 
+if settings.ASYNC_VIEWS:
+    from . import async_views as aws_views
+else:
+    aws_views = views
+
 urlpatterns = [
     path('', views.home, name='home'),
 
-    path('rooms/<int:room_id>/book/', views.book_room, name='book_room'),
+    path('rooms/<int:room_id>/book/', aws_views.book_room, name='book_room'),
     path('booking/<int:booking_id>/success/', views.booking_success, name='booking_success'),
     path('booking/<int:booking_id>/edit/', views.edit_booking, name='edit_booking'),
     path('booking/<int:booking_id>/cancel/', views.cancel_booking, name='cancel_booking'),
@@ -15,13 +21,17 @@ urlpatterns = [
     path('my-bookings/', views.my_bookings, name='my_bookings'),
 
     path('manager/rooms/', views.manager_room_list, name='manager_room_list'),
-    path('manager/rooms/<int:room_id>/image/', views.manage_room_image, name='manage_room_image'),
+    path('manager/rooms/<int:room_id>/image/', aws_views.manage_room_image, name='manage_room_image'),
     
     path(
         "manager/support/next/",
-        views.manager_next_ticket,
+        aws_views.manager_next_ticket,
         name="manager_next_ticket",
     ),
+    path('manager/support/tickets/', views.manager_tickets, name='manager_tickets'),
+    path('manager/outbox/stats/', views.outbox_stats, name='outbox_stats'),
+    path('manager/reports/occupancy/', views.manager_occupancy, name='manager_occupancy'),
+    path('metrics/', views.metrics, name='metrics'),
 
     path('signup/', views.signup, name='signup'),
     path(
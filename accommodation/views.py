@@ -1,56 +1,86 @@
-from decimal import Decimal
-from datetime import datetime
+from datetime import datetime, timedelta
+import hmac
 import json
 
+from django.db import OperationalError, transaction
+from django.http import HttpResponse, JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import login as auth_login
 from django.contrib.auth.decorators import login_required, user_passes_test
+from django.conf import settings
 
 from .models import Room, Booking
 from .forms import RoomImageForm, SupportTicketForm
-
-from producer import Producer
+from .availability import (
+    ROOM_TAKEN,
+    RoomUnavailable,
+    availability_for,
+    claim_room,
+    default_stay,
+    move_nights,
+    parse_stay,
+    release_nights,
+    reserve_nights,
+)
+from .rates import quote_stay
+from .image_urls import attach_image_urls
+from . import booking_feed, catalogue, outbox, rollups, tickets
+from .lambda_client import booking_payload
+
+import aws_metrics
+from producer import get_buffered_producer
 from consumer import Consumer
 
 from yugo_booking_lib.booking_price import BookingPrice
 
 
 def home(request):
-    rooms = Room.objects.all().order_by("id")
-    return render(request, "accommodation/home.html", {"rooms": rooms})
+    try:
+        check_in, check_out = parse_stay(
+            request.GET.get("check_in"),
+            request.GET.get("check_out"),
+        )
+    except ValueError:
+        check_in, check_out = default_stay()
 
+    try:
+        after = max(int(request.GET.get("after", 0)), 0)
+    except ValueError:
+        after = 0
 
-@csrf_exempt
-@login_required
-def book_room(request, room_id):
-    room = get_object_or_404(Room, id=room_id)
+    rooms, next_after = catalogue.get_page(after)
+    free = availability_for([room.id for room in rooms], check_in, check_out)
+    attach_image_urls(rooms)
+    for room in rooms:
+        room.is_free = free[room.id]
 
-    if request.method == "POST":
-        email = request.POST.get("email")
-        check_in = request.POST.get("check_in")
-        check_out = request.POST.get("check_out")
+    return render(
+        request,
+        "accommodation/home.html",
+        {
+            "rooms": rooms,
+            "next_after": next_after,
+            "check_in": check_in,
+            "check_out": check_out,
+        },
+    )
 
-        bp = BookingPrice()
 
-        try:
-            nights = bp.calculate_nights(check_in, check_out)
-            if nights <= 0:
-                nights = 1
-        except Exception:
-            nights = 1
-
-        total_float = bp.calculate_total_price(
-            nights=nights,
-            nightly_rate=float(room.price_per_night),
-            tax_rate=0.08,
-            fixed_fee=50.0,
-        )
+BOOKING_BUSY = "Lots of people are booking right now. Please try again."
 
-        total_price = Decimal(str(total_float))
 
+def _create_booking(room, email, check_in, check_out, total_price, deliver_now=False):
+    """
+    The booking transaction shared by the sync and async views. Returns
+    (booking, outbox event); raises RoomUnavailable or OperationalError.
+    """
+    with transaction.atomic():
+        claim_room(room.id)
         booking = Booking.objects.create(
             room=room,
             user_email=email,
@@ -59,12 +89,77 @@ def book_room(request, room_id):
             total_price=total_price,
             status="confirmed",
         )
+        reserve_nights(booking)
+        event = outbox.enqueue(
+            "booking.created",
+            booking_payload(booking),
+            deliver_now=deliver_now,
+        )
+    return booking, event
+
+
+@csrf_exempt
+@login_required
+def book_room(request, room_id):
+    room = get_object_or_404(Room, id=room_id)
+    attach_image_urls([room])
+
+    if request.method == "POST":
+        email = request.POST.get("email")
+        check_in = request.POST.get("check_in")
+        check_out = request.POST.get("check_out")
+
+        try:
+            check_in, check_out = parse_stay(check_in, check_out)
+        except ValueError as e:
+            return render(
+                request,
+                "accommodation/book_room.html",
+                {"room": room, "error": str(e)},
+            )
+
+        if not room.available:
+            return render(
+                request,
+                "accommodation/book_room.html",
+                {"room": room, "error": "This room is not taking bookings."},
+            )
+
+        # Cheap read first: under a rush most requests lose, and they
+        # should not get as far as a write transaction.
+        if not availability_for([room.id], check_in, check_out)[room.id]:
+            return render(
+                request,
+                "accommodation/book_room.html",
+                {"room": room, "error": ROOM_TAKEN},
+                status=409,
+            )
 
-        room.available = False
-        room.save()
+        total_price = quote_stay(
+            room,
+            check_in,
+            check_out,
+            tax_rate=0.08,
+            fixed_fee=50.0,
+        )
 
-        from .lambda_client import invoke_booking_lambda
-        invoke_booking_lambda(booking)
+        try:
+            booking, _ = _create_booking(room, email, check_in, check_out, total_price)
+        except RoomUnavailable as e:
+            return render(
+                request,
+                "accommodation/book_room.html",
+                {"room": room, "error": str(e)},
+                status=409,
+            )
+        except OperationalError:
+            # lock wait ran out (SQLite "database is locked")
+            return render(
+                request,
+                "accommodation/book_room.html",
+                {"room": room, "error": BOOKING_BUSY},
+                status=503,
+            )
 
         return redirect(reverse("booking_success", args=[booking.id]))
 
@@ -107,37 +202,64 @@ def signup(request):
     return render(request, "accommodation/signup.html", {"form": form})
 
 
+BOOKING_CANCELLED = "This booking was cancelled and can no longer be changed."
+
+
 @login_required
 def edit_booking(request, booking_id):
     booking = get_object_or_404(Booking, id=booking_id)
     room = booking.room
 
+    if booking.status == "cancelled":
+        # its nights were released; saving would book them again
+        return render(
+            request,
+            "accommodation/edit_booking.html",
+            {"booking": booking, "room": room, "error": BOOKING_CANCELLED, "locked": True},
+            status=409 if request.method == "POST" else 200,
+        )
+
     if request.method == "POST":
         check_in = request.POST.get("check_in")
         check_out = request.POST.get("check_out")
 
-        bp = BookingPrice()
-
         try:
-            nights = bp.calculate_nights(check_in, check_out)
-            if nights <= 0:
-                nights = 1
-        except Exception:
-            nights = 1
-
-        total_float = bp.calculate_total_price(
-            nights=nights,
-            nightly_rate=float(room.price_per_night),
-            tax_rate=0.0,
-            fixed_fee=0.0,
-        )
-        total_price = Decimal(str(total_float))
+            check_in, check_out = parse_stay(check_in, check_out)
+        except ValueError as e:
+            return render(
+                request,
+                "accommodation/edit_booking.html",
+                {"booking": booking, "room": room, "error": str(e)},
+            )
+
+        total_price = quote_stay(room, check_in, check_out)
 
         booking.check_in = check_in
         booking.check_out = check_out
         booking.total_price = total_price
         booking.status = "updated"
-        booking.save()
+
+        try:
+            with transaction.atomic():
+                booking.save()
+                move_nights(booking)
+        except RoomUnavailable as e:
+            booking.refresh_from_db()
+            return render(
+                request,
+                "accommodation/edit_booking.html",
+                {"booking": booking, "room": room, "error": str(e)},
+                status=409,
+            )
+        except OperationalError:
+            # lock wait ran out (SQLite "database is locked")
+            booking.refresh_from_db()
+            return render(
+                request,
+                "accommodation/edit_booking.html",
+                {"booking": booking, "room": room, "error": BOOKING_BUSY},
+                status=503,
+            )
 
         return redirect("booking_success", booking_id=booking.id)
 
@@ -153,12 +275,20 @@ def cancel_booking(request, booking_id):
     booking = get_object_or_404(Booking, id=booking_id)
 
     if request.method == "POST":
-        booking.status = "cancelled"
-        booking.save()
-
-        room = booking.room
-        room.available = True
-        room.save()
+        try:
+            with transaction.atomic():
+                booking.status = "cancelled"
+                booking.save()
+                release_nights(booking)
+        except OperationalError:
+            # lock wait ran out (SQLite "database is locked")
+            booking.refresh_from_db()
+            return render(
+                request,
+                "accommodation/cancel_booking_confirm.html",
+                {"booking": booking, "error": BOOKING_BUSY},
+                status=503,
+            )
 
         return redirect("booking_success", booking_id=booking.id)
 
@@ -171,17 +301,15 @@ def cancel_booking(request, booking_id):
 
 @login_required
 def my_bookings(request):
-    qs = Booking.objects.filter(user_email=request.user.username)
-
-    if not qs.exists():
-        qs = Booking.objects.all()
-
-    bookings = qs.order_by("-created_at")
+    bookings, next_cursor = booking_feed.get_page(
+        request.user.username,
+        cursor=request.GET.get("before"),
+    )
 
     return render(
         request,
         "accommodation/my_bookings.html",
-        {"bookings": bookings},
+        {"bookings": bookings, "next_cursor": next_cursor},
     )
 
 
@@ -190,8 +318,11 @@ def delete_booking(request, booking_id):
     booking_qs = Booking.objects.filter(id=booking_id)
 
     if request.method == "POST":
-        if booking_qs.exists():
-            booking_qs.delete()
+        booking = booking_qs.first()
+        if booking:
+            with transaction.atomic():
+                release_nights(booking)
+                booking.delete()
         return redirect("my_bookings")
 
     booking = booking_qs.first()
@@ -214,8 +345,11 @@ def support_ticket(request):
             data["created_at"] = datetime.utcnow().isoformat()
 
             message = json.dumps(data)
-            p = Producer()
-            p.send_message("yugo-support-queue", message)
+            p = get_buffered_producer(
+                "yugo-support-queue",
+                spool_dir=settings.SQS_SPOOL_DIR,
+            )
+            p.send_message(message)
 
             return render(
                 request,
@@ -236,10 +370,48 @@ def _is_media_admin(user):
     return user.is_staff
 
 
+@login_required
+@user_passes_test(_is_media_admin)
+def outbox_stats(request):
+    return JsonResponse(outbox.stats())
+
+
+OUTBOX_DEPTH = aws_metrics.REGISTRY.gauge(
+    "yugo_outbox_depth", "Outbox events waiting to be dispatched.")
+OUTBOX_FAILED = aws_metrics.REGISTRY.gauge(
+    "yugo_outbox_failed", "Outbox events that ran out of attempts.")
+OUTBOX_LAG = aws_metrics.REGISTRY.gauge(
+    "yugo_outbox_lag_seconds", "Age of the oldest pending outbox event.")
+
+
+def metrics(request):
+    """
+    Prometheus scrape endpoint: AWS call metrics of this process plus
+    outbox gauges. Scrapers authenticate with ``Authorization: Bearer
+    <METRICS_TOKEN>``; staff can also read it from a browser session.
+    """
+    token = getattr(settings, "METRICS_TOKEN", "")
+    scraper = token and hmac.compare_digest(
+        request.headers.get("Authorization", ""), f"Bearer {token}"
+    )
+    if not (scraper or (request.user.is_authenticated and _is_media_admin(request.user))):
+        return HttpResponse(status=403)
+
+    stats = outbox.stats()
+    OUTBOX_DEPTH.set(value=stats["depth"])
+    OUTBOX_FAILED.set(value=stats["failed"])
+    OUTBOX_LAG.set(value=stats["lag_seconds"])
+
+    return HttpResponse(
+        aws_metrics.render(),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
 @login_required
 @user_passes_test(_is_media_admin)
 def manager_room_list(request):
-    rooms = Room.objects.all().order_by("id")
+    rooms = attach_image_urls(Room.objects.all().order_by("id"))
     return render(
         request,
         "accommodation/manager_room_list.html",
@@ -247,6 +419,18 @@ def manager_room_list(request):
     )
 
 
+def _save_room_image(room):
+    """
+    Store a changed ``room.image`` (uploading it first if it is new) and
+    queue the variant pipeline, which also cleans up after a delete.
+    """
+    with transaction.atomic():
+        # only write the image column so a concurrent edit of other room
+        # fields is not overwritten
+        room.save(update_fields=["image"])
+        outbox.enqueue("room_image.process", {"room_id": room.id})
+
+
 @login_required
 @user_passes_test(_is_media_admin)
 def manage_room_image(request, room_id):
@@ -257,12 +441,12 @@ def manage_room_image(request, room_id):
             if room.image:
                 room.image.delete(save=False)
                 room.image = None
-                room.save()
+                _save_room_image(room)
             return redirect("manager_room_list")
 
         form = RoomImageForm(request.POST, request.FILES, instance=room)
         if form.is_valid():
-            form.save()
+            _save_room_image(form.save(commit=False))
             return redirect("manager_room_list")
     else:
         form = RoomImageForm(instance=room)
@@ -279,16 +463,101 @@ def manage_room_image(request, room_id):
 @csrf_exempt
 def manager_next_ticket(request):
     result_message = None
+    stored = []
 
     if request.method == "POST":
         c = Consumer()
-        c.consume_message("yugo-support-queue")
-        result_message = (
-            "Next support ticket has been consumed and removed from the SQS queue."
+        c.consume_message(
+            "yugo-support-queue",
+            handler=lambda body: stored.append(tickets.store_ticket(body)),
         )
+        if stored:
+            result_message = (
+                "Next support ticket has been consumed, saved and removed from the SQS queue."
+            )
+        else:
+            result_message = "No support ticket was waiting in the SQS queue."
 
     return render(
         request,
         "accommodation/manager_next_ticket.html",
-        {"result_message": result_message},
+        {"result_message": result_message, "ticket": stored[0] if stored else None},
+    )
+
+
+@login_required
+@user_passes_test(_is_media_admin)
+def manager_tickets(request):
+    q = request.GET.get("q", "").strip()
+    room = request.GET.get("room", "").strip()
+    email = request.GET.get("email", "").strip()
+    try:
+        before = int(request.GET.get("before", 0)) or None
+    except ValueError:
+        before = None
+
+    ticket_list, next_before = tickets.search_tickets(
+        q=q,
+        room=room,
+        email=email,
+        before=before,
+    )
+
+    return render(
+        request,
+        "accommodation/manager_tickets.html",
+        {
+            "tickets": ticket_list,
+            "next_before": next_before,
+            "q": q,
+            "room": room,
+            "email": email,
+        },
+    )
+
+
+REPORT_GROUPS = ("location", "room_type")
+REPORT_MAX_DAYS = 3 * 366
+
+
+@login_required
+@user_passes_test(_is_media_admin)
+def manager_occupancy(request):
+    """Occupancy and revenue per location or room type, from the rollups only."""
+    today = timezone.localdate()
+    error = None
+    start = request.GET.get("start") or (today - timedelta(days=29)).isoformat()
+    end = request.GET.get("end") or today.isoformat()
+    try:
+        start, end = parse_date(start), parse_date(end)
+    except ValueError:
+        start = end = None
+    if start is None or end is None:
+        start, end = today - timedelta(days=29), today
+        error = "Please enter valid dates."
+    elif end < start or (end - start).days > REPORT_MAX_DAYS:
+        start, end = today - timedelta(days=29), today
+        error = f"Pick an end date after the start, at most {REPORT_MAX_DAYS} days later."
+
+    group_by = request.GET.get("group")
+    if group_by not in REPORT_GROUPS:
+        group_by = "location"
+    location = request.GET.get("location", "").strip()
+    room_type = request.GET.get("room_type", "").strip()
+
+    return render(
+        request,
+        "accommodation/manager_occupancy.html",
+        {
+            "report": rollups.report(
+                start, end, group_by=group_by, location=location, room_type=room_type
+            ),
+            "start": start,
+            "end": end,
+            "group_by": group_by,
+            "location": location,
+            "room_type": room_type,
+            "room_types": Room.ROOM_TYPES,
+            "error": error,
+        },
     )
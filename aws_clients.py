@@ -0,0 +1,156 @@
+'''
+    Shared boto3 clients for every AWS integration.
+
+    Building a boto3 client costs tens of milliseconds of CPU, so clients are
+    created once per (service, region) and reused. boto3 clients are
+    thread-safe; resources (and their Table handles) are not, so those are
+    kept per thread. Everything is dropped in a forked child (e.g. a gunicorn
+    worker) so no connection pool is shared across processes. The shared
+    session is instrumented by aws_metrics, so every call is measured.
+'''
+
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+
+import aws_metrics
+
+_lock = threading.RLock()
+_session = None
+_clients = {}
+_queue_urls = {}
+_local = threading.local()
+_pid = os.getpid()
+_executor = None
+
+# threads that run blocking boto3 calls for async code (see run_async)
+ASYNC_THREADS = int(os.environ.get('YUGO_AWS_ASYNC_THREADS', '64'))
+
+
+def _forget_everything():
+    global _lock, _session, _local, _pid, _executor
+    _lock = threading.RLock()
+    _session = None
+    _clients.clear()
+    _queue_urls.clear()
+    _local = threading.local()
+    _pid = os.getpid()
+    _executor = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_everything)
+
+
+def _check_pid():
+    # fallback for platforms/forks that bypass register_at_fork
+    if os.getpid() != _pid:
+        _forget_everything()
+
+
+def reset():
+    '''Drop every cached session, client, resource and queue URL.'''
+    with _lock:
+        _forget_everything()
+
+
+def get_session():
+    global _session
+    _check_pid()
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = aws_metrics.instrument(boto3.session.Session())
+    return _session
+
+
+def get_client(service, region=None):
+    '''One shared client per (service, region); region None uses the default chain.'''
+    _check_pid()
+    key = (service, region)
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = get_session().client(service, region_name=region)
+                _clients[key] = client
+    return client
+
+
+def get_resource(service, region=None, config=None):
+    '''
+    One resource per (service, region) per thread. Callers that need
+    their own timeouts or retries pass a botocore Config; keep it in a
+    module constant, the resource is cached per Config object.
+    '''
+    _check_pid()
+    resources = _local.__dict__.setdefault('resources', {})
+    key = (service, region, config)
+    resource = resources.get(key)
+    if resource is None:
+        with _lock:
+            resource = get_session().resource(service, region_name=region, config=config)
+        resources[key] = resource
+    return resource
+
+
+def get_table(table_name, region=None):
+    '''Cached DynamoDB Table handle for the current thread.'''
+    _check_pid()
+    tables = _local.__dict__.setdefault('tables', {})
+    key = (table_name, region)
+    table = tables.get(key)
+    if table is None:
+        table = get_resource('dynamodb', region).Table(table_name)
+        tables[key] = table
+    return table
+
+
+def get_queue_url(queue_name, region=None):
+    '''Look up an SQS queue URL once and remember it.'''
+    _check_pid()
+    key = (queue_name, region)
+    queue_url = _queue_urls.get(key)
+    if queue_url is None:
+        response = get_client('sqs', region).get_queue_url(QueueName=queue_name)
+        queue_url = response['QueueUrl']
+        with _lock:
+            _queue_urls[key] = queue_url
+    return queue_url
+
+
+def _get_executor():
+    global _executor
+    _check_pid()
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=ASYNC_THREADS,
+                    thread_name_prefix='aws-async',
+                )
+    return _executor
+
+
+async def run_async(func, *args, **kwargs):
+    '''
+    Await a blocking boto3 call from async code. It runs on a dedicated
+    thread pool, so the event loop keeps serving other requests while
+    AWS answers, and slow AWS calls cannot starve Django's own
+    sync_to_async threads.
+    '''
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _get_executor(), functools.partial(func, *args, **kwargs)
+    )
+
+
+def forget_queue_url(queue_name, region=None):
+    '''Call after a queue is deleted or recreated.'''
+    with _lock:
+        _queue_urls.pop((queue_name, region), None)
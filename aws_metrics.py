@@ -0,0 +1,301 @@
+'''
+    Metrics for every AWS call, collected from botocore's event system.
+
+    ``instrument(session)`` (done by aws_clients for the shared session)
+    hooks before-call / after-call / after-call-error / needs-retry on the
+    session, so every client and resource built from it reports:
+
+    * aws_request_duration_seconds   latency histogram, retries included
+    * aws_requests_total             by outcome and error code
+    * aws_retries_total              extra attempts botocore made
+    * aws_throttles_total            throttled attempts (retried or not)
+    * aws_request_bytes / aws_response_bytes   payload size histograms
+    * aws_dynamodb_capacity_units_total        consumed read/write units
+
+    DynamoDB calls are sent with ReturnConsumedCapacity=TOTAL so capacity
+    can be sized from real traffic. ``render()`` returns everything in the
+    Prometheus text format. Counters are per process; with several
+    gunicorn workers each worker reports its own numbers.
+'''
+
+import bisect
+import threading
+import time
+
+from botocore.utils import determine_content_length
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# the codes botocore's standard retry mode treats as throttling
+THROTTLE_CODES = frozenset((
+    'Throttling',
+    'ThrottlingException',
+    'ThrottledException',
+    'RequestThrottled',
+    'RequestThrottledException',
+    'TooManyRequestsException',
+    'ProvisionedThroughputExceededException',
+    'RequestLimitExceeded',
+    'SlowDown',
+    'BandwidthLimitExceeded',
+    'LimitExceededException',
+    'EC2ThrottledException',
+    'TransactionInProgressException',
+    'PriorRequestNotComplete',
+))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, _escape(v)) for k, v in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def header(self):
+        return [
+            '# HELP {} {}'.format(self.name, self.documentation),
+            '# TYPE {} {}'.format(self.name, self.kind),
+        ]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return self.header() + [
+            '{}{} {}'.format(self.name, _labels(self.labelnames, labels), _number(value))
+            for labels, value in values
+        ]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, labels=(), value=0):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, labels, value):
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][bisect.bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+
+    def render(self):
+        with self._lock:
+            values = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._values.items())
+        lines = self.header()
+        for labels, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                lines.append('{}_bucket{} {}'.format(
+                    self.name,
+                    _labels(self.labelnames, labels, [('le', _number(float(bound)))]),
+                    cumulative,
+                ))
+            lines.append('{}_sum{} {}'.format(self.name, _labels(self.labelnames, labels), repr(total)))
+            lines.append('{}_count{} {}'.format(self.name, _labels(self.labelnames, labels), cumulative))
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._get(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._get(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, documentation, labelnames, buckets)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+_OP = ('service', 'operation')
+request_duration = REGISTRY.histogram(
+    'aws_request_duration_seconds', 'Time spent in AWS API calls, retries included.', _OP)
+requests_total = REGISTRY.counter(
+    'aws_requests_total', 'AWS API calls by outcome.', _OP + ('outcome', 'error_code'))
+retries_total = REGISTRY.counter(
+    'aws_retries_total', 'Retried attempts made by botocore.', _OP)
+throttles_total = REGISTRY.counter(
+    'aws_throttles_total', 'Attempts rejected by AWS throttling.', _OP + ('error_code',))
+request_bytes = REGISTRY.histogram(
+    'aws_request_bytes', 'Size of AWS request bodies.', _OP, SIZE_BUCKETS)
+response_bytes = REGISTRY.histogram(
+    'aws_response_bytes', 'Size of AWS response bodies.', _OP, SIZE_BUCKETS)
+capacity_units = REGISTRY.counter(
+    'aws_dynamodb_capacity_units_total', 'DynamoDB capacity units consumed.',
+    ('table', 'operation', 'kind'))
+
+_listeners = []
+
+
+def add_listener(listener):
+    '''Call listener(service, operation, seconds) after every AWS call.'''
+    if listener not in _listeners:
+        _listeners.append(listener)
+
+
+def _error_code(parsed):
+    return (parsed or {}).get('Error', {}).get('Code', '') if isinstance(parsed, dict) else ''
+
+
+def _body_size(body):
+    if body is None:
+        return 0
+    if isinstance(body, (bytes, bytearray, str)):
+        return len(body)
+    try:
+        return determine_content_length(body) or 0
+    except Exception:
+        return 0
+
+
+def _before_call(model, params, context, **kwargs):
+    labels = (model.service_model.service_name, model.name)
+    context['metrics_labels'] = labels
+    context['metrics_started'] = time.perf_counter()
+    size = params.get('headers', {}).get('Content-Length')
+    request_bytes.observe(labels, int(size) if size else _body_size(params.get('body')))
+
+
+def _finish(context, outcome, error_code):
+    labels = context.get('metrics_labels')
+    started = context.get('metrics_started')
+    if labels is None or started is None:
+        return None
+    seconds = time.perf_counter() - started
+    request_duration.observe(labels, seconds)
+    requests_total.inc(labels + (outcome, error_code))
+    for listener in _listeners:
+        try:
+            listener(labels[0], labels[1], seconds)
+        except Exception:
+            pass
+    return labels
+
+
+def _after_call(http_response, parsed, model, context, **kwargs):
+    error_code = _error_code(parsed)
+    labels = _finish(context, 'error' if error_code else 'ok', error_code)
+    if labels is None:
+        return
+
+    metadata = parsed.get('ResponseMetadata', {}) if isinstance(parsed, dict) else {}
+    if metadata.get('RetryAttempts'):
+        retries_total.inc(labels, metadata['RetryAttempts'])
+
+    size = http_response.headers.get('content-length')
+    if size is None and not model.has_streaming_output:
+        size = len(http_response.content or b'')
+    response_bytes.observe(labels, int(size or 0))
+
+    if labels[0] == 'dynamodb' and isinstance(parsed, dict):
+        consumed = parsed.get('ConsumedCapacity') or []
+        for entry in consumed if isinstance(consumed, list) else [consumed]:
+            table = entry.get('TableName', '')
+            for kind, key in (('total', 'CapacityUnits'), ('read', 'ReadCapacityUnits'),
+                              ('write', 'WriteCapacityUnits')):
+                if entry.get(key):
+                    capacity_units.inc((table, labels[1], kind), entry[key])
+
+
+def _after_call_error(exception, context, **kwargs):
+    # connection errors and the like, after botocore gave up retrying
+    _finish(context, 'error', type(exception).__name__)
+
+
+def _needs_retry(response=None, operation=None, caught_exception=None, **kwargs):
+    # called after every attempt; only looks, never asks for a retry
+    if response is None or operation is None:
+        return None
+    code = _error_code(response[1])
+    if code in THROTTLE_CODES:
+        throttles_total.inc((operation.service_model.service_name, operation.name, code))
+    return None
+
+
+def _return_consumed_capacity(params, model, **kwargs):
+    if 'ReturnConsumedCapacity' in model.input_shape.members:
+        params.setdefault('ReturnConsumedCapacity', 'TOTAL')
+
+
+def instrument(session, consumed_capacity=True):
+    '''Hook the metrics into a boto3 session; clients created afterwards report.'''
+    events = session.events
+    events.register('before-call', _before_call, unique_id='aws-metrics-before-call')
+    events.register('after-call', _after_call, unique_id='aws-metrics-after-call')
+    events.register('after-call-error', _after_call_error, unique_id='aws-metrics-after-call-error')
+    events.register('needs-retry', _needs_retry, unique_id='aws-metrics-needs-retry')
+    if consumed_capacity:
+        events.register(
+            'provide-client-params.dynamodb',
+            _return_consumed_capacity,
+            unique_id='aws-metrics-consumed-capacity',
+        )
+    return session
+
+
+def render():
+    return REGISTRY.render()
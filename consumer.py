@@ -3,22 +3,28 @@
     @author a. e. chis
 '''
 
+import inspect
 import logging
-import boto3
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 from botocore.exceptions import ClientError
 
+from aws_clients import get_client, get_queue_url, run_async
+
+logger = logging.getLogger(__name__)
+
 ''' a simple class to demonstrate how to retrieve one or more messages from a given queue'''
 
 class Consumer:
-    def consume_message(self, queue_name):
+    def consume_message(self, queue_name, handler=None):
         
         try:
             
-            session = boto3.session.Session()
-            sqs_client = session.client('sqs')
-            
-            response = sqs_client.get_queue_url(QueueName=queue_name)
-            queue_url = response['QueueUrl']
+            sqs_client = get_client('sqs')
+            queue_url = get_queue_url(queue_name)
             
             print('\n\t\t<=== requesting messages from the queue...\n')
             
@@ -38,6 +44,14 @@ class Consumer:
                 current_message = messages[0] 
                 print("\t\t\t<=== consumer has the message: {}".format(current_message))
                 print("\n\t\t\t<=== The message I'm proccessing is:\n {}".format(current_message['Body']))
+
+                if handler is not None:
+                    try:
+                        handler(current_message['Body'])
+                    except Exception:
+                        # leave the message on the queue so it is not lost
+                        logger.exception('handler failed, message left on the queue')
+                        return False
             
           
                 ''' once the message has been processed, ensure that the message is deleted from the queue.
@@ -55,3 +69,203 @@ class Consumer:
             logging.error(e)
             return False
         return True
+
+    async def aconsume_message(self, queue_name, handler=None):
+        ''' consume_message for async code: the SQS calls run off the event loop
+            and handler may be a coroutine function
+        '''
+        try:
+            sqs_client = get_client('sqs')
+            queue_url = await run_async(get_queue_url, queue_name)
+            response = await run_async(
+                sqs_client.receive_message,
+                QueueUrl=queue_url,
+                MaxNumberOfMessages=1,
+                VisibilityTimeout=10,
+            )
+            messages = response.get('Messages')
+            if not messages:
+                return True
+
+            current_message = messages[0]
+            if handler is not None:
+                try:
+                    result = handler(current_message['Body'])
+                    if inspect.isawaitable(result):
+                        await result
+                except Exception:
+                    logger.exception('handler failed, message left on the queue')
+                    return False
+
+            await run_async(
+                sqs_client.delete_message,
+                QueueUrl=queue_url,
+                ReceiptHandle=current_message['ReceiptHandle'],
+            )
+        except ClientError as e:
+            logging.error(e)
+            return False
+        return True
+
+
+''' a long-running worker: long-polls a queue, processes messages on a thread pool
+    and deletes them in batches once the handler succeeds
+'''
+
+
+def log_message(body):
+    ''' default handler, just logs the message body '''
+    logger.info('processed message: %s', body)
+
+
+class ConsumerWorker:
+
+    def __init__(self, queue_name, handler=log_message, workers=10,
+                 wait_time=20, visibility_timeout=30, region=None):
+        self.queue_name = queue_name
+        self.handler = handler
+        self.workers = workers
+        self.wait_time = wait_time
+        self.visibility_timeout = visibility_timeout
+        self.region = region
+
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._in_flight = {}        # message id -> [receipt handle, visibility deadline]
+        self._to_delete = []        # (message id, receipt handle)
+        self._slots = threading.Semaphore(workers * 2)
+        self.processed = 0
+        self.failed = 0
+
+    def stop(self, *args):
+        self._stopping.set()
+
+    def run(self):
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, self.stop)
+            signal.signal(signal.SIGINT, self.stop)
+
+        sqs_client = get_client('sqs', self.region)
+        queue_url = get_queue_url(self.queue_name, self.region)
+
+        housekeeper = threading.Thread(
+            target=self._housekeeping, args=(sqs_client, queue_url),
+            name='sqs-housekeeper', daemon=True,
+        )
+        housekeeper.start()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while not self._stopping.is_set():
+                wanted = self._reserve_slots(10)
+                if not wanted:
+                    continue
+                try:
+                    response = sqs_client.receive_message(
+                        QueueUrl=queue_url,
+                        MaxNumberOfMessages=wanted,
+                        WaitTimeSeconds=self.wait_time,
+                        VisibilityTimeout=self.visibility_timeout,
+                    )
+                except ClientError as e:
+                    logging.error(e)
+                    self._release_slots(wanted)
+                    self._stopping.wait(1)
+                    continue
+
+                messages = response.get('Messages', [])
+                self._release_slots(wanted - len(messages))
+                deadline = time.monotonic() + self.visibility_timeout
+                for message in messages:
+                    with self._lock:
+                        self._in_flight[message['MessageId']] = [message['ReceiptHandle'], deadline]
+                    pool.submit(self._process, message)
+            # leaving the with block waits for in-flight messages
+
+        self._stopping.set()
+        housekeeper.join()
+        self._flush_deletes(sqs_client, queue_url)
+        logger.info('worker stopped: %s processed, %s failed', self.processed, self.failed)
+
+    def _reserve_slots(self, wanted):
+        ''' take up to `wanted` processing slots so we never hold more messages than we can work on '''
+        if not self._slots.acquire(timeout=1):
+            return 0
+        taken = 1
+        while taken < wanted and self._slots.acquire(blocking=False):
+            taken += 1
+        return taken
+
+    def _release_slots(self, count):
+        for _ in range(count):
+            self._slots.release()
+
+    def _process(self, message):
+        message_id = message['MessageId']
+        try:
+            self.handler(message['Body'])
+        except Exception:
+            logger.exception('handler failed for message %s, leaving it on the queue', message_id)
+            with self._lock:
+                self._in_flight.pop(message_id, None)
+                self.failed += 1
+        else:
+            with self._lock:
+                entry = self._in_flight.pop(message_id, None)
+                if entry is not None:
+                    self._to_delete.append((message_id, entry[0]))
+                self.processed += 1
+        finally:
+            self._slots.release()
+
+    def _housekeeping(self, sqs_client, queue_url):
+        ''' delete finished messages and extend the visibility of slow ones, once a second '''
+        while not self._stopping.wait(1):
+            self._flush_deletes(sqs_client, queue_url)
+            self._extend_visibility(sqs_client, queue_url)
+
+    def _flush_deletes(self, sqs_client, queue_url):
+        with self._lock:
+            pending, self._to_delete = self._to_delete, []
+        for start in range(0, len(pending), 10):
+            entries = [
+                {'Id': str(i), 'ReceiptHandle': receipt}
+                for i, (_, receipt) in enumerate(pending[start:start + 10])
+            ]
+            try:
+                response = sqs_client.delete_message_batch(QueueUrl=queue_url, Entries=entries)
+                for failure in response.get('Failed', []):
+                    logging.error('could not delete message: %s', failure)
+            except ClientError as e:
+                logging.error(e)
+
+    def _extend_visibility(self, sqs_client, queue_url):
+        now = time.monotonic()
+        margin = max(self.visibility_timeout / 3, 2)
+        with self._lock:
+            slow = [
+                (message_id, entry) for message_id, entry in self._in_flight.items()
+                if entry[1] - now < margin
+            ]
+            for _, entry in slow:
+                entry[1] = now + self.visibility_timeout
+        for start in range(0, len(slow), 10):
+            entries = [
+                {'Id': str(i), 'ReceiptHandle': entry[0], 'VisibilityTimeout': self.visibility_timeout}
+                for i, (_, entry) in enumerate(slow[start:start + 10])
+            ]
+            try:
+                sqs_client.change_message_visibility_batch(QueueUrl=queue_url, Entries=entries)
+            except ClientError as e:
+                logging.error(e)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='SQS worker')
+    parser.add_argument('queue_name', nargs='?', default='yugo-support-queue')
+    parser.add_argument('--workers', type=int, default=10)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    ConsumerWorker(args.queue_name, workers=args.workers).run()
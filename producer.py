@@ -3,10 +3,18 @@
     @author a. e. chis
 '''
 
+import atexit
+import json
 import logging
-import boto3
+import os
+import queue
+import threading
+import time
+
 from botocore.exceptions import ClientError
 
+from aws_clients import get_client, get_queue_url
+
 ''' a simple class to demonstrate how to deliver a message to a given queue'''
 
 class Producer:
@@ -16,11 +24,8 @@ class Producer:
         
         try:
             
-            session = boto3.session.Session()
-            sqs_client = session.client('sqs')
-            
-            response = sqs_client.get_queue_url(QueueName=queue_name)
-            queue_url = response['QueueUrl']
+            sqs_client = get_client('sqs')
+            queue_url = get_queue_url(queue_name)
             
             print('\n==>message to send to the queue {} ...\n'.format(message))
             response = sqs_client.send_message(QueueUrl=queue_url, MessageBody=message)
@@ -29,3 +34,212 @@ class Producer:
             logging.error(e)
             return False
         return True
+
+
+''' a buffered producer: the caller only puts the message on an in-memory queue,
+    a background thread sends them with SendMessageBatch. If the buffer is full
+    or SQS keeps failing, messages are spilled to JSON-lines files in spool_dir
+    and re-sent later, so a burst or a short SQS outage neither blocks the
+    caller nor loses messages.
+'''
+
+MAX_BATCH_ENTRIES = 10
+MAX_BATCH_BYTES = 256 * 1024
+
+
+class BufferedProducer:
+
+    def __init__(self, queue_name, spool_dir=None, max_buffer=10000,
+                 flush_interval=0.2, max_attempts=5, region=None):
+        self.queue_name = queue_name
+        self.spool_dir = spool_dir
+        self.max_buffer = max_buffer
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.region = region
+
+        self._queue = queue.Queue(maxsize=max_buffer)
+        self._spool_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stopping = threading.Event()
+        self._last_replay = 0.0
+        if spool_dir:
+            os.makedirs(spool_dir, exist_ok=True)
+
+    def send_message(self, message):
+        ''' buffer a message; returns straight away '''
+        if len(message.encode('utf-8')) > MAX_BATCH_BYTES:
+            logging.error('message for %s is over the SQS size limit', self.queue_name)
+            return False
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            self._spill([message])
+        return True
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        if self._pid != os.getpid():
+            # a forked child must not inherit the parent's buffer or lock state
+            self._queue = queue.Queue(maxsize=self.max_buffer)
+            self._spool_lock = threading.Lock()
+        self._pid = os.getpid()
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='sqs-producer', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            batch = self._next_batch(self.flush_interval)
+            if batch:
+                self._send(batch)
+            elif self.spool_dir and time.monotonic() - self._last_replay > 5:
+                self._replay_spool()
+
+    def _next_batch(self, wait):
+        ''' up to 10 messages and 256 KB, waiting at most `wait` seconds for the first one '''
+        try:
+            first = self._queue.get(timeout=wait)
+        except queue.Empty:
+            return []
+        batch, size = [first], len(first.encode('utf-8'))
+        while len(batch) < MAX_BATCH_ENTRIES:
+            try:
+                message = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            message_size = len(message.encode('utf-8'))
+            if size + message_size > MAX_BATCH_BYTES:
+                # does not fit: send it on its own next time round
+                self._send(batch)
+                batch, size = [], 0
+            batch.append(message)
+            size += message_size
+        return batch
+
+    def _send(self, messages):
+        ''' send one batch, retrying entries that failed for transient reasons '''
+        sqs_client = get_client('sqs', self.region)
+        pending = dict(enumerate(messages))
+        for attempt in range(self.max_attempts):
+            try:
+                queue_url = get_queue_url(self.queue_name, self.region)
+                response = sqs_client.send_message_batch(
+                    QueueUrl=queue_url,
+                    Entries=[{'Id': str(i), 'MessageBody': body} for i, body in pending.items()],
+                )
+            except ClientError as e:
+                logging.error(e)
+            else:
+                for entry in response.get('Successful', []):
+                    pending.pop(int(entry['Id']), None)
+                for failure in response.get('Failed', []):
+                    if failure.get('SenderFault'):
+                        # the message itself is invalid, retrying will not help
+                        logging.error('message rejected by SQS: %s', failure)
+                        pending.pop(int(failure['Id']), None)
+                if not pending:
+                    return True
+            if self._stopping.is_set() and attempt:
+                break
+            time.sleep(min(0.1 * (2 ** attempt), 5.0))
+
+        self._spill(list(pending.values()))
+        return False
+
+    def _spool_path(self):
+        return os.path.join(self.spool_dir, 'spool-{}.jsonl'.format(os.getpid()))
+
+    def _spill(self, messages):
+        if not messages:
+            return
+        if not self.spool_dir:
+            logging.error('dropping %s messages for %s: no spool_dir', len(messages), self.queue_name)
+            return
+        with self._spool_lock:
+            with open(self._spool_path(), 'a', encoding='utf-8') as spool:
+                for message in messages:
+                    spool.write(json.dumps(message) + '\n')
+
+    def _replay_spool(self):
+        ''' re-send spilled messages; each file is claimed by rename so only one process sends it '''
+        self._last_replay = time.monotonic()
+        with self._spool_lock:
+            own = self._spool_path()
+            if os.path.exists(own):
+                os.rename(own, own[:-len('.jsonl')] + '-{}.ready'.format(time.time_ns()))
+
+        for name in sorted(os.listdir(self.spool_dir)):
+            path = os.path.join(self.spool_dir, name)
+            # files left behind by processes that died are fair game
+            if name.endswith('.jsonl') and not _pid_alive(name[:-len('.jsonl')].split('-')[-1]):
+                _try_rename(path, path[:-len('.jsonl')] + '-{}.ready'.format(time.time_ns()))
+            elif '.sending-' in name and not _pid_alive(name.rsplit('-', 1)[-1]):
+                _try_rename(path, path[:path.index('.sending-')])
+
+        for name in sorted(os.listdir(self.spool_dir)):
+            if not name.endswith('.ready'):
+                continue
+            path = os.path.join(self.spool_dir, name)
+            claimed = path + '.sending-{}'.format(os.getpid())
+            if not _try_rename(path, claimed):
+                continue
+            with open(claimed, encoding='utf-8') as spool:
+                messages = [json.loads(line) for line in spool if line.strip()]
+            healthy = True
+            for start in range(0, len(messages), MAX_BATCH_ENTRIES):
+                if not self._send(messages[start:start + MAX_BATCH_ENTRIES]):
+                    # SQS is still unhappy; the failed batch was spilled again
+                    self._spill(messages[start + MAX_BATCH_ENTRIES:])
+                    healthy = False
+                    break
+            os.remove(claimed)
+            if not healthy or self._stopping.is_set():
+                return
+
+    def close(self, timeout=10):
+        ''' stop the sender and flush (or spill) everything still buffered '''
+        self._stopping.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout)
+        while True:
+            batch = self._next_batch(0)
+            if not batch:
+                return
+            self._send(batch)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(int(pid), 0)
+    except (ValueError, ProcessLookupError):
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _try_rename(source, target):
+    try:
+        os.rename(source, target)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+_buffered = {}
+_buffered_lock = threading.Lock()
+
+
+def get_buffered_producer(queue_name, **kwargs):
+    ''' one BufferedProducer per queue per process, flushed at exit '''
+    with _buffered_lock:
+        producer = _buffered.get(queue_name)
+        if producer is None:
+            producer = BufferedProducer(queue_name, **kwargs)
+            _buffered[queue_name] = producer
+            atexit.register(producer.close)
+    return producer
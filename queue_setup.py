@@ -3,9 +3,10 @@
     @author a. e. chis
 '''
 import logging
-import boto3
 from botocore.exceptions import ClientError
 
+from aws_clients import forget_queue_url, get_client, get_queue_url
+
 ''' a simple class to demonstrate how to create and delete a queue'''
 
 class MyMessageQueue:
@@ -14,7 +15,7 @@ class MyMessageQueue:
     def create_queue(self, queue_name):
         
         try:
-            sqs_client = boto3.client('sqs')
+            sqs_client = get_client('sqs')
             print('\ncreating the queue {}...'.format(queue_name))
             response = sqs_client.create_queue(QueueName=queue_name)
             print(response) 
@@ -28,12 +29,12 @@ class MyMessageQueue:
     def delete_queue(self, queue_name):
         
         try:
-            sqs_client = boto3.client('sqs')
+            sqs_client = get_client('sqs')
             
-            response = sqs_client.get_queue_url(QueueName=queue_name)
-            print(response) 
-            queue_url = response['QueueUrl']
+            queue_url = get_queue_url(queue_name)
+            print(queue_url) 
             response = sqs_client.delete_queue(QueueUrl=queue_url)
+            forget_queue_url(queue_name)
         
             
         except ClientError as e:
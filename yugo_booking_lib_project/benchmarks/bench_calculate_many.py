@@ -0,0 +1,85 @@
+"""
+Compare scalar BookingPrice calls against calculate_many.
+
+    python benchmarks/bench_calculate_many.py
+    python benchmarks/bench_calculate_many.py --sizes 1000 100000
+"""
+import argparse
+import random
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from yugo_booking_lib.booking_price import BookingPrice, np  # noqa: E402
+
+
+def make_rows(count, seed=0):
+    rng = random.Random(seed)
+    start = date(2026, 1, 1)
+    check_ins, check_outs, rates, taxes, fees = [], [], [], [], []
+    for _ in range(count):
+        check_in = start + timedelta(days=rng.randint(0, 365))
+        check_out = check_in + timedelta(days=rng.randint(1, 300))
+        check_ins.append(check_in.isoformat())
+        check_outs.append(check_out.isoformat())
+        rates.append(round(rng.uniform(40, 250), 2))
+        taxes.append(rng.choice([0.0, 0.08, 0.13]))
+        fees.append(rng.choice([0.0, 50.0]))
+    return check_ins, check_outs, rates, taxes, fees
+
+
+def run_scalar(bp, rows):
+    check_ins, check_outs, rates, taxes, fees = rows
+    nights = [bp.calculate_nights(a, b) for a, b in zip(check_ins, check_outs)]
+    totals = [
+        bp.calculate_total_price(n, r, t, f)
+        for n, r, t, f in zip(nights, rates, taxes, fees)
+    ]
+    return nights, totals
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - started, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1_000, 100_000, 1_000_000]
+    )
+    args = parser.parse_args()
+
+    bp = BookingPrice()
+    print(f"numpy: {np.__version__ if np is not None else 'not installed'}")
+    print(f"{'rows':>10}  {'scalar':>9}  {'batch-py':>9}  {'batch-np':>9}  {'speedup':>8}")
+
+    for size in args.sizes:
+        rows = make_rows(size)
+        scalar_time, expected = timed(lambda: run_scalar(bp, rows))
+        python_time, python_result = timed(
+            lambda: bp.calculate_many(*rows, use_numpy=False)
+        )
+        assert python_result == expected
+
+        numpy_cell, speedup = "-", "-"
+        if np is not None:
+            numpy_time, numpy_result = timed(
+                lambda: bp.calculate_many(*rows, use_numpy=True)
+            )
+            assert numpy_result == expected
+            numpy_cell = f"{numpy_time:8.3f}s"
+            speedup = f"{scalar_time / numpy_time:7.1f}x"
+
+        print(
+            f"{size:>10}  {scalar_time:8.3f}s  {python_time:8.3f}s  "
+            f"{numpy_cell:>9}  {speedup:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
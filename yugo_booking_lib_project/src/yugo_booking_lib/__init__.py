@@ -2,5 +2,6 @@
 
 """
 Yugo booking helper library.
-Provides BookingPrice class for nights + price calculations.
+Provides BookingPrice class for nights + price calculations and
+RateCalendar for per-night (seasonal) rates.
 """
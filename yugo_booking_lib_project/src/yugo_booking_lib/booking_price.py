@@ -1,4 +1,10 @@
-from datetime import datetime
+import numbers
+from datetime import date, datetime
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, see calculate_many
+    np = None
 
 
 class BookingPrice:
@@ -32,6 +38,137 @@ class BookingPrice:
         total = base + tax + fixed_fee
         return round(total, 2)
 
+    def calculate_stay_price(
+        self,
+        calendar,
+        check_in,
+        check_out,
+        tax_rate: float = 0.0,
+        fixed_fee: float = 0.0,
+    ) -> float:
+        """
+        Price a stay from a RateCalendar, so every night can have its own
+        rate. The nightly sum is a prefix-sum lookup, so long stays cost
+        the same as short ones. Tax and fee are applied as in
+        calculate_total_price.
+        """
+        base = calendar.stay_cents(check_in, check_out) / 100
+        tax = base * tax_rate
+        total = base + tax + fixed_fee
+        return round(total, 2)
+
+    def calculate_many(
+        self,
+        check_ins,
+        check_outs,
+        nightly_rates,
+        tax_rates=0.0,
+        fixed_fees=0.0,
+        fmt: str = "%Y-%m-%d",
+        use_numpy=None,
+    ):
+        """
+        Batch version of calculate_nights + calculate_total_price.
+
+        check_ins / check_outs are sequences of date strings (or date
+        objects). nightly_rates, tax_rates and fixed_fees are sequences of
+        the same length, or a single number applied to every row.
+
+        Returns (nights, totals) as two lists. Every value is exactly what
+        the scalar methods return for that row. NumPy is used when it is
+        installed (or use_numpy=True), otherwise a plain Python loop.
+        """
+        count = len(check_ins)
+        if len(check_outs) != count:
+            raise ValueError("check_ins and check_outs must be the same length")
+
+        nightly_rates = _broadcast(nightly_rates, count, "nightly_rates")
+        tax_rates = _broadcast(tax_rates, count, "tax_rates")
+        fixed_fees = _broadcast(fixed_fees, count, "fixed_fees")
+
+        if use_numpy is None:
+            use_numpy = np is not None
+        if use_numpy:
+            if np is None:
+                raise ImportError("calculate_many(use_numpy=True) needs numpy")
+            return self._calculate_many_numpy(
+                check_ins, check_outs, nightly_rates, tax_rates, fixed_fees, fmt
+            )
+
+        nights = [
+            self._nights(check_in, check_out, fmt)
+            for check_in, check_out in zip(check_ins, check_outs)
+        ]
+        totals = [
+            self.calculate_total_price(n, float(rate), float(tax), float(fee))
+            for n, rate, tax, fee in zip(nights, nightly_rates, tax_rates, fixed_fees)
+        ]
+        return nights, totals
+
+    def _nights(self, check_in, check_out, fmt):
+        if isinstance(check_in, date) and isinstance(check_out, date):
+            return max((_as_date(check_out) - _as_date(check_in)).days, 0)
+        return self.calculate_nights(str(check_in), str(check_out), fmt)
+
+    def _calculate_many_numpy(
+        self, check_ins, check_outs, nightly_rates, tax_rates, fixed_fees, fmt
+    ):
+        start = _to_days(check_ins, fmt)
+        end = _to_days(check_outs, fmt)
+        nights = np.maximum((end - start).astype(np.int64), 0)
+
+        # Same float64 operations, in the same order, as calculate_total_price.
+        base = nights * np.asarray(nightly_rates, dtype=np.float64)
+        tax = base * np.asarray(tax_rates, dtype=np.float64)
+        totals = base + tax + np.asarray(fixed_fees, dtype=np.float64)
+
+        # np.round scales by 100 and rounds half to even, which can disagree
+        # with round() on values sitting right on a half cent. Those rows are
+        # rare, so they are re-rounded with the builtin.
+        rounded = np.round(totals, 2)
+        scaled = totals * 100.0
+        distance = np.abs(scaled - np.floor(scaled) - 0.5)
+        tolerance = np.maximum(1e-7, np.abs(scaled) * 1e-14)
+        for i in np.flatnonzero(distance < tolerance):
+            rounded[i] = round(float(totals[i]), 2)
+
+        return nights.tolist(), rounded.tolist()
+
+
+def _broadcast(values, count, name):
+    if isinstance(values, numbers.Number):
+        return [values] * count
+    if len(values) != count:
+        raise ValueError(f"{name} must have one value per booking")
+    return values
+
+
+def _as_date(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
+def _to_days(values, fmt):
+    """Convert dates to a datetime64[D] array, matching strptime's rules."""
+    if isinstance(values, np.ndarray) and values.dtype.kind == "M":
+        return values.astype("datetime64[D]")
+
+    if fmt == "%Y-%m-%d":
+        strings = np.asarray(values, dtype=str)
+        # The fast path only takes strict YYYY-MM-DD; anything looser that
+        # strptime would still accept (e.g. "2026-1-8") goes the slow way.
+        if strings.size == 0 or (np.char.str_len(strings) == 10).all():
+            try:
+                return strings.astype("datetime64[D]")
+            except ValueError:
+                pass
+
+    parsed = [
+        _as_date(value) if isinstance(value, date)
+        else datetime.strptime(str(value), fmt).date()
+        for value in values
+    ]
+    return np.asarray(parsed, dtype="datetime64[D]")
+
 
 if __name__ == "__main__":
     
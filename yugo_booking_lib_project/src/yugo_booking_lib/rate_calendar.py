@@ -0,0 +1,104 @@
+"""
+Daily nightly-rate calendar with prefix sums.
+
+Rates are kept in whole cents in two compact int64 arrays: the rate for
+each night from ``start``, and a running total. Pricing any stay is then
+two lookups and a subtraction, however many nights it covers. Nights
+outside the calendar are charged at ``default_cents``.
+"""
+from array import array
+from datetime import timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+
+def to_cents(amount) -> int:
+    """Round a price (float, Decimal or str) to whole cents."""
+    return int(Decimal(str(amount)).quantize(Decimal("0.01"), ROUND_HALF_UP) * 100)
+
+
+class RateCalendar:
+    def __init__(self, start, default_cents: int, rates=()):
+        self.start = start
+        self.default_cents = int(default_cents)
+        self.rates = array("q", rates)
+        self.prefix = array("q", [0])
+        self._update_prefix(0)
+
+    @property
+    def end(self):
+        """First night after the calendar."""
+        return self.start + timedelta(days=len(self.rates))
+
+    def _update_prefix(self, first_index: int):
+        """Recompute running totals from first_index onwards."""
+        del self.prefix[first_index + 1:]
+        total = self.prefix[first_index]
+        for cents in self.rates[first_index:]:
+            total += cents
+            self.prefix.append(total)
+
+    def _cover(self, first_night, end_night):
+        """Grow the calendar with default nights so it spans the range."""
+        if not self.rates:
+            self.start = first_night
+        if first_night < self.start:
+            missing = (self.start - first_night).days
+            self.rates[0:0] = array("q", [self.default_cents] * missing)
+            self.start = first_night
+            self.prefix = array("q", [0])
+            self._update_prefix(0)
+        if end_night > self.end:
+            missing = (end_night - self.end).days
+            self.rates.extend([self.default_cents] * missing)
+
+    def set_rates(self, first_night, cents):
+        """
+        Overwrite the nightly rates starting at first_night.
+        Only the running totals from that night onwards are recomputed.
+        """
+        cents = list(cents)
+        if not cents:
+            return
+        end_night = first_night + timedelta(days=len(cents))
+        self._cover(first_night, end_night)
+        offset = (first_night - self.start).days
+        self.rates[offset:offset + len(cents)] = array("q", cents)
+        self._update_prefix(min(offset, len(self.prefix) - 1))
+
+    def rate_for(self, night) -> int:
+        offset = (night - self.start).days
+        if 0 <= offset < len(self.rates):
+            return self.rates[offset]
+        return self.default_cents
+
+    def stay_cents(self, check_in, check_out) -> int:
+        """Total nightly charges in cents for [check_in, check_out). O(1)."""
+        nights = (check_out - check_in).days
+        if nights <= 0:
+            return 0
+        size = len(self.rates)
+        first = min(max((check_in - self.start).days, 0), size)
+        last = min(max((check_out - self.start).days, 0), size)
+        inside = last - first
+        return (
+            self.prefix[last] - self.prefix[first]
+            + (nights - inside) * self.default_cents
+        )
+
+    def to_bytes(self):
+        return self.rates.tobytes(), self.prefix.tobytes()
+
+    @classmethod
+    def from_bytes(cls, start, default_cents, rates, prefix=None):
+        calendar = cls.__new__(cls)
+        calendar.start = start
+        calendar.default_cents = int(default_cents)
+        calendar.rates = array("q")
+        calendar.rates.frombytes(bytes(rates))
+        calendar.prefix = array("q")
+        if prefix:
+            calendar.prefix.frombytes(bytes(prefix))
+        if len(calendar.prefix) != len(calendar.rates) + 1:
+            calendar.prefix = array("q", [0])
+            calendar._update_prefix(0)
+        return calendar
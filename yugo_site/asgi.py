@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yugo_site.settings')
+# route the AWS-bound views to their async versions (see settings.ASYNC_VIEWS)
+os.environ.setdefault('YUGO_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
@@ -0,0 +1,139 @@
+"""
+Read/write splitting between the primary database and read replicas.
+
+``PrimaryReplicaRouter`` sends writes to ``default`` and, inside a request
+that ``PrimaryPinMiddleware`` marked as read-only, spreads reads over the
+aliases in ``settings.DATABASE_REPLICAS``. Everything else reads from the
+primary as well:
+
+* requests with unsafe methods (POST, PUT, ...), which often read what
+  they are about to change,
+* the rest of a request once it wrote anything, and reads inside an
+  ``atomic`` block,
+* requests of a browser that wrote in the last
+  ``DATABASE_PIN_SECONDS`` (a short-lived cookie), so the booking page a
+  guest is redirected to never comes from a replica that lags behind,
+* code outside requests: management commands, the outbox dispatcher and
+  background threads,
+* the DatabaseCache table: every process must see the catalogue version
+  the last write bumped, and cache writes do not pin the request.
+
+Replicas are never migrated; they receive schema and data from the
+primary through replication. Without replicas configured the router
+always answers ``default`` and the middleware removes itself.
+"""
+import contextvars
+import random
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = "yugo_primary"
+# app label of django.core.cache.backends.db's CacheEntry
+CACHE_APP_LABEL = "django_cache"
+SAFE_METHODS = frozenset(("GET", "HEAD", "OPTIONS"))
+
+
+class RoutingState:
+    __slots__ = ("use_replicas", "wrote")
+
+    def __init__(self, use_replicas):
+        self.use_replicas = use_replicas
+        self.wrote = False
+
+
+# mutable, so a write made inside sync_to_async is seen by the caller too
+_state = contextvars.ContextVar("yugo_db_routing", default=None)
+
+
+def replicas():
+    return getattr(settings, "DATABASE_REPLICAS", [])
+
+
+def pin_to_primary():
+    """Send the remaining reads of the current request to the primary."""
+    state = _state.get()
+    if state is not None:
+        state.wrote = True
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == CACHE_APP_LABEL:
+            return DEFAULT_DB_ALIAS
+        state = _state.get()
+        if state is None or not state.use_replicas or state.wrote:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        aliases = replicas()
+        return random.choice(aliases) if aliases else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label != CACHE_APP_LABEL:
+            pin_to_primary()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # every alias holds the same data
+        databases = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class PrimaryPinMiddleware:
+    """Decides per request whether reads may go to a replica; see module docstring."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not replicas():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.pin_seconds = getattr(settings, "DATABASE_PIN_SECONDS", 5)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        state = self.start(request)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.finish(state, response)
+
+    async def __acall__(self, request):
+        state = self.start(request)
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.finish(state, response)
+
+    def start(self, request):
+        return RoutingState(
+            request.method in SAFE_METHODS and PIN_COOKIE not in request.COOKIES
+        )
+
+    def finish(self, state, response):
+        if state.wrote:
+            response.set_cookie(
+                PIN_COOKIE,
+                "1",
+                max_age=self.pin_seconds,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
@@ -0,0 +1,222 @@
+"""
+Per-request profiling: SQL, template and view time.
+
+``ProfilingMiddleware`` times a sample of requests and reports
+
+* SQL query count and time, through ``connection.execute_wrapper`` on
+  every configured database,
+* template render time (outermost ``Template.render`` calls only, so
+  ``{% include %}`` is not counted twice),
+* AWS API calls and their time (fed by aws_metrics),
+* total view time,
+
+as a ``Server-Timing`` response header (visible in the browser's network
+panel) and as one JSON log line on the ``yugo.profiling`` logger. Requests
+that run more queries than ``PROFILING_QUERY_BUDGET`` are logged at
+WARNING, together with the most repeated statement, which is usually an
+N+1 loop.
+
+Settings: PROFILING_ENABLED, PROFILING_SAMPLE_RATE (0..1),
+PROFILING_QUERY_BUDGET, PROFILING_SERVER_TIMING. When profiling is off the
+middleware removes itself at startup and costs nothing. Like
+PrimaryPinMiddleware it runs natively under WSGI and ASGI, so it never
+forces an async stack through sync_to_async.
+"""
+import contextvars
+import json
+import logging
+import random
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.base import Template
+
+import aws_metrics
+
+logger = logging.getLogger("yugo.profiling")
+
+_current = contextvars.ContextVar("yugo_request_profile", default=None)
+
+
+class RequestProfile:
+    __slots__ = (
+        "started", "queries", "db_seconds", "template_seconds",
+        "template_depth", "statements", "aws_calls", "aws_seconds",
+    )
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+        self.template_depth = 0
+        self.statements = Counter()
+        self.aws_calls = 0
+        self.aws_seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_seconds += time.perf_counter() - started
+            self.queries += 1
+            self.statements[sql] += 1
+
+    def most_repeated(self):
+        if not self.statements:
+            return None, 0
+        return self.statements.most_common(1)[0]
+
+
+def current_profile():
+    """The profile of the request being handled, or None when not sampled."""
+    return _current.get()
+
+
+def _record_aws_call(service, operation, seconds):
+    # aws_metrics listener; calls from background threads have no profile
+    profile = _current.get()
+    if profile is not None:
+        profile.aws_calls += 1
+        profile.aws_seconds += seconds
+
+
+_template_patched = False
+
+
+def _patch_template_render():
+    global _template_patched
+    if _template_patched:
+        return
+    original_render = Template.render
+
+    def render(self, context):
+        profile = _current.get()
+        if profile is None:
+            return original_render(self, context)
+        profile.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return original_render(self, context)
+        finally:
+            profile.template_depth -= 1
+            if profile.template_depth == 0:
+                profile.template_seconds += time.perf_counter() - started
+
+    Template.render = render
+    _template_patched = True
+
+
+def _wrap_connections(profile):
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(profile))
+    return stack
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 2)
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, "PROFILING_ENABLED", False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, "PROFILING_SAMPLE_RATE", 1.0)
+        self.query_budget = getattr(settings, "PROFILING_QUERY_BUDGET", 30)
+        self.server_timing = getattr(settings, "PROFILING_SERVER_TIMING", True)
+        _patch_template_render()
+        aws_metrics.add_listener(_record_aws_call)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+
+        profile = RequestProfile()
+        token = _current.set(profile)
+        try:
+            with _wrap_connections(profile):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+
+        self.report(request, response, profile, time.perf_counter() - profile.started)
+        return response
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+
+        # Database connections belong to a thread, and the ORM calls of an
+        # async request run in its sync_to_async thread: the wrappers have
+        # to be put on that thread's connections, not the event loop's.
+        # The profile itself reaches them with the copied context.
+        profile = RequestProfile()
+        token = _current.set(profile)
+        try:
+            wrappers = await sync_to_async(_wrap_connections)(profile)
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(wrappers.close)()
+        finally:
+            _current.reset(token)
+
+        self.report(request, response, profile, time.perf_counter() - profile.started)
+        return response
+
+    def sampled(self):
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def report(self, request, response, profile, total):
+        over_budget = profile.queries > self.query_budget
+        statement, repeats = profile.most_repeated()
+
+        if self.server_timing:
+            timings = [
+                f'db;dur={_ms(profile.db_seconds)};desc="{profile.queries} queries"',
+                f"tpl;dur={_ms(profile.template_seconds)}",
+                f'aws;dur={_ms(profile.aws_seconds)};desc="{profile.aws_calls} calls"',
+                f"view;dur={_ms(total)}",
+            ]
+            if over_budget:
+                timings.append(f'budget;desc="over query budget ({profile.queries} > {self.query_budget})"')
+            existing = response.get("Server-Timing")
+            response["Server-Timing"] = ", ".join(([existing] if existing else []) + timings)
+
+        record = {
+            "method": request.method,
+            "path": request.path,
+            "view": getattr(request.resolver_match, "view_name", None),
+            "status": response.status_code,
+            "total_ms": _ms(total),
+            "db_ms": _ms(profile.db_seconds),
+            "queries": profile.queries,
+            "template_ms": _ms(profile.template_seconds),
+            "aws_calls": profile.aws_calls,
+            "aws_ms": _ms(profile.aws_seconds),
+            "over_query_budget": over_budget,
+        }
+        if over_budget:
+            record["most_repeated_sql"] = statement[:300]
+            record["most_repeated_count"] = repeats
+        logger.log(
+            logging.WARNING if over_budget else logging.INFO,
+            json.dumps(record),
+        )
@@ -1,9 +1,15 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path
 from django.contrib.auth import views as auth_views
 
 from accommodation import views as acc_views
 
+if settings.ASYNC_VIEWS:
+    from accommodation import async_views as aws_views
+else:
+    aws_views = acc_views
+
 urlpatterns = [
     path("admin/", admin.site.urls),
 
@@ -22,7 +28,7 @@ urlpatterns = [
     
     path("", acc_views.home, name="home"),
     path("signup/", acc_views.signup, name="signup"),
-    path("rooms/<int:room_id>/book/", acc_views.book_room, name="book_room"),
+    path("rooms/<int:room_id>/book/", aws_views.book_room, name="book_room"),
     path(
         "booking/<int:booking_id>/success/",
         acc_views.booking_success,
@@ -48,20 +54,24 @@ urlpatterns = [
     ),
 
     
-    path("support/", acc_views.support_ticket, name="support_ticket"),
+    path("support/", aws_views.support_ticket, name="support_ticket"),
 
     
     path("manager/rooms/", acc_views.manager_room_list, name="manager_room_list"),
     path(
         "manager/rooms/<int:room_id>/image/",
-        acc_views.manage_room_image,
+        aws_views.manage_room_image,
         name="manage_room_image",
     ),
 
     
     path(
         "manager/support/next/",
-        acc_views.manager_next_ticket,
+        aws_views.manager_next_ticket,
         name="manager_next_ticket",
     ),
+    path("manager/support/tickets/", acc_views.manager_tickets, name="manager_tickets"),
+    path("manager/outbox/stats/", acc_views.outbox_stats, name="outbox_stats"),
+    path("manager/reports/occupancy/", acc_views.manager_occupancy, name="manager_occupancy"),
+    path("metrics/", acc_views.metrics, name="metrics"),
 ]